@@ -0,0 +1,6 @@
+# benchmarks/__main__.py
+# `python -m benchmarks`: the offline benchmark suite (see benchmarks/suite.py). The cases live in a
+# regular module because spawned worker processes cannot import functions from a package __main__.
+from benchmarks.suite import main
+
+main()
@@ -0,0 +1,58 @@
+# benchmarks/bench_build_latents.py
+# build_latents wall time: sparse single pass vs the per-latent filter/groupby/merge loop.
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.timing import timed
+from src.model.fit_latents import _build_latents_loop, build_latents
+
+
+def synthetic(n_rows, n_regions=250, n_years=60, n_indicators=200, n_latents=12, seed=0):
+    rng = np.random.default_rng(seed)
+    regions = np.array([f"R{i:03d}" for i in range(n_regions)])
+    ids = np.array([f"I{i}" for i in range(n_indicators)])
+    df = pd.DataFrame({
+        "region": regions[rng.integers(0, n_regions, n_rows)],
+        "year": rng.integers(1960, 1960 + n_years, n_rows),
+        "id": ids[rng.integers(0, n_indicators, n_rows)],
+        "norm": rng.random(n_rows),
+    })
+    cfg = {"latents": {
+        f"L{j}": {"indicators": [{"id": str(i), "weight": float(rng.random() + 0.1)} for i in ids[j::n_latents]]}
+        for j in range(n_latents)
+    }}
+    return df, cfg
+
+
+def run(rows_grid, n_indicators=200, n_latents=12, loop_max_rows=2_000_000):
+    out = []
+    for n in rows_grid:
+        df, cfg = synthetic(n, n_indicators=n_indicators, n_latents=n_latents)
+        row = {"rows": n, "indicators": n_indicators, "latents": n_latents}
+        fast, row["sparse_s"] = timed(lambda: build_latents(df, cfg))
+        if n <= loop_max_rows:
+            ref, row["loop_s"] = timed(lambda: _build_latents_loop(df, cfg))
+            row["speedup"] = row["loop_s"] / row["sparse_s"]
+            row["identical"] = bool(fast.equals(ref))
+        out.append(row)
+        print(" ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    ap.add_argument("--indicators", type=int, default=200)
+    ap.add_argument("--latents", type=int, default=12)
+    ap.add_argument("--loop-max-rows", type=int, default=2_000_000, help="skip the reference loop above this size")
+    ap.add_argument("--out", default=None, help="optional JSON output path")
+    args = ap.parse_args()
+    rows = run(args.rows, args.indicators, args.latents, args.loop_max_rows)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
@@ -0,0 +1,62 @@
+# benchmarks/bench_corr_tests.py
+# Batched permutation tests (src/validation/corr_tests) vs the notebook's loop of one np.corrcoef per
+# region and permutation, with the largest difference of the empirical correlations.
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic import rho_sigma_frame
+from benchmarks.timing import timed
+from src.validation.corr_tests import corr_tests
+
+
+
+def _notebook(lat, B, seed=0):
+    """validation/corr_tests.ipynb as it was (rows in year order, gaps ignored)."""
+    corr, null, rng = {}, [], np.random.default_rng(seed)
+    for r in lat["region"].unique():
+        sub = lat[lat["region"] == r].sort_values("year")
+        if len(sub) < 10:
+            continue
+        ds, rr = np.diff(sub["sigma"].to_numpy()), sub["rho"].to_numpy()[1:]
+        corr[r] = np.corrcoef(rr, -ds)[0, 1]
+        for _ in range(B):
+            null.append(np.corrcoef(rr[rng.permutation(len(rr))], -ds)[0, 1])
+    return corr, np.asarray(null)
+
+
+def run(R_grid, T, B, loop_max_regions=200):
+    rows = []
+    for R in R_grid:
+        row = {"regions": R, "years": T, "B": B}
+        df = rho_sigma_frame(R, T)
+        (_, null, _), row["batched_s"] = timed(lambda: corr_tests(df, [0], B))
+        row["abs95"] = float(np.nanpercentile(np.abs(null), 95))
+        _, row["batched_3lags_s"] = timed(lambda: corr_tests(df, [0, 1, 2], B))
+        if R <= loop_max_regions:
+            full = rho_sigma_frame(R, T, missing=0.0)
+            (ref, ref_null), row["loop_s"] = timed(lambda: _notebook(full, B))
+            row["speedup"] = row["loop_s"] / row["batched_s"]
+            got = corr_tests(full, [0], B)[0].set_index("region")["corr"]
+            row["max_abs_diff"] = float(np.max(np.abs(got[list(ref)].to_numpy() - np.asarray(list(ref.values())))))
+            row["loop_abs95"] = float(np.percentile(np.abs(ref_null), 95))
+        rows.append(row)
+        print(" ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--regions", type=int, nargs="+", default=[50, 200, 1_000])
+    ap.add_argument("--years", type=int, default=60)
+    ap.add_argument("--B", type=int, default=1_000)
+    ap.add_argument("--loop-max-regions", type=int, default=200, help="skip the notebook loop above this")
+    ap.add_argument("--out", default=None, help="optional JSON output path")
+    args = ap.parse_args()
+    rows = run(args.regions, args.years, args.B, args.loop_max_regions)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
@@ -0,0 +1,79 @@
+# benchmarks/bench_ensemble.py
+# Ensemble summaries of the simulation kernel: recorded (U, T) trajectories reduced with NumPy vs
+# simulate(record=False, stats=EnsembleStats) updated block by block, with peak traced memory, the
+# largest mean/std difference, the quantile rank error, and the same ensemble split over "workers"
+# and merged.
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.timing import measured, timed
+from src.model.ensemble import EnsembleStats
+from src.model.sim_engine import simulate
+
+QUANTILES = (0.05, 0.5, 0.95)
+
+
+def _population(U, seed=0):
+    rng = np.random.default_rng(seed)
+    kappa, sigma = rng.uniform(0.5, 1.0, U), rng.uniform(0.01, 0.3, U)
+    drift = np.where(np.arange(U) % 2, 0.0005, -0.001)
+    lo, hi = np.where(drift > 0, -np.inf, 0.1), np.where(drift > 0, 0.95, np.inf)
+    return kappa, sigma, drift, lo, hi
+
+
+
+def _recorded(U, T, seed):
+    kappa, sigma, drift, lo, hi = _population(U)
+    M = simulate(kappa, sigma, 0.7, 0.6, T, drift, lo, hi, rng=np.random.default_rng(seed))["M"]
+    return M.mean(axis=0), M.std(axis=0, ddof=1), np.quantile(M, QUANTILES, axis=0), M
+
+
+def _online(U, T, seed, parts=1):
+    kappa, sigma, drift, lo, hi = _population(U)
+    stats = []
+    for idx in np.array_split(np.arange(U), parts):
+        st = EnsembleStats(T)
+        simulate(kappa[idx], sigma[idx], 0.7, 0.6, T, drift[idx], lo[idx], hi[idx],
+                 rng=np.random.default_rng([seed, int(idx[0])]) if parts > 1 else np.random.default_rng(seed),
+                 record=False, stats=st)
+        stats.append(st)
+    return EnsembleStats.combine(stats) if parts > 1 else stats[0]
+
+
+def run(U_grid, T, seed=0, workers=4, ref_max_cells=5e7):
+    rows = []
+    for U in U_grid:
+        row = {"U": U, "T": T}
+        st, row["online_s"], row["online_peak_mb"] = measured(lambda: _online(U, T, seed))
+        if U * T <= ref_max_cells:
+            (mean, std, q, M), row["recorded_s"], row["recorded_peak_mb"] = measured(lambda: _recorded(U, T, seed))
+            row["memory_ratio"] = row["recorded_peak_mb"] / row["online_peak_mb"]
+            row["max_abs_diff_mean"] = float(np.abs(st.mean[0] - mean).max())
+            row["max_abs_diff_std"] = float(np.abs(np.sqrt(st.var()[0]) - std).max())
+            # rank error of the sketch: fraction of universes below the estimate vs q (t >= 1; t = 0 is constant)
+            row["max_rank_err"] = float(max(np.abs((M[:, 1:] <= st.quantile(p)[0, 1:]).mean(axis=0) - p).max()
+                                            for p in QUANTILES))
+            del M
+        merged, row["merged_s"] = timed(lambda: _online(U, T, seed, parts=workers))
+        row["merged_n_ok"] = bool((merged.n == U).all())
+        rows.append(row)
+        print(" ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--U", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--T", type=int, default=1_000)
+    ap.add_argument("--workers", type=int, default=4, help="parts the ensemble is split into and merged from")
+    ap.add_argument("--ref-max-cells", type=float, default=5e7, help="skip the recorded reference above this U*T")
+    ap.add_argument("--out", default=None, help="optional JSON output path")
+    args = ap.parse_args()
+    rows = run(args.U, args.T, workers=args.workers, ref_max_cells=args.ref_max_cells)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
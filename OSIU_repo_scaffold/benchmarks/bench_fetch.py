@@ -0,0 +1,73 @@
+# benchmarks/bench_fetch.py
+# World Bank fetch wall time against the local stub: sequential (one country per request) vs concurrent.
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from benchmarks.wb_stub import serve
+from src.etl.fetch_worldbank import main as fetch_main
+
+
+def _countries(n):
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    return [f"Z{letters[i // 26 % 26]}{letters[i % 26]}" for i in range(n)]
+
+
+def _read_all(d):
+    return {fp.name: pd.read_csv(fp) for fp in sorted(Path(d).glob("worldbank_*.csv"))}
+
+
+def run(n_countries=200, n_indicators=12, latency=0.05, workers=8, rate=50.0, per_page=100, legacy_sleep=0.5):
+    srv, base = serve(latency=latency)
+    cfg = {"worldbank": {
+        "indicators": [{"code": f"IND.{k}"} for k in range(n_indicators)],
+        "countries": _countries(n_countries), "start_year": 2000, "end_year": 2024,
+        "per_page": per_page, "rate_per_sec": rate, "burst": workers,
+    }}
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg_path = Path(tmp) / "wb.yaml"
+        cfg_path.write_text(yaml.safe_dump(cfg))
+        outs = {}
+        for mode in ("sequential", "concurrent"):
+            outs[mode] = Path(tmp) / mode
+            srv.requests = 0
+            t0 = time.perf_counter()
+            # no HTTP cache: it would serve the second mode (and reruns) without touching the stub
+            n = fetch_main(str(cfg_path), str(outs[mode]), mode=mode, workers=workers, base_url=base,
+                           use_cache=False)
+            rows.append({"mode": mode, "wall_s": time.perf_counter() - t0, "files": n, "requests": srv.requests})
+        a, b = _read_all(outs["sequential"]), _read_all(outs["concurrent"])
+        same = a.keys() == b.keys() and all(a[k].equals(b[k]) for k in a)
+    srv.shutdown()
+    seq = rows[0]
+    # the old loop also slept a fixed 0.5 s after every written file
+    rows.append({"mode": "legacy (est.)", "wall_s": seq["wall_s"] + legacy_sleep * seq["files"],
+                 "files": seq["files"], "requests": seq["requests"]})
+    for r in rows:
+        r["speedup_vs_legacy"] = rows[-1]["wall_s"] / r["wall_s"]
+        print(" ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in r.items()))
+    print("outputs identical:", same)
+    return {"rows": rows, "identical": bool(same)}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--countries", type=int, default=200)
+    ap.add_argument("--indicators", type=int, default=12)
+    ap.add_argument("--latency", type=float, default=0.05, help="simulated server latency per request (s)")
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--rate", type=float, default=50.0, help="token-bucket requests per second")
+    ap.add_argument("--per-page", type=int, default=100)
+    ap.add_argument("--out", default=None, help="optional JSON output path")
+    args = ap.parse_args()
+    res = run(args.countries, args.indicators, args.latency, args.workers, args.rate, args.per_page)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(res, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
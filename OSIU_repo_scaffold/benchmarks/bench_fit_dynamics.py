@@ -0,0 +1,58 @@
+# benchmarks/bench_fit_dynamics.py
+# Batched fit_dynamics (stacked normal equations / Gauss-Newton steps over all regions) vs a per-region loop,
+# with the largest coefficient difference between the two.
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic import logistic_panel
+from benchmarks.timing import timed
+from src.model.fit_dynamics import fit_arx, fit_logistic, lag_design
+
+
+
+def _arx_loop(X, y):
+    coef = np.full(X.shape[::2], np.nan)
+    for r in range(len(y)):
+        m = ~np.isnan(y[r]) & ~np.isnan(X[r]).any(axis=1)
+        coef[r] = np.linalg.lstsq(X[r][m], y[r][m], rcond=None)[0]
+    return coef
+
+
+
+def run(R_grid, T, loop_max_regions=5_000):
+    rows = []
+    names = ["kappa", "sigma", "rho", "phi", "M"]
+    for R in R_grid:
+        Y = logistic_panel(R, T)
+        X, y, _ = lag_design(Y, names, "kappa")
+        row = {"regions": R, "years": T}
+        fit, row["arx_batched_s"] = timed(lambda: fit_arx(X, y))
+        lfit, row["logistic_batched_s"] = timed(lambda: fit_logistic(Y[0], np.arange(T)))
+        row["logistic_converged"] = float(lfit["converged"].mean())
+        _, row["logistic_warm_s"] = timed(lambda: fit_logistic(Y[0], np.arange(T), lfit["coef"]))
+        if R <= loop_max_regions:
+            coef, row["arx_loop_s"] = timed(lambda: _arx_loop(X, y))
+            row["arx_max_abs_diff"] = float(np.nanmax(np.abs(coef - fit["coef"])))
+            row["arx_speedup"] = row["arx_loop_s"] / row["arx_batched_s"]
+            _, row["logistic_loop_s"] = timed(lambda: [fit_logistic(Y[0, r:r + 1], np.arange(T)) for r in range(R)])
+            row["logistic_speedup"] = row["logistic_loop_s"] / row["logistic_batched_s"]
+        rows.append(row)
+        print(" ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--regions", type=int, nargs="+", default=[100, 1_000, 10_000])
+    ap.add_argument("--years", type=int, default=60)
+    ap.add_argument("--loop-max-regions", type=int, default=5_000, help="skip the per-region reference above this")
+    ap.add_argument("--out", default=None, help="optional JSON output path")
+    args = ap.parse_args()
+    rows = run(args.regions, args.years, args.loop_max_regions)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
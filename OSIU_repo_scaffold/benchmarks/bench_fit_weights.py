@@ -0,0 +1,65 @@
+# benchmarks/bench_fit_weights.py
+# Iterations/sec and wall time of fit_weights: analytic (mirror descent) vs numeric (finite differences).
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.timing import timed
+from src.model.fit_weights import build_target_Q, fit_weights
+
+
+def _synthetic_sigma(N, K, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((N, K))
+
+
+def _time_fit(M, Q, grad, max_iter, tol):
+    (_, loss), wall = timed(lambda: fit_weights(M, Q, max_iter=max_iter, lr=0.2, tol=tol, grad=grad))
+    return wall, float(loss)
+
+
+def run(K_grid, N_grid, fixed_iters=20, numeric_iters=3, numeric_max_cells=2e7, max_cells=3e8):
+    rows = []
+    for N in N_grid:
+        for K in K_grid:
+            if N * K > max_cells:
+                print(f"skip N={N} K={K} (N*K > max_cells)")
+                continue
+            M = _synthetic_sigma(N, K)
+            Q = build_target_Q(M)
+            row = {"N": N, "K": K}
+            # throughput at a fixed iteration count (tol=0 disables early stopping)
+            wall, _ = _time_fit(M, Q, "analytic", fixed_iters, tol=0.0)
+            row["analytic_it_per_s"] = fixed_iters / wall
+            # wall time to convergence
+            wall, loss = _time_fit(M, Q, "analytic", 300, tol=1e-6)
+            row["analytic_wall_s"] = wall
+            row["analytic_loss"] = loss
+            if N * K <= numeric_max_cells:
+                wall, _ = _time_fit(M, Q, "numeric", numeric_iters, tol=0.0)
+                row["numeric_it_per_s"] = numeric_iters / wall
+                row["numeric_wall_s_est"] = 300 / row["numeric_it_per_s"]
+                row["speedup_per_iter"] = row["analytic_it_per_s"] / row["numeric_it_per_s"]
+            rows.append(row)
+            print(" ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--K", type=int, nargs="+", default=[4, 16, 64, 256])
+    ap.add_argument("--N", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    ap.add_argument("--numeric-iters", type=int, default=3)
+    ap.add_argument("--numeric-max-cells", type=float, default=2e7,
+                    help="skip the finite-difference reference above this N*K")
+    ap.add_argument("--max-cells", type=float, default=3e8, help="skip grid points above this N*K (memory guard)")
+    ap.add_argument("--out", default=None, help="optional JSON output path")
+    args = ap.parse_args()
+    rows = run(args.K, args.N, numeric_iters=args.numeric_iters,
+               numeric_max_cells=args.numeric_max_cells, max_cells=args.max_cells)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
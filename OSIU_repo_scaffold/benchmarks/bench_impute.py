@@ -0,0 +1,55 @@
+# benchmarks/bench_impute.py
+# compute_M._impute_groupwise: NumPy engine vs the per-group lambda transforms it replaced.
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.timing import timed
+from src.model.compute_M import _impute_groupwise, _impute_groupwise_pandas
+
+COLS = ["kappa", "sigma", "rho", "phi"]
+
+
+def synthetic(n_regions, n_years, missing=0.3, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "region": np.repeat([f"R{i:04d}" for i in range(n_regions)], n_years),
+        "year": np.tile(np.arange(1960, 1960 + n_years), n_regions).astype(float),
+    })
+    for c in COLS:
+        v = rng.random(len(df))
+        v[rng.random(len(df)) < missing] = np.nan
+        df[c] = v
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+
+def run(regions_grid, n_years=60, repeat=3):
+    rows = []
+    for R in regions_grid:
+        df = synthetic(R, n_years)
+        row = {"regions": R, "years": n_years, "rows": len(df)}
+        fast, row["numpy_s"] = timed(lambda: _impute_groupwise(df, COLS), repeat)
+        ref, row["pandas_s"] = timed(lambda: _impute_groupwise_pandas(df, COLS), repeat)
+        row["speedup"] = row["pandas_s"] / row["numpy_s"]
+        row["identical"] = bool(fast.equals(ref))
+        rows.append(row)
+        print(" ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--regions", type=int, nargs="+", default=[200, 2_000, 20_000])
+    ap.add_argument("--years", type=int, default=60)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default=None, help="optional JSON output path")
+    args = ap.parse_args()
+    rows = run(args.regions, args.years, args.repeat)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
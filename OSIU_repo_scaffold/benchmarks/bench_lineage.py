@@ -0,0 +1,79 @@
+# benchmarks/bench_lineage.py
+# Lineage simulation (src/model/lineage) vs the scripts' approach scaled up: one Python object and one
+# recorded simulate() per universe, children seeded from their parent's trajectory, per-generation
+# statistics from the stacked trajectories. Reports time, peak traced memory and, with noise=0 (both
+# deterministic), the largest difference of per-node final M and per-generation mean M(t).
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.timing import measured
+from src.model.lineage import grow, simulate_lineage
+from src.model.sim_engine import simulate
+
+CHILDREN = [
+    {"kappa": "inherit", "sigma": 0.15, "regime": "growth", "rate": 0.00055},
+    {"kappa": 0.95, "sigma": 0.01, "regime": "decay", "rate": 0.001},
+    {"kappa": "inherit", "kappa_jitter": 0.02, "sigma": [0.05, 0.3], "regime": "growth", "rate": 0.0005},
+    {"kappa": "inherit", "sigma": 0.12, "regime": "growth", "rate": 0.0005},
+]
+
+
+def _spec(k, generations):
+    return {"seed": 0, "generations": generations, "children": CHILDREN[:k],
+            "root": {"kappa": 0.9, "sigma": 0.2, "regime": "growth", "rate": 0.0005, "cap": 0.9}}
+
+
+
+def _per_node(tree, T, noise):
+    """Reference: a dict per universe, simulated one at a time, breadth-first from the root."""
+    rng = np.random.default_rng(1)
+    objects = []
+    for i in range(tree.n_nodes):
+        node = {k: float(getattr(tree, k)[i]) for k in ("kappa", "sigma", "drift", "lo", "hi")}
+        p = int(tree.parent[i])
+        start = (objects[p]["rho"][-1], objects[p]["phi"][-1]) if p >= 0 else (tree.rho0[i], tree.phi0[i])
+        run = simulate(node["kappa"], node["sigma"], *start, T, node["drift"], node["lo"], node["hi"],
+                       noise=noise, rng=rng)
+        node.update(rho=run["rho"][0], phi=run["phi"][0], M=run["M"][0])
+        objects.append(node)
+    gen = tree.generation_of()
+    M = np.stack([o["M"] for o in objects])
+    means = np.stack([M[gen == g].mean(axis=0) for g in range(tree.n_generations)])
+    return M[:, -1], means
+
+
+def run(k_grid, generations, T, ref_max_nodes=20_000):
+    rows = []
+    for k in k_grid:
+        tree = grow(_spec(k, generations))
+        row = {"k": k, "generations": generations, "nodes": tree.n_nodes, "T": T}
+        (_, _), row["lineage_s"], row["lineage_peak_mb"] = measured(lambda: simulate_lineage(tree, T, seed=1))
+        if tree.n_nodes <= ref_max_nodes:
+            _, row["per_node_s"], row["per_node_peak_mb"] = measured(lambda: _per_node(tree, T, 0.01))
+            row["speedup"] = row["per_node_s"] / row["lineage_s"]
+            # noise-free runs are deterministic, so both must agree up to rounding
+            nodes, stats = simulate_lineage(tree, T, noise=0.0)
+            M_final, means = _per_node(tree, T, 0.0)
+            row["max_abs_diff_M_final"] = float(np.abs(nodes["M_final"] - M_final).max())
+            row["max_abs_diff_gen_mean"] = float(np.abs(stats.mean - means).max())
+        rows.append(row)
+        print(" ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--k", type=int, nargs="+", default=[2, 3, 4], help="children per universe (at most 4)")
+    ap.add_argument("--generations", type=int, default=7)
+    ap.add_argument("--T", type=int, default=200)
+    ap.add_argument("--ref-max-nodes", type=int, default=20_000, help="skip the per-node reference above this")
+    ap.add_argument("--out", default=None, help="optional JSON output path")
+    args = ap.parse_args()
+    rows = run(args.k, args.generations, args.T, args.ref_max_nodes)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
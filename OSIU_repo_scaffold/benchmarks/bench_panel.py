@@ -0,0 +1,71 @@
+# benchmarks/bench_panel.py
+# The shared (region, year) panel (src/model/panel) vs string-keyed merges: the fit_weights sigma
+# matrix from the long table by merges, by building the panel, and from the saved memory-mapped panel;
+# and the latents outer join (chained merges + sort vs join_on_index). Checks the results agree.
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic import indicator_ids, indicator_long
+from benchmarks.timing import timed
+from src.model.fit_weights import _build_sigma_matrix_merge, build_sigma_matrix
+from src.model.panel import IndicatorPanel, join_on_index
+
+
+
+def _merge_chain(frames):
+    """stage_fit_latents as it was: chained outer merges on region/year, then a sort."""
+    L = frames[0]
+    for nxt in frames[1:]:
+        L = L.merge(nxt, on=["region", "year"], how="outer")
+    return L.sort_values(["region", "year"]).reset_index(drop=True)
+
+
+
+def run(R_grid, T, K, n_sigma):
+    rows = []
+    for R in R_grid:
+        row = {"regions": R, "years": T, "indicators": K}
+        df = indicator_long(R, T, K)
+        ids = indicator_ids(K)[:n_sigma]
+
+        (M_ref, obs), row["sigma_merge_s"] = timed(lambda: _build_sigma_matrix_merge(df, ids))
+        panel, row["panel_build_s"] = timed(lambda: IndicatorPanel.from_long(df))
+        (M, cells), row["sigma_panel_s"] = timed(lambda: build_sigma_matrix(panel, ids))
+        with tempfile.TemporaryDirectory() as tmp:
+            panel.save(tmp)
+            (M_mm, _), row["sigma_mmap_s"] = timed(lambda: build_sigma_matrix(IndicatorPanel.load(tmp), ids))
+        row["panel_mb"] = panel.values.nbytes / 2**20
+        row["speedup_mmap"] = row["sigma_merge_s"] / row["sigma_mmap_s"]
+        # the merge reference keeps the first indicator's row order; compare in (region, year) order
+        order = np.lexsort((obs["year"].to_numpy(), obs["region"].to_numpy()))
+        row["sigma_identical"] = bool(np.array_equal(M_ref[order], M) and np.array_equal(M, M_mm))
+
+        cols = [df[df["id"] == i][["region", "year", "norm"]].rename(columns={"norm": i}) for i in ids]
+        L_ref, row["join_merge_s"] = timed(lambda: _merge_chain(cols))
+        L, row["join_index_s"] = timed(lambda: join_on_index(cols))
+        row["join_identical"] = bool(
+            np.array_equal(L["region"].astype(str), L_ref["region"].astype(str))
+            and np.array_equal(L["year"], L_ref["year"])
+            and np.array_equal(L[ids].to_numpy(), L_ref[ids].to_numpy(), equal_nan=True))
+        rows.append(row)
+        print(" ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--regions", type=int, nargs="+", default=[200, 2_000, 10_000])
+    ap.add_argument("--years", type=int, default=60)
+    ap.add_argument("--indicators", type=int, default=16)
+    ap.add_argument("--sigma", type=int, default=4, help="indicators in the sigma matrix")
+    ap.add_argument("--out", default=None, help="optional JSON output path")
+    args = ap.parse_args()
+    rows = run(args.regions, args.years, args.indicators, args.sigma)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
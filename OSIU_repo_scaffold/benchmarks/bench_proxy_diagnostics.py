@@ -0,0 +1,87 @@
+# benchmarks/bench_proxy_diagnostics.py
+# Batched proxy diagnostics (src/validation/proxy_diagnostics) vs a pandas groupby-apply of
+# DataFrame.corr(method="spearman") and var() per region and per region-window, with the largest
+# difference of the correlations and variance shares.
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import indicator_long
+from benchmarks.timing import timed
+from src.model.panel import IndicatorPanel
+from src.validation.proxy_diagnostics import diagnose
+
+
+
+def _groupby(panel, window):
+    """Per region and per (region, window) Spearman matrices and variance shares by groupby-apply."""
+    R, T = panel.index.shape
+    ids = panel.ids
+    wide = pd.DataFrame(panel.values.reshape(R * T, -1), columns=ids)
+    wide["region"] = np.repeat(np.asarray(panel.index.regions), T)
+    wide["year"] = np.tile(panel.index.years, R)
+    wide = wide.dropna()
+
+    def stats(g):
+        return pd.Series({"corr": g[ids].corr(method="spearman").to_numpy(), "share": (g[ids].var() / g[ids].var().sum()).to_numpy()})
+
+    by_region = wide.groupby("region").apply(stats)
+    rows = []
+    for start in panel.index.years[:T - window + 1]:
+        sub = wide[(wide["year"] >= start) & (wide["year"] < start + window)]
+        rows.append(sub.groupby("region").apply(stats).assign(start=start))
+    return by_region, pd.concat(rows)
+
+
+def _max_diff(flags_corr, flags_shares, ref, scope, ids):
+    """Largest |batched - reference| over the shared groups' correlations and shares."""
+    K = len(ids)
+    a, b = np.triu_indices(K, 1)
+    key = ["region"] if scope == "region" else ["region", "start"]
+    c = flags_corr[flags_corr["scope"] == scope].set_index(key)["corr"]
+    s = flags_shares[flags_shares["scope"] == scope].set_index(key)["share"]
+    ref = ref.reset_index().set_index(key)
+    groups = c.index.unique()
+    got_c = c.to_numpy().reshape(len(groups), -1)
+    got_s = s.loc[groups].to_numpy().reshape(len(groups), K)
+    want_c = np.stack([m[a, b] for m in ref.loc[groups, "corr"]])
+    want_s = np.stack(list(ref.loc[groups, "share"]))
+    return float(max(np.nanmax(np.abs(got_c - want_c)), np.nanmax(np.abs(got_s - want_s))))
+
+
+def run(R_grid, T, K, window, ref_max_regions=200):
+    rows = []
+    for R in R_grid:
+        row = {"regions": R, "years": T, "indicators": K, "window": window}
+        # norm rounded to 2 decimals, so ranks have ties
+        panel = IndicatorPanel.from_long(indicator_long(R, T, K, decimals=2))
+        (flags, corr, shares), row["batched_s"] = timed(lambda: diagnose(
+            panel.values, panel.ids, list(panel.index.regions), panel.index.years, window=window, min_obs=2))
+        row["groups"] = len(flags)
+        if R <= ref_max_regions:
+            (by_region, by_window), row["groupby_s"] = timed(lambda: _groupby(panel, window))
+            row["speedup"] = row["groupby_s"] / row["batched_s"]
+            row["max_abs_diff"] = max(_max_diff(corr, shares, by_region, "region", panel.ids),
+                                      _max_diff(corr, shares, by_window, "window", panel.ids))
+        rows.append(row)
+        print(" ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--regions", type=int, nargs="+", default=[50, 200, 2_000])
+    ap.add_argument("--years", type=int, default=60)
+    ap.add_argument("--indicators", type=int, default=4)
+    ap.add_argument("--window", type=int, default=10)
+    ap.add_argument("--ref-max-regions", type=int, default=200, help="skip the groupby-apply reference above this")
+    ap.add_argument("--out", default=None, help="optional JSON output path")
+    args = ap.parse_args()
+    rows = run(args.regions, args.years, args.indicators, args.window, args.ref_max_regions)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
@@ -0,0 +1,56 @@
+# benchmarks/bench_validate.py
+# Raw-file validation over many small per-country files: the old full-read header check vs the
+# streaming validator (cold, then warm from its content-hash cache).
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.synthetic import raw_frame
+from benchmarks.timing import timed
+from src.etl.validate_schema import SCHEMA, validate_files
+
+
+def write_files(root, n_files, n_years):
+    """One file per (indicator, country), as fetch_worldbank writes them."""
+    raw = Path(root)
+    raw.mkdir(parents=True, exist_ok=True)
+    for k in range(n_files):
+        df = raw_frame(f"syn_{k % 40}", 1, n_years, seed=k).assign(region=f"C{k // 40:04d}")
+        df.to_csv(raw / f"syn_{k % 40}_C{k // 40:04d}.csv", index=False)
+    return sorted(raw.glob("*.csv"))
+
+
+def _legacy(files):
+    required = {"region", "year", "value", "id"}
+    return sum(not required <= set(pd.read_csv(fp).columns) for fp in files)
+
+
+def run(n_files, n_years, workers):
+    with tempfile.TemporaryDirectory() as tmp:
+        files = write_files(Path(tmp) / "raw", n_files, n_years)
+        cache = Path(tmp) / "cache.json"
+        row = {"files": n_files, "rows_per_file": n_years}
+        _, row["legacy_s"] = timed(lambda: _legacy(files))
+        (res, _), row["cold_s"] = timed(lambda: validate_files(files, SCHEMA, workers=workers, cache=cache))
+        row["bad"] = sum(not r["ok"] for r in res.values())
+        (_, n), row["warm_s"] = timed(lambda: validate_files(files, SCHEMA, workers=workers, cache=cache))
+        row["warm_validated"] = n
+    print(" ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    return row
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", type=int, nargs="+", default=[500, 2_000])
+    ap.add_argument("--years", type=int, default=60)
+    ap.add_argument("--workers", type=int, default=0)
+    ap.add_argument("--out", default=None, help="optional JSON output path")
+    args = ap.parse_args()
+    rows = [run(n, args.years, args.workers) for n in args.files]
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
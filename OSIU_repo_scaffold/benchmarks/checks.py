@@ -0,0 +1,281 @@
+# benchmarks/checks.py
+# Offline behavioural regression checks (synthetic data and local stubs only), for CI next to
+# benchmarks.importtime.
+#
+#   python -m benchmarks.checks [name ...]     exits 1 if any check fails
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+@contextlib.contextmanager
+def _workspace(regions=30, years=20, indicators=8, csv_export=False):
+    """A synthetic workspace (benchmarks.synthetic) as the working directory; stage output is silenced."""
+    import yaml
+
+    from benchmarks.synthetic import CONFIG, write_workspace
+
+    with tempfile.TemporaryDirectory() as tmp, contextlib.chdir(tmp), contextlib.redirect_stdout(io.StringIO()):
+        write_workspace(".", regions, years, indicators)
+        cfg = yaml.safe_load(Path(CONFIG).read_text())
+        cfg["output"]["csv_export"] = csv_export
+        Path(CONFIG).write_text(yaml.safe_dump(cfg, sort_keys=False))
+        yield CONFIG
+
+
+def storage_format_switch():
+    """Rewriting a table in another format replaces it: read_table never returns the old store's rows."""
+    from src.storage import FORMATS, read_table, write_table
+
+    old = pd.DataFrame({"region": ["A", "B"], "year": [2000, 2001], "M_raw": [1.0, 2.0], "M": [0.1, 0.2]})
+    new = old.assign(M=[0.7, 0.8])
+    with tempfile.TemporaryDirectory() as tmp:
+        for table in ("latents.csv", "M_timeseries.csv"):  # single-file and partitioned Parquet
+            p = Path(tmp) / table
+            for a in FORMATS:
+                for b in FORMATS:
+                    if a == b:
+                        continue
+                    write_table(old, p, a)
+                    write_table(new, p, b)
+                    got = read_table(p).sort_values("year")["M"].tolist()
+                    assert got == [0.7, 0.8], f"{table}: {a} -> {b} read back {got}"
+
+
+def fetch_concurrent_matches_sequential():
+    """
+    Against the local World Bank stub (paging, batched countries), the concurrent fetcher writes the same
+    files as the sequential one: a malformed (HTML) response fails only its own indicator, and an error
+    payload for one unknown country (XXX) only that country, not the rest of its batch.
+    """
+    import yaml
+
+    from benchmarks.wb_stub import serve
+    from src.etl.fetch_worldbank import main as fetch_main
+
+    srv, base = serve()
+    cfg = {"worldbank": {
+        "indicators": [{"code": "IND.A"}, {"code": "BAD.HTML"}, {"code": "IND.B"}],
+        "countries": ["USA", "GBR", "CAN", "XXX"] + [f"Z{chr(65 + i)}A" for i in range(20)],
+        "start_year": 2000, "end_year": 2024, "per_page": 40, "batch_size": 8, "rate_per_sec": 1000.0,
+    }}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg_path = Path(tmp) / "wb.yaml"
+            cfg_path.write_text(yaml.safe_dump(cfg))
+            files = {}
+            for mode in ("sequential", "concurrent"):
+                out = Path(tmp) / mode
+                fetch_main(str(cfg_path), str(out), mode=mode, workers=4, base_url=base, use_cache=False)
+                files[mode] = {fp.name: fp.read_bytes() for fp in sorted(out.glob("*.csv"))}
+    finally:
+        srv.shutdown()
+    seq, conc = files["sequential"], files["concurrent"]
+    assert len(seq) == 2 * (len(cfg["worldbank"]["countries"]) - 1), f"sequential wrote {len(seq)} files"
+    assert not any("BAD" in name or "XXX" in name for name in conc), "files written for a failed request"
+    assert seq.keys() == conc.keys(), f"file sets differ: {sorted(seq.keys() ^ conc.keys())}"
+    differ = [name for name in seq if seq[name] != conc[name]]
+    assert not differ, f"contents differ: {differ}"
+
+
+def http_cache_keeps_valid_bodies():
+    """
+    Bodies fetch_page cannot parse (HTML error page, World Bank error payload) are not kept in the HTTP
+    cache, and a completed download records its size.
+    """
+    from benchmarks.wb_stub import serve
+    from src.etl.fetch_worldbank import _session_with_retries, fetch_page
+    from src.etl.http_cache import HttpCache, cache_key
+
+    srv, base = serve()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache, sess = HttpCache(Path(tmp) / "http"), _session_with_retries()
+            for countries, code in ((["USA"], "BAD.HTML"), (["USA", "XXX"], "IND.A")):
+                try:
+                    fetch_page(countries, code, 2000, 2024, base=base, session=sess, cache=cache)
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError(f"{code} {countries}: no error raised")
+            assert not list(cache.root.glob("*.body")), "unparseable bodies left in the cache"
+            fetch_page(["USA"], "IND.A", 2000, 2024, base=base, session=sess, cache=cache)
+            assert len(list(cache.root.glob("*.body"))) == 1, "valid body not cached"
+
+            url = base.rsplit("/v2", 1)[0] + "/files/5000.csv"
+            dest = Path(tmp) / "owid.csv"
+            assert cache.download(sess, url, dest) == "downloaded"
+            size = cache._meta(cache_key(url))["size"]
+            assert size == dest.stat().st_size > 0, f"download recorded size {size}"
+    finally:
+        srv.shutdown()
+
+
+def build_latents_matches_loop():
+    """The sparse single-pass build_latents equals the per-latent filter/groupby/merge loop it replaced."""
+    from benchmarks.bench_build_latents import synthetic
+    from src.model.fit_latents import _build_latents_loop, build_latents
+
+    df, cfg = synthetic(50_000, n_regions=40, n_years=30, n_indicators=40, n_latents=6)
+    assert build_latents(df, cfg).equals(_build_latents_loop(df, cfg))
+
+
+def impute_matches_pandas():
+    """compute_M's NumPy imputation equals the per-group pandas transforms (values, dtypes, index)."""
+    from benchmarks.bench_impute import COLS, synthetic
+    from src.model.compute_M import _impute_groupwise, _impute_groupwise_pandas
+
+    df = synthetic(60, 25)
+    df.loc[df["region"] == "R0003", "rho"] = np.nan  # a region without data falls back to the median
+    assert _impute_groupwise(df, COLS).equals(_impute_groupwise_pandas(df, COLS))
+
+
+def normalize_streaming_matches_memory():
+    """fit_latents --chunk-rows writes the same interim table and CSV export as the in-memory normalize."""
+    from src.model.fit_latents import main
+    from src.storage import read_table
+
+    fp = Path("data/interim/indicators_normalized.csv")
+    with _workspace(csv_export=True) as cfg:
+        main(cfg, normalize_only=True)
+        ref, ref_csv = read_table(fp), fp.read_bytes()
+        main(cfg, normalize_only=True, chunk_rows=97)
+        got, got_csv = read_table(fp), fp.read_bytes()
+    pd.testing.assert_frame_equal(got, ref)
+    assert got_csv == ref_csv, "CSV exports differ"
+
+
+def bootstrap_batched_matches_sequential():
+    """Batched bootstrap_ci agrees with the sequential refits (same resamples), for any worker count."""
+    from src.model.fit_weights import bootstrap_ci, build_target_Q
+
+    M = np.random.default_rng(0).random((300, 4))
+    Q = build_target_Q(M)
+    seq = bootstrap_ci(M, Q, B=16, mode="sequential")
+    bat = bootstrap_ci(M, Q, B=16, mode="batched")
+    for name, a, b in zip(("mean", "lo", "hi", "loss"), seq, bat):
+        assert np.allclose(a, b, rtol=0, atol=1e-8), f"{name}: {a} vs {b}"
+    one = bootstrap_ci(M, Q, B=16, mode="batched", chunk=4, workers=1)
+    two = bootstrap_ci(M, Q, B=16, mode="batched", chunk=4, workers=2)
+    assert all(np.array_equal(a, b) for a, b in zip(one, two)), "result depends on the worker count"
+
+
+def compute_M_incremental_matches_full():
+    """
+    compute_M --incremental after changed, added and removed latents gives the same M_timeseries (and
+    CSV export rows) as a full recompute.
+    """
+    from src.model.compute_M import main as compute_main
+    from src.model.fit_latents import main as latents_main
+    from src.storage import read_table, write_table
+
+    M_fp, key = Path("data/processed/M_timeseries.csv"), ["region", "year"]
+    rng = np.random.default_rng(3)
+    with _workspace(csv_export=True) as cfg:
+        latents_main(cfg)
+        # gaps, so that changes move interpolated values between observations
+        lat = read_table("data/processed/latents.csv").astype({"region": str})
+        lat.loc[rng.random(len(lat)) < 0.3, "rho"] = np.nan
+        write_table(lat, "data/processed/latents.csv", "parquet", True)
+        compute_main(cfg)
+        lat.loc[rng.choice(len(lat), 15, replace=False), "rho"] = rng.random(15)
+        new_year = lat[lat["year"] == lat["year"].max()].head(5).assign(year=lat["year"].max() + 1)
+        lat = pd.concat([lat[lat["region"] != "R00007"], new_year], ignore_index=True)
+        write_table(lat, "data/processed/latents.csv", "parquet", True)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            compute_main(cfg, incremental=True)
+        assert "Patched M_timeseries" in out.getvalue(), f"no incremental patch: {out.getvalue()!r}"
+        inc, inc_csv = read_table(M_fp), pd.read_csv(M_fp)
+        compute_main(cfg)
+        full, full_csv = read_table(M_fp), pd.read_csv(M_fp)
+    for a, b in ((inc, full), (inc_csv, full_csv)):
+        a, b = (x.astype({"region": str}).sort_values(key).reset_index(drop=True) for x in (a, b))
+        pd.testing.assert_frame_equal(a, b, check_dtype=False)
+
+
+def formula_matches_hand_written():
+    """The configured formulas (NumPy blocks) equal the hand-written expressions, element for element."""
+    import yaml
+
+    from src.model.formula import FormulaSet, moral_gradient
+
+    cfg = yaml.safe_load(Path("configs/indicators.yaml").read_text())
+    rng = np.random.default_rng(0)
+    d = pd.DataFrame({c: rng.random(5_000) for c in ("kappa", "sigma", "rho", "phi")})
+    d.iloc[::17, 1] = np.nan
+    k, s, r, p = (d[c].to_numpy() for c in ("kappa", "sigma", "rho", "phi"))
+    eps = 1e-6
+    expected = {
+        "M": (k / (s + eps)) * r * p,
+        "M_log": np.log(k + eps) - np.log(s + eps) + np.log(r + eps) + np.log(p + eps),
+        "M_weighted": k ** 1.0 / (s + eps) ** 0.5 * r ** 1.0 * p ** 1.0,
+        "M_dir": k * (1 - s) * r * p,
+    }
+    got = FormulaSet.from_config(cfg, engine="numpy").evaluate(d, block=1_000)
+    for name, want in expected.items():
+        assert np.array_equal(np.asarray(got[name]), want, equal_nan=True), f"{name} differs"
+    assert np.array_equal(moral_gradient(k, s, r, p, 0.01), (k / (s + 0.01)) * r * p, equal_nan=True)
+
+
+def panel_matches_merges():
+    """The panel-built sigma matrix and latents join equal the string-keyed merges they replaced."""
+    from benchmarks.bench_panel import _merge_chain
+    from benchmarks.synthetic import indicator_ids, indicator_long
+    from src.model.fit_weights import _build_sigma_matrix_merge, build_sigma_matrix
+    from src.model.panel import IndicatorPanel, join_on_index
+
+    df = indicator_long(40, 20, 8)
+    ids = indicator_ids(8)[:4]
+    M_ref, obs = _build_sigma_matrix_merge(df, ids)
+    panel = IndicatorPanel.from_long(df)
+    M, _ = build_sigma_matrix(panel, ids)
+    with tempfile.TemporaryDirectory() as tmp:
+        panel.save(tmp)
+        M_mm, _ = build_sigma_matrix(IndicatorPanel.load(tmp), ids)
+    order = np.lexsort((obs["year"].to_numpy(), obs["region"].to_numpy()))
+    assert np.array_equal(M_ref[order], M) and np.array_equal(M, M_mm), "sigma matrices differ"
+
+    cols = [df[df["id"] == i][["region", "year", "norm"]].rename(columns={"norm": i}) for i in ids]
+    L, L_ref = join_on_index(cols), _merge_chain(cols)
+    assert np.array_equal(L["region"].astype(str), L_ref["region"].astype(str))
+    assert np.array_equal(L["year"], L_ref["year"])
+    assert np.array_equal(L[ids].to_numpy(), L_ref[ids].to_numpy(), equal_nan=True), "latents joins differ"
+
+
+CHECKS = {"storage_format_switch": storage_format_switch,
+          "fetch_concurrent_matches_sequential": fetch_concurrent_matches_sequential,
+          "http_cache_keeps_valid_bodies": http_cache_keeps_valid_bodies,
+          "build_latents_matches_loop": build_latents_matches_loop,
+          "impute_matches_pandas": impute_matches_pandas,
+          "normalize_streaming_matches_memory": normalize_streaming_matches_memory,
+          "bootstrap_batched_matches_sequential": bootstrap_batched_matches_sequential,
+          "compute_M_incremental_matches_full": compute_M_incremental_matches_full,
+          "formula_matches_hand_written": formula_matches_hand_written,
+          "panel_matches_merges": panel_matches_merges}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("names", nargs="*", help=f"checks to run (default: all of {', '.join(CHECKS)})")
+    args = ap.parse_args(argv)
+    failed = []
+    for name in args.names or CHECKS:
+        try:
+            CHECKS[name]()
+            print(f"ok    {name}")
+        except Exception:
+            failed.append(name)
+            print(f"FAIL  {name}")
+            traceback.print_exc()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# benchmarks/importtime.py
+# CLI startup cost: runs entry points under `python -X importtime` and checks that heavy
+# dependencies stay unloaded where they are not needed (e.g. no matplotlib/requests for `--help`).
+#
+#   python -m benchmarks.importtime                    # table + checks, exits 1 on a violation
+#   python -m benchmarks.importtime --top 15 --budget-ms 300
+#
+# Import times are the sum of the per-module "self" column, so they exclude interpreter startup.
+import argparse
+import os
+import subprocess
+import sys
+
+from tabulate import tabulate
+
+HEAVY = ("numpy", "pandas", "yaml", "matplotlib", "requests", "pyarrow")
+
+# (command, modules that must not be imported)
+CASES = [
+    (["-m", "src", "--help"], HEAVY),
+    (["-m", "src", "fit_dynamics", "--help"], ("matplotlib", "requests")),
+    (["-m", "src", "compute_M", "--help"], ("matplotlib", "requests")),
+    (["-m", "src", "corr_tests", "--help"], ("matplotlib", "requests")),
+    (["-m", "src", "proxy_diagnostics", "--help"], ("matplotlib", "requests")),
+    (["-m", "src", "fit_latents", "--help"], ("matplotlib", "requests")),
+    (["-m", "src", "plots", "--help"], ("matplotlib", "requests")),
+    (["-m", "src", "lineage", "--help"], ("matplotlib", "requests", "pandas")),
+    (["-m", "src", "fetch", "--help"], ("matplotlib", "requests", "pandas")),
+    (["-m", "src", "pipeline", "--help"], ("matplotlib", "requests")),
+]
+
+
+def importtime(args, cwd=None):
+    """{module: self µs} for one `python -X importtime` run."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=cwd, capture_output=True, text=True,
+                          env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"})
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} exited {proc.returncode}:\n{proc.stderr[-2000:]}")
+    self_us = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        us, _, name = line[len("import time:"):].split("|")
+        self_us[name.strip()] = int(us)
+    return self_us
+
+
+def measure(cases=CASES, repeat=3, cwd=None):
+    """Rows of (command, ms, modules, violations); best of `repeat` runs."""
+    rows = []
+    for args, forbidden in cases:
+        runs = [importtime(args, cwd) for _ in range(repeat)]
+        best = min(runs, key=lambda r: sum(r.values()))
+        loaded = {m.split(".")[0] for m in best}
+        rows.append((" ".join(args[1:]), sum(best.values()) / 1000, len(best),
+                     sorted(set(forbidden) & loaded), best))
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.importtime")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--top", type=int, default=0, help="also list the N slowest imports of each command")
+    ap.add_argument("--budget-ms", type=float, default=None, help="fail when a command's imports take longer")
+    args = ap.parse_args(argv)
+
+    rows = measure(repeat=args.repeat)
+    failed = False
+    table = []
+    for cmd, ms, n, bad, best in rows:
+        over = args.budget_ms is not None and ms > args.budget_ms
+        failed |= bool(bad) or over
+        table.append([cmd, f"{ms:.1f}", n, ", ".join(bad) or "ok", "over budget" if over else ""])
+    print(tabulate(table, headers=["python -m", "import ms", "modules", "forbidden loaded", ""],
+                   disable_numparse=True))
+    if args.top:
+        for cmd, ms, n, bad, best in rows:
+            print(f"\n{cmd}:")
+            top = sorted(best.items(), key=lambda kv: -kv[1])[:args.top]
+            print(tabulate([[m, f"{us / 1000:.1f}"] for m, us in top], headers=["module", "self ms"],
+                           disable_numparse=True))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
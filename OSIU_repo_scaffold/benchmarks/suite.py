@@ -0,0 +1,266 @@
+# benchmarks/suite.py
+# Offline benchmark suite: every pipeline stage, fit_weights/bootstrap_ci and the simulation kernel
+# on synthetic data, each case in a fresh process so its peak RSS is its own.
+#
+#   python -m benchmarks                                   # small scale, table only
+#   python -m benchmarks --scale medium --out results/benchmarks/baseline.json
+#   python -m benchmarks --scale medium --baseline results/benchmarks/baseline.json --threshold 0.2
+#
+# With --baseline the run exits 1 when any case is more than `threshold` slower (or larger in
+# peak RSS) than the stored result, so it can gate changes to fit_latents, compute_M, fit_weights
+# or the simulators. Baselines are machine-specific: record and compare on the same host.
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import CONFIG, write_workspace
+
+SCALES = {
+    "small": {"regions": 100, "years": 30, "indicators": 12, "boot_B": 20, "perm_B": 200,
+              "sim": [(100, 200), (1_000, 200), (1_000, 1_000)], "lineage": (3, 7)},
+    "medium": {"regions": 1_000, "years": 60, "indicators": 40, "boot_B": 50, "perm_B": 1_000,
+               "sim": [(1_000, 1_000), (10_000, 1_000)], "lineage": (4, 8)},
+    "large": {"regions": 2_000, "years": 60, "indicators": 100, "boot_B": 100, "perm_B": 1_000,
+              "sim": [(10_000, 1_000), (10_000, 4_000)], "lineage": (4, 10)},
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB (None where `resource` is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _sigma_ids():
+    import yaml
+
+    cfg = yaml.safe_load(Path(CONFIG).read_text())
+    return [i["id"] for i in cfg["latents"]["sigma"]["indicators"]]
+
+
+def _sigma_problem():
+    from src.model.fit_weights import build_sigma_matrix, build_target_Q
+    from src.model.panel import indicator_panel
+
+    M, _ = build_sigma_matrix(indicator_panel("data/interim/indicators_normalized.csv"), _sigma_ids())
+    return M, build_target_Q(M)
+
+
+# Each case: setup(params) -> (fn, items); fn() is timed, items sizes the throughput
+def _normalize(p):
+    from src.model.fit_latents import main
+    return (lambda: main(CONFIG, normalize_only=True)), p["raw_rows"]
+
+
+def _build_latents(p):
+    from src.model.fit_latents import build_latents
+    from src.storage import read_table
+    import yaml
+
+    cfg = yaml.safe_load(Path(CONFIG).read_text())
+    df = read_table("data/interim/indicators_normalized.csv", columns=["region", "year", "id", "norm"])
+    return (lambda: build_latents(df, cfg)), len(df)
+
+
+def _compute_M(p):
+    from src.model.compute_M import main
+    return (lambda: main(CONFIG)), p["regions"] * p["years"]
+
+
+def _fit_dynamics(p):
+    from src.model.fit_dynamics import main
+    return (lambda: main(CONFIG, warm_start=False)), p["regions"] * p["years"]
+
+
+def _corr_tests(p):
+    from src.validation.corr_tests import main
+    return (lambda: main(CONFIG, B=p["perm_B"])), p["regions"] * p["perm_B"]
+
+
+def _proxy_diagnostics(p):
+    from src.validation.proxy_diagnostics import main
+    return (lambda: main(CONFIG)), p["regions"] * p["years"]
+
+
+def _sigma_matrix(p):
+    from src.model.fit_weights import build_sigma_matrix
+    from src.model.panel import indicator_panel
+
+    ids = _sigma_ids()
+    return (lambda: build_sigma_matrix(indicator_panel("data/interim/indicators_normalized.csv"), ids)), \
+        p["regions"] * p["years"]
+
+
+def _fit_weights(p):
+    from src.model.fit_weights import fit_weights
+    M, Q = _sigma_problem()
+    return (lambda: fit_weights(M, Q, max_iter=300, lr=0.2)), M.shape[0]
+
+
+def _bootstrap_ci(p):
+    from src.model.fit_weights import bootstrap_ci
+    M, Q = _sigma_problem()
+    B = p["boot_B"]
+    return (lambda: bootstrap_ci(M, Q, B=B, mode="batched", max_iter=200, lr=0.2)), B * M.shape[0]
+
+
+def _simulate(U, T, ensemble=False):
+    def setup(p):
+        from src.model.ensemble import EnsembleStats
+        from src.model.sim_engine import simulate
+        rng = np.random.default_rng(0)
+        kappa, sigma = rng.uniform(0.5, 1.0, U), rng.uniform(0.01, 0.3, U)
+        drift = np.where(np.arange(U) % 2, 0.0005, -0.001)
+        lo, hi = np.where(drift > 0, -np.inf, 0.1), np.where(drift > 0, 0.95, np.inf)
+        if ensemble:
+            # online per-step statistics instead of the (T, U) trajectories
+            return (lambda: simulate(kappa, sigma, 0.7, 0.6, T, drift, lo, hi, rng=np.random.default_rng(1),
+                                     record=False, stats=EnsembleStats(T))), U * T
+        return (lambda: simulate(kappa, sigma, 0.7, 0.6, T, drift, lo, hi, rng=np.random.default_rng(1))), U * T
+    return setup
+
+
+def _lineage(k, generations, T=200):
+    def setup(p):
+        from src.model.lineage import grow, simulate_lineage
+        children = [{"kappa": "inherit", "sigma": 0.15, "regime": "growth", "rate": 0.00055},
+                    {"kappa": 0.95, "sigma": 0.01, "regime": "decay", "rate": 0.001}] * k
+        tree = grow({"seed": 0, "generations": generations, "children": children[:k]})
+        return (lambda: simulate_lineage(tree, T, seed=1)), tree.n_nodes * T
+    return setup
+
+
+def cases(scale):
+    out = {"normalize": _normalize, "build_latents": _build_latents, "compute_M": _compute_M,
+           "fit_dynamics": _fit_dynamics, "corr_tests": _corr_tests, "proxy_diagnostics": _proxy_diagnostics,
+           "sigma_matrix": _sigma_matrix, "fit_weights": _fit_weights, "bootstrap_ci": _bootstrap_ci}
+    for U, T in scale["sim"]:
+        out[f"simulate_U{U}_T{T}"] = _simulate(U, T)
+    U, T = scale["sim"][-1]
+    out[f"ensemble_U{U}_T{T}"] = _simulate(U, T, ensemble=True)
+    k, G = scale["lineage"]
+    out[f"lineage_k{k}_G{G}"] = _lineage(k, G)
+    return out
+
+
+def _run_case(name, workspace, params, repeat):
+    """Child process: set up one case, time it `repeat` times (best of), report its peak RSS."""
+    os.chdir(workspace)
+    setup = cases(params)[name]
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn, items = setup(params)
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+    best = min(times)
+    return {"seconds": best, "median_s": float(np.median(times)), "items": int(items),
+            "items_per_s": items / best if best > 0 else None, "peak_rss_mb": peak_rss_mb()}
+
+
+def _prepare(workspace, params):
+    """Child process: write the raw CSVs and run the stages once so every case finds its inputs."""
+    os.chdir(workspace)
+    rows = write_workspace(".", params["regions"], params["years"], params["indicators"])
+    from src.model.compute_M import main as compute_main
+    from src.model.fit_latents import main as latents_main
+    with contextlib.redirect_stdout(io.StringIO()):
+        latents_main(CONFIG)
+        compute_main(CONFIG)
+    return rows
+
+
+def _in_child(fn, *args):
+    # a fresh interpreter per case keeps peak RSS and allocator state independent of earlier cases
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def run(scale="small", selected=None, repeat=3, overrides=None):
+    params = {**SCALES[scale], **{k: v for k, v in (overrides or {}).items() if v is not None}}
+    names = [n for n in cases(params) if not selected or any(n.startswith(s) for s in selected)]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="osiu-bench-") as ws:
+        t0 = time.perf_counter()
+        params["raw_rows"] = _in_child(_prepare, ws, params)
+        print(f"workspace: {params['regions']} regions x {params['years']} years x {params['indicators']} "
+              f"indicators = {params['raw_rows']} raw rows ({time.perf_counter() - t0:.1f}s)")
+        for name in names:
+            results[name] = r = _in_child(_run_case, name, ws, params, repeat)
+            rss = f"{r['peak_rss_mb']:.0f} MiB" if r["peak_rss_mb"] is not None else "n/a"
+            print(f"{name:<28} {r['seconds']:9.4f}s  {r['items_per_s']:12.4g} items/s  peak RSS {rss}")
+    meta = {"scale": scale, "params": {k: v for k, v in params.items()}, "repeat": repeat,
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    return {"meta": meta, "results": results}
+
+
+def compare(current, baseline, threshold=0.2):
+    """Rows (case, metric, baseline, current, ratio, status) for time and peak RSS; status REGRESSION above 1+threshold."""
+    rows = []
+    for name, cur in current["results"].items():
+        ref = baseline.get("results", {}).get(name)
+        if ref is None:
+            rows.append((name, "seconds", None, cur["seconds"], None, "new"))
+            continue
+        for metric in ("seconds", "peak_rss_mb"):
+            a, b = ref.get(metric), cur.get(metric)
+            if not a or b is None:
+                continue
+            ratio = b / a
+            status = "REGRESSION" if ratio > 1 + threshold else ("faster" if ratio < 1 - threshold else "ok")
+            if metric == "peak_rss_mb" and status == "faster":
+                status = "smaller"
+            rows.append((name, metric, a, b, ratio, status))
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks")
+    ap.add_argument("--scale", choices=list(SCALES), default="small")
+    ap.add_argument("--regions", type=int, default=None)
+    ap.add_argument("--years", type=int, default=None)
+    ap.add_argument("--indicators", type=int, default=None)
+    ap.add_argument("--cases", nargs="+", default=None, help="case names or prefixes (e.g. compute_M simulate)")
+    ap.add_argument("--repeat", type=int, default=3, help="timed repetitions per case (best is reported)")
+    ap.add_argument("--out", default=None, help="write results JSON here (use as a later --baseline)")
+    ap.add_argument("--baseline", default=None, help="results JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown / RSS growth (0.2 = 20%%)")
+    args = ap.parse_args(argv)
+    res = run(args.scale, args.cases, args.repeat,
+              {"regions": args.regions, "years": args.years, "indicators": args.indicators})
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(res, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
+    if args.baseline:
+        from tabulate import tabulate
+        base = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if base.get("meta", {}).get("params", {}).get("raw_rows") != res["meta"]["params"]["raw_rows"]:
+            print("WARN: baseline was recorded at a different scale; ratios are not comparable")
+        rows = compare(res, base, args.threshold)
+        print(tabulate(rows, headers=["case", "metric", "baseline", "current", "ratio", "status"], floatfmt=".4g"))
+        if any(r[-1] == "REGRESSION" for r in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/synthetic.py
+# Synthetic workspaces for the benchmark suite: raw indicator CSVs in the data/raw schema
+# (region, year, value, id) plus a matching configs/indicators.yaml, at any
+# regions x years x indicators scale, and the in-memory panels the bench_* scripts feed their kernels.
+# Nothing is fetched.
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+LATENTS = ("kappa", "sigma", "rho", "phi")
+CONFIG = "configs/indicators.yaml"
+
+
+def indicator_ids(n_indicators):
+    """Indicator ids dealt round-robin over the latents: syn_<latent>_<k>."""
+    return [f"syn_{LATENTS[i % len(LATENTS)]}_{i // len(LATENTS)}" for i in range(n_indicators)]
+
+
+def config(n_indicators, seed=0):
+    rng = np.random.default_rng(seed)
+    latents = {c: {"direction": "negative" if c == "sigma" else "positive", "indicators": []} for c in LATENTS}
+    for id_ in indicator_ids(n_indicators):
+        latents[id_.split("_")[1]]["indicators"].append({"id": id_, "weight": round(float(rng.uniform(0.5, 1.5)), 3)})
+    return {
+        "output": {"interim_dir": "data/interim", "processed_dir": "data/processed",
+                   "format": "parquet", "csv_export": False},
+        "latents": latents,
+    }
+
+
+def raw_frame(id_, n_regions, n_years, missing=0.1, seed=0):
+    """One indicator's raw rows: a noisy per-region trend, with `missing` of the region-years absent."""
+    rng = np.random.default_rng(seed)
+    region = np.repeat([f"R{i:05d}" for i in range(n_regions)], n_years)
+    year = np.tile(np.arange(2024 - n_years + 1, 2025), n_regions)
+    level = np.repeat(rng.normal(0, 1, n_regions), n_years)
+    slope = np.repeat(rng.normal(0, 0.02, n_regions), n_years)
+    value = level + slope * (year - year.min()) + rng.normal(0, 0.1, len(year))
+    keep = rng.random(len(year)) >= missing
+    return pd.DataFrame({"region": region[keep], "year": year[keep], "value": value[keep], "id": id_})
+
+
+def write_workspace(root, n_regions, n_years, n_indicators, missing=0.1, seed=0):
+    """Write data/raw/*.csv and configs/indicators.yaml under `root`; returns the raw row count."""
+    root = Path(root)
+    raw = root / "data" / "raw"
+    raw.mkdir(parents=True, exist_ok=True)
+    (root / "configs").mkdir(parents=True, exist_ok=True)
+    (root / CONFIG).write_text(yaml.safe_dump(config(n_indicators, seed), sort_keys=False), encoding="utf-8")
+    rows = 0
+    for k, id_ in enumerate(indicator_ids(n_indicators)):
+        df = raw_frame(id_, n_regions, n_years, missing, seed=seed + k + 1)
+        df.to_csv(raw / f"{id_}.csv", index=False)
+        rows += len(df)
+    return rows
+
+
+def indicator_long(n_regions, n_years, n_indicators, missing=0.1, decimals=None):
+    """
+    Normalized long table (region, year, id, norm) of n_indicators raw_frame series, year as float
+    like the interim table; `decimals` rounds norm so that ranks have ties.
+    """
+    df = pd.concat([raw_frame(id_, n_regions, n_years, missing, seed=k + 1)
+                    for k, id_ in enumerate(indicator_ids(n_indicators))], ignore_index=True)
+    df["norm"] = df["value"] if decimals is None else df["value"].round(decimals)
+    df["year"] = df["year"].astype(float)
+    return df[["region", "year", "id", "norm"]]
+
+
+def logistic_panel(n_regions, n_years, n_series=5, missing=0.05, seed=0):
+    """(n_series, n_regions, n_years) noisy logistic-ish series in [0, 1] with `missing` of the cells NaN."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_years)
+    r = rng.normal(0.15, 0.05, (n_series, n_regions, 1))
+    t0 = rng.uniform(0.3 * n_years, 0.7 * n_years, (n_series, n_regions, 1))
+    Y = 0.9 / (1 + np.exp(-r * (t - t0))) + rng.normal(0, 0.03, (n_series, n_regions, n_years))
+    Y[rng.random(Y.shape) < missing] = np.nan
+    return Y
+
+
+def rho_sigma_frame(n_regions, n_years, missing=0.05, seed=0):
+    """Latents frame (region, year, sigma, rho) where rho partly follows -Δsigma."""
+    rng = np.random.default_rng(seed)
+    sigma = np.cumsum(rng.normal(0, 0.05, (n_regions, n_years)), axis=1)
+    rho = np.zeros((n_regions, n_years))
+    rho[:, 1:] = (-rng.uniform(0, 1, (n_regions, 1)) * np.diff(sigma, axis=1)
+                  + rng.normal(0, 0.05, (n_regions, n_years - 1)))
+    df = pd.DataFrame({"region": np.repeat([f"R{r:05d}" for r in range(n_regions)], n_years),
+                       "year": np.tile(1960 + np.arange(n_years), n_regions),
+                       "sigma": sigma.ravel(), "rho": rho.ravel()})
+    return df[rng.random(len(df)) >= missing].reset_index(drop=True)
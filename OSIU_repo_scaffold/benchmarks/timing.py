@@ -0,0 +1,27 @@
+# benchmarks/timing.py
+# Wall-time and peak-memory measurement shared by the bench_* scripts.
+import time
+import tracemalloc
+
+
+def timed(fn, repeat=1):
+    """(result, best wall seconds) of calling fn() `repeat` times; the result is the last call's."""
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def measured(fn):
+    """(result, wall seconds, peak traced Python memory in MiB) of one fn() call."""
+    tracemalloc.start()
+    try:
+        t0 = time.perf_counter()
+        out = fn()
+        wall = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+    return out, wall, peak
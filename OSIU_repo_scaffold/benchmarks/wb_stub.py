@@ -0,0 +1,141 @@
+# benchmarks/wb_stub.py
+# Local stand-in for the World Bank v2 API: canned JSON, real paging, multi-country paths.
+# Responses carry an ETag (If-None-Match -> 304); /files/<n>.csv serves an n-row CSV with
+# Range support for exercising chunked, resumable downloads. Indicators named BAD.* get an HTML
+# error page with status 200, as proxies and captive portals return; a request naming an unknown
+# country (code XXX) gets the API's own [{"message": [...]}] error payload, also with status 200.
+#
+#   python -m benchmarks.wb_stub --port 8765 --latency 0.05
+#   python -m src.etl.fetch_worldbank --config configs/datasources.yaml --base-url http://127.0.0.1:8765/v2
+import argparse
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+# ISO3 -> the 2-letter `country.id` the real API returns; synthetic codes map to themselves
+ISO2 = {"USA": "US", "GBR": "GB", "CAN": "CA", "DEU": "DE", "FRA": "FR", "JPN": "JP"}
+
+
+def canned_value(iso3, indicator, year):
+    """Deterministic pseudo-value in [-2.5, 2.5) so fetch modes can be compared row for row."""
+    h = zlib.crc32(f"{iso3}|{indicator}|{year}".encode())
+    return round((h % 50_000) / 10_000 - 2.5, 6)
+
+
+def _rows(countries, indicator, start, end):
+    rows = []
+    for iso3 in countries:
+        for year in range(end, start - 1, -1):
+            # the real API returns null values for missing years
+            value = None if (year + len(iso3)) % 7 == 0 else canned_value(iso3, indicator, year)
+            rows.append({
+                "indicator": {"id": indicator, "value": indicator},
+                "country": {"id": ISO2.get(iso3, iso3), "value": iso3},
+                "countryiso3code": iso3,
+                "date": str(year),
+                "value": value,
+                "unit": "", "obs_status": "", "decimal": 2,
+            })
+    return rows
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        srv = self.server
+        with srv.lock:
+            srv.requests += 1
+        if srv.latency:
+            time.sleep(srv.latency)
+        u = urlparse(self.path)
+        parts = [p for p in u.path.split("/") if p]
+        q = {k: v[0] for k, v in parse_qs(u.query).items()}
+        if parts and parts[0] == "files":
+            return self._file(int(parts[1].split(".")[0]))
+        try:
+            i = parts.index("country")
+            countries, indicator = parts[i + 1].split(";"), parts[i + 3]
+            start, end = (int(x) for x in q.get("date", "2000:2024").split(":"))
+        except (ValueError, IndexError):
+            return self._send(400, [{"message": [{"id": "120", "value": "Invalid value"}]}])
+        if "XXX" in countries:
+            return self._send(200, [{"message": [{"id": "120", "key": "Invalid value",
+                                                  "value": "The provided parameter value is not valid"}]}])
+        if indicator.startswith("BAD."):
+            return self._reply(200, b"<html><body>Service unavailable</body></html>", '"bad"', "text/html")
+        per_page = int(q.get("per_page", 50))
+        page = int(q.get("page", 1))
+        rows = _rows(countries, indicator, start, end)
+        pages = max(1, -(-len(rows) // per_page))
+        meta = {"page": page, "pages": pages, "per_page": per_page, "total": len(rows)}
+        self._send(200, [meta, rows[(page - 1) * per_page: page * per_page]])
+
+    def _file(self, n_rows):
+        body = self.server.files.get(n_rows)
+        if body is None:
+            lines = ["country,year,energy"] + [f"C{i % 97},{1900 + i % 120},{canned_value('F', i, 0)}"
+                                                for i in range(n_rows)]
+            body = self.server.files[n_rows] = ("\n".join(lines) + "\n").encode()
+        etag = f'"{zlib.crc32(body):08x}"'
+        rng = self.headers.get("Range")
+        if self.headers.get("If-None-Match") == etag:
+            return self._reply(304, b"", etag)
+        if rng and self.headers.get("If-Range", etag) == etag:
+            start = int(rng.split("=")[1].split("-")[0])
+            if start >= len(body):
+                return self._reply(416, b"", etag)
+            return self._reply(206, body[start:], etag, "text/csv",
+                               {"Content-Range": f"bytes {start}-{len(body) - 1}/{len(body)}"})
+        self._reply(200, body, etag, "text/csv")
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        etag = f'"{zlib.crc32(body):08x}"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            return self._reply(304, b"", etag)
+        self._reply(status, body, etag)
+
+    def _reply(self, status, body, etag, ctype="application/json", extra=None):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        for k, v in (extra or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port=0, latency=0.0):
+    """Start the stub in a daemon thread; returns (server, base_url). Call server.shutdown() when done."""
+    srv = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    srv.daemon_threads = True
+    srv.latency = latency
+    srv.requests = 0
+    srv.files = {}
+    srv.lock = threading.Lock()
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_address[1]}/v2"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = ap.parse_args()
+    srv, url = serve(args.port, args.latency)
+    print("World Bank stub at", url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -27,7 +27,7 @@ python -m src.model.compute_M --config configs\indicators.yaml
 
 
 echo === Generate plots ===
-python -c "from src.viz.plots import plot_timeseries, plot_M_heatmap; print(plot_timeseries('data/processed/latents.csv')); print(plot_M_heatmap('data/processed/M_timeseries.csv'))"
+python -m src.viz.plots
 
 echo === Done v0.8 pipeline ===
 ENDLOCAL
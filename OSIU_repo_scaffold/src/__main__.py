@@ -0,0 +1,7 @@
+# src/__main__.py
+# `python -m src` is the osiu CLI (see src/cli.py).
+import sys
+
+from src.cli import main
+
+sys.exit(main())
@@ -0,0 +1,117 @@
+# src/cli.py
+# `osiu` command line: one entry point for every stage, so several stages can share one interpreter.
+#
+#   python -m src <command> [args...]        # same arguments as python -m <module> of that command
+#   python -m src run normalize fit_latents compute_M plots [--config ...] [--trace]
+#
+# Only the standard library is imported here; a command's module (and with it pandas, matplotlib
+# or requests) is loaded when the command runs, so `--help` and light commands start fast.
+# Commands run the module's own `__main__` block, so flags and output match the per-module CLIs.
+import argparse
+import runpy
+import sys
+
+CONFIG = "configs/indicators.yaml"
+DATASOURCES = "configs/datasources.yaml"
+
+# name: (module, help, default arguments; default --options are added unless given)
+COMMANDS = {
+    "fetch": ("src.etl.fetch_all", "download raw indicators (World Bank, OWID)", ["--config", "{datasources}"]),
+    "validate": ("src.etl.validate_schema", "check raw CSVs against the indicator schema",
+                 ["--schema", "data/metadata/indicators_schema.csv", "--glob", "data/raw/*.csv"]),
+    "normalize": ("src.model.fit_latents", "normalize raw indicators only",
+                  ["--normalize-only", "--config", "{config}"]),
+    "fit_latents": ("src.model.fit_latents", "normalize and build the latent table", ["--config", "{config}"]),
+    "fit_weights": ("src.model.fit_weights", "fit sigma indicator weights (+ bootstrap CIs)", ["--config", "{config}"]),
+    "fit_dynamics": ("src.model.fit_dynamics", "batched ARX / logistic dynamics per region", ["--config", "{config}"]),
+    "compute_M": ("src.model.compute_M", "compute M(t) from the latents", ["--config", "{config}"]),
+    "corr_tests": ("src.validation.corr_tests", "rho vs Δsigma permutation tests per region (+ lags)",
+                   ["--config", "{config}"]),
+    "proxy_diagnostics": ("src.validation.proxy_diagnostics", "proxy agreement / variance-share flags per region and window",
+                          ["--config", "{config}"]),
+    "plots": ("src.viz.plots", "render time series and the M heatmap", []),
+    "sweep": ("src.model.sim_multigen_sweep", "multigenerational parameter sweep", []),
+    "sweep_plots": ("src.model.sim_multigen_sweep", "render the sweep panel from its stored output", ["--plot-only"]),
+    "lineage": ("src.model.lineage", "k-children-per-universe lineage over many generations", []),
+    "pipeline": ("src.pipeline", "incremental cached pipeline (run | clean)", ["run", "--config", "{config}"]),
+    "trace": ("src.trace", "summarize a trace file (report)", ["report"]),
+}
+# `run` stages, in the order they are executed when several are given
+STAGES = ["fetch", "validate", "normalize", "fit_latents", "fit_weights", "compute_M", "fit_dynamics", "plots"]
+
+
+def _with_defaults(argv, defaults):
+    """Default options (--flag [value]) the user did not pass are added; positional defaults only apply to no args."""
+    if not argv:
+        return list(defaults)
+    if not defaults or not defaults[0].startswith("-") or {"-h", "--help"} & set(argv):
+        return list(argv)
+    extra, i = [], 0
+    while i < len(defaults):
+        flag = defaults[i]
+        has_value = i + 1 < len(defaults) and not defaults[i + 1].startswith("-")
+        if not any(a == flag or a.startswith(flag + "=") for a in argv):
+            extra += defaults[i:i + 1 + has_value]
+        i += 1 + has_value
+    return extra + list(argv)
+
+
+def invoke(command, argv=None, config=CONFIG, datasources=DATASOURCES):
+    """Run a command's module as __main__ in this process, filling in its default arguments."""
+    module, _, defaults = COMMANDS[command]
+    argv = _with_defaults(argv, [a.format(config=config, datasources=datasources) for a in defaults])
+    saved = sys.argv
+    sys.argv = [module, *argv]
+    try:
+        runpy.run_module(module, run_name="__main__", alter_sys=True)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise
+    finally:
+        sys.argv = saved
+
+
+def run(stages, config=CONFIG, datasources=DATASOURCES):
+    """Run several stages with their default arguments in one process (pipeline order)."""
+    from src import trace
+
+    for stage in sorted(set(stages), key=STAGES.index):
+        print(f"=== {stage} ===")
+        with trace.span(f"osiu.{stage}"):
+            invoke(stage, config=config, datasources=datasources)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    width = max(map(len, COMMANDS))
+    epilog = "commands:\n" + "\n".join(f"  {n:<{width}}  {h}" for n, (_, h, _) in COMMANDS.items()) + \
+        f"\n  {'run':<{width}}  several stages in one process: run STAGE [STAGE ...] [--config] [--trace]" + \
+        "\n\n`python -m src <command> --help` shows a command's own arguments."
+    ap = argparse.ArgumentParser(prog="osiu", usage="python -m src <command> [args ...]",
+                                 formatter_class=argparse.RawDescriptionHelpFormatter, epilog=epilog)
+    ap.add_argument("command", choices=[*COMMANDS, "run"], help=argparse.SUPPRESS)
+    if not argv or argv[0] in ("-h", "--help"):
+        ap.print_help()
+        return 0
+    args = ap.parse_args(argv[:1])
+    rest = argv[1:]
+
+    if args.command != "run":
+        invoke(args.command, rest or None)
+        return 0
+
+    from src import trace
+
+    rp = argparse.ArgumentParser(prog="osiu run")
+    rp.add_argument("stages", nargs="+", choices=STAGES)
+    rp.add_argument("--config", default=CONFIG)
+    rp.add_argument("--datasources", default=DATASOURCES)
+    trace.add_arguments(rp)
+    ra = rp.parse_args(rest)
+    with trace.session(ra, "osiu.run", stages=ra.stages):
+        run(ra.stages, ra.config, ra.datasources)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,18 @@
-
 import argparse, sys
 from pathlib import Path
-from src.etl.fetch_worldbank import main as wb_main
-from src.etl.fetch_owid import main as owid_main
+import yaml
+from src import trace
+
+def main(config_path: str, offline: bool = False):
+    # requests is loaded only when something is actually fetched
+    from src.etl.http_cache import HttpCache
+    from src.etl.fetch_owid import main as owid_main
+    from src.etl.fetch_worldbank import main as wb_main
 
-def main(config_path: str):
-    wb_main(config_path, outdir="data/raw")
-    owid_main(url=None, outdir="data/raw")
+    cfg = yaml.safe_load(Path(config_path).read_text())
+    wb_main(config_path, outdir="data/raw", offline=offline)
+    owid_main(url=cfg.get("owid", {}).get("energy_csv_url"), outdir="data/raw",
+              cache=HttpCache.from_config(cfg, offline=offline))
     # Emit instructions for manual files
     expected = ["ucdp_conflict.csv", "happiness_index.csv", "diversity_index.csv"]
     missing = [f for f in expected if not Path("data/raw", f).exists()]
@@ -16,5 +22,8 @@ def main(config_path: str):
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True)
+    ap.add_argument("--offline", action="store_true", help="serve World Bank/OWID data from the local HTTP cache only")
+    trace.add_arguments(ap)
     args = ap.parse_args()
-    main(args.config)
+    with trace.session(args, "fetch_all"):
+        main(args.config, args.offline)
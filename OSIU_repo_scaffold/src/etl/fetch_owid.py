@@ -1,17 +1,36 @@
 
 import argparse
-import pandas as pd
+import requests
 from pathlib import Path
 
-def main(url: str, outdir: str = "data/raw"):
-    out = Path(outdir); out.mkdir(parents=True, exist_ok=True)
-    # We do not fetch in this offline scaffold; we just record placeholder instructions.
-    meta = pd.DataFrame([{"note": "Download OWID energy CSV from the configured URL and place under data/raw/owid_energy.csv"}])
-    meta.to_csv(out / "OWID_README.csv", index=False)
+from src import trace
+from src.etl.http_cache import HttpCache
+from src.etl.fetch_worldbank import _session_with_retries
+
+URL = "https://raw.githubusercontent.com/owid/energy-data/master/owid-energy-data.csv"
+# Kept out of data/raw/*.csv: the OWID file is wide-format and not yet mapped to region/year/value/id
+DEST = "owid/owid-energy-data.csv"
+
+def main(url: str | None = None, outdir: str = "data/raw", cache: HttpCache | None = None, offline: bool = False):
+    """Download the OWID energy CSV in chunks (resumable; revalidated with ETag/Last-Modified)."""
+    dest = Path(outdir) / DEST
+    cache = cache or HttpCache(offline=offline)
+    with trace.span("fetch.owid") as sp:
+        try:
+            status = cache.download(_session_with_retries(), url or URL, dest)
+        except requests.exceptions.RequestException as e:
+            print(f"WARN: OWID download failed: {e}")
+            return None
+        sp.add(bytes_written=dest.stat().st_size if status == "downloaded" else 0)
+    print(f"OWID energy CSV {status}: {dest} ({dest.stat().st_size / 2**20:.1f} MiB)")
+    return dest
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
-    ap.add_argument("--url", required=False, default="https://raw.githubusercontent.com/owid/energy-data/master/owid-energy-data.csv")
+    ap.add_argument("--url", required=False, default=URL)
     ap.add_argument("--outdir", default="data/raw")
+    ap.add_argument("--offline", action="store_true", help="use the previously downloaded file only")
+    trace.add_arguments(ap)
     args = ap.parse_args()
-    main(args.url, args.outdir)
+    with trace.session(args, "fetch_owid"):
+        main(args.url, args.outdir, offline=args.offline)
@@ -1,15 +1,24 @@
-
 import argparse
+import json
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
 import requests
 import pandas as pd
-from pathlib import Path
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-API = "https://api.worldbank.org/v2/country/{country}/indicator/{indicator}?date={start}:{end}&format=json&per_page=20000"
+from src import trace
+from src.etl.http_cache import HttpCache
+
+API_BASE = "https://api.worldbank.org/v2"
+API = "{base}/country/{country}/indicator/{indicator}"
+PER_PAGE = 1000  # rows per page; further pages are followed from the response's `pages` field
+BATCH = 50  # countries per request (country/USA;GBR;...)
 
-def _session_with_retries(total=5, backoff_factor=0.8, status_forcelist=(429, 500, 502, 503, 504)):
+def _session_with_retries(total=5, backoff_factor=0.8, status_forcelist=(429, 500, 502, 503, 504), pool_size=10):
     session = requests.Session()
     retry = Retry(
         total=total,
@@ -20,30 +29,200 @@ def _session_with_retries(total=5, backoff_factor=0.8, status_forcelist=(429, 50
         allowed_methods=("GET",),
         raise_on_status=False,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    # one keep-alive pool per host, large enough that concurrent workers never open throwaway connections
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
 
 
-def fetch_indicator(country, indicator, start, end, timeout=60, session: requests.Session | None = None):
-    url = API.format(country=country, indicator=indicator, start=start, end=end)
+class ApiError(ValueError):
+    """An error payload ([{"message": [...]}], sent with status 200), e.g. for an unknown country code."""
+
+
+class TokenBucket:
+    """Thread-safe rate limiter: `rate` requests per second with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait_s = (1.0 - self.tokens) / self.rate
+            time.sleep(wait_s)
+
+
+class _Throttled:
+    """Session wrapper that takes a token before each GET."""
+
+    def __init__(self, session, bucket):
+        self.session, self.bucket = session, bucket
+
+    def get(self, *args, **kwargs):
+        if self.bucket is not None:
+            self.bucket.acquire()
+        return self.session.get(*args, **kwargs)
+
+
+def _parse(body):
+    """Decoded JSON of a response; ValueError for a malformed body, ApiError for an error payload."""
+    js = json.loads(body)
+    if isinstance(js, list) and js and isinstance(js[0], dict) and "message" in js[0]:
+        # errors come back as [{"message": [...]}] with status 200; one bad code fails the whole request
+        raise ApiError("; ".join(str(m.get("value", m)) if isinstance(m, dict) else str(m)
+                                 for m in js[0]["message"] or []) or "error payload")
+    return js
+
+
+def fetch_page(countries, indicator, start, end, page=1, per_page=PER_PAGE, base=API_BASE,
+               timeout=60, session: requests.Session | None = None, bucket: TokenBucket | None = None,
+               cache: HttpCache | None = None):
+    """One page of an indicator for one or more countries: (meta, rows)."""
+    country = ";".join(countries) if isinstance(countries, (list, tuple)) else countries
+    url = API.format(base=base.rstrip("/"), country=country, indicator=indicator)
+    params = {"date": f"{start}:{end}", "format": "json", "per_page": per_page, "page": page}
     sess = session or _session_with_retries()
-    r = sess.get(url, timeout=timeout)
-    r.raise_for_status()
-    js = r.json()
+    with trace.span("fetch.request", indicator=indicator, page=page, countries=country.count(";") + 1) as sp:
+        if cache is not None:
+            # the bucket only throttles real requests; fresh cache hits return immediately
+            body = cache.get(_Throttled(sess, bucket), url, params=params, timeout=timeout)
+        else:
+            if bucket is not None:
+                bucket.acquire()
+            r = sess.get(url, params=params, timeout=timeout)
+            r.raise_for_status()
+            body = r.content
+        sp.add(bytes_read=len(body))
+        try:
+            js = _parse(body)
+        except ValueError:
+            if cache is not None:
+                cache.discard(url, params)  # an error page must not be served from the cache on reruns
+            raise
     if not isinstance(js, list) or len(js) < 2:
-        return pd.DataFrame()
-    rows = js[1] or []
+        return (js[0] if isinstance(js, list) and js else {}), []
+    return js[0] or {}, js[1] or []
+
+
+def _rows_to_frames(rows, requested):
+    """Split API rows into {requested country code: DataFrame(region, year, value)}."""
+    wanted = set(requested)
+    out = {}
+    for row in rows:
+        if row.get("value") is None:
+            continue
+        iso3 = row.get("countryiso3code")
+        iso2 = row.get("country", {}).get("id")
+        key = iso3 if iso3 in wanted else iso2
+        out.setdefault(key, []).append(
+            {"region": iso2, "year": int(row["date"]), "value": float(row["value"])})
+    return {k: pd.DataFrame(v) for k, v in out.items()}
+
+
+def fetch_indicator(country, indicator, start, end, timeout=60, session: requests.Session | None = None,
+                    per_page=PER_PAGE, base=API_BASE, bucket: TokenBucket | None = None,
+                    cache: HttpCache | None = None):
+    sess = session or _session_with_retries()
+    meta, rows = fetch_page(country, indicator, start, end, 1, per_page, base, timeout, sess, bucket, cache)
+    for page in range(2, int(meta.get("pages", 1) or 1) + 1):
+        rows += fetch_page(country, indicator, start, end, page, per_page, base, timeout, sess, bucket, cache)[1]
     df = pd.DataFrame([
         {"region": row.get("country", {}).get("id"),
          "year": int(row["date"]),
          "value": float(row["value"]) if row["value"] is not None else None}
         for row in rows
-    ])
+    ], columns=["region", "year", "value"])
     return df.dropna()
 
-def main(config_path: str, outdir: str = "data/raw"):
+
+def _write(out, code, c, df):
+    if df is None or df.empty:
+        print(f"INFO: No data for {c} {code}")
+        return 0
+    df = df.sort_values("year", ascending=False).reset_index(drop=True)
+    df["id"] = f"worldbank_{code}"
+    fp = out / f"worldbank_{code}_{c}.csv"
+    df.to_csv(fp, index=False)
+    trace.count(rows=len(df), bytes_written=fp.stat().st_size if trace.enabled() else None)
+    return 1
+
+
+def fetch_sequential(out, indicators, countries, start, end, sess, bucket, per_page, base, cache=None):
+    written = 0
+    for code in indicators:
+        for c in countries:
+            try:
+                df = fetch_indicator(c, code, start, end, session=sess, per_page=per_page, base=base,
+                                     bucket=bucket, cache=cache)
+            except (requests.exceptions.RequestException, ValueError) as e:  # ValueError: malformed JSON, ApiError
+                print(f"WARN: World Bank fetch failed for {c} {code}: {e}")
+                continue
+            written += _write(out, code, c, df)
+    return written
+
+
+def fetch_concurrent(out, indicators, countries, start, end, sess, bucket, per_page, base,
+                     workers=8, batch=BATCH, cache=None):
+    """
+    Fetch every (indicator, batch of countries) concurrently on a bounded thread pool.
+    Page 1 of each request reports `pages`; the remaining pages are queued as soon as
+    it arrives, so large indicators are paged in parallel too. A batch that fails (e.g. an
+    error payload for one unknown code) is retried one country at a time, so only the
+    countries that fail on their own are lost.
+    """
+    units = [(code, tuple(countries[i:i + batch])) for code in indicators for i in range(0, len(countries), batch)]
+    rows = {}  # (code, batch) -> list of rows
+    failed = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(code, b, page):
+            f = pool.submit(fetch_page, list(b), code, start, end, page, per_page, base, 60, sess, bucket, cache)
+            pending[f] = (code, b, page)
+
+        pending = {}
+        for code, b in units:
+            submit(code, b, 1)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                code, b, page = pending.pop(f)
+                try:
+                    meta, page_rows = f.result()
+                except (requests.exceptions.RequestException, ValueError) as e:  # malformed JSON, ApiError
+                    print(f"WARN: World Bank fetch failed for {';'.join(b)} {code} (page {page}): {e}")
+                    if (code, b) not in failed and len(b) > 1:
+                        for c in b:
+                            units.append((code, (c,)))
+                            submit(code, (c,), 1)
+                    failed.add((code, b))
+                    continue
+                rows.setdefault((code, b), []).extend(page_rows)
+                if page == 1:
+                    for p in range(2, int(meta.get("pages", 1) or 1) + 1):
+                        submit(code, b, p)
+
+    written = 0
+    for code, b in units:
+        if (code, b) in failed:
+            continue  # a partial batch would silently drop years; leave the old files in place
+        frames = _rows_to_frames(rows.get((code, b), []), b)
+        for c in b:
+            written += _write(out, code, c, frames.get(c))
+    return written
+
+
+def main(config_path: str, outdir: str = "data/raw", mode: str | None = None, workers: int | None = None,
+         rate: float | None = None, base_url: str | None = None, offline: bool = False, use_cache: bool = True):
     import yaml
     out = Path(outdir); out.mkdir(parents=True, exist_ok=True)
     cfg = yaml.safe_load(Path(config_path).read_text())
@@ -51,28 +230,41 @@ def main(config_path: str, outdir: str = "data/raw"):
     start = wb.get("start_year", 2000)
     end = wb.get("end_year", 2024)
     countries = wb.get("countries", ["USA"])
-    indicators = wb.get("indicators", [{"code": "GE.EST"}])
-    sess = _session_with_retries()
+    indicators = [ind["code"] for ind in wb.get("indicators", [{"code": "GE.EST"}])]
+    mode = mode or wb.get("mode", "concurrent")
+    workers = int(workers or wb.get("workers", 8))
+    bucket = TokenBucket(rate or wb.get("rate_per_sec", 10.0), wb.get("burst"))
+    per_page = int(wb.get("per_page", PER_PAGE))
+    base = base_url or wb.get("base_url", API_BASE)
+    sess = _session_with_retries(pool_size=workers)
+    cache = HttpCache.from_config(cfg, offline=offline) if use_cache or offline else None
 
-    for ind in indicators:
-        code = ind["code"]
-        for c in countries:
-            try:
-                df = fetch_indicator(c, code, start, end, session=sess)
-            except requests.exceptions.RequestException as e:
-                print(f"WARN: World Bank fetch failed for {c} {code}: {e}")
-                continue
-            if df.empty:
-                print(f"INFO: No data for {c} {code}")
-                continue
-            df["id"] = f"worldbank_{code}"
-            fp = out / f"worldbank_{code}_{c}.csv"
-            df.to_csv(fp, index=False)
-            time.sleep(0.5)
+    t0 = time.perf_counter()
+    with trace.span("fetch.worldbank", mode=mode, workers=workers, indicators=len(indicators),
+                    countries=len(countries)):
+        if mode == "sequential":
+            n = fetch_sequential(out, indicators, countries, start, end, sess, bucket, per_page, base, cache)
+        else:
+            n = fetch_concurrent(out, indicators, countries, start, end, sess, bucket, per_page, base,
+                                 workers=workers, batch=int(wb.get("batch_size", BATCH)), cache=cache)
+    print(f"Wrote {n} World Bank files to {out} in {time.perf_counter() - t0:.1f}s ({mode})")
+    if cache is not None:
+        print("HTTP cache:", cache.summary())
+    return n
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True)
     ap.add_argument("--outdir", default="data/raw")
+    ap.add_argument("--mode", choices=["concurrent", "sequential"], default=None,
+                    help="concurrent (default): batched countries on a thread pool; sequential: one request at a time")
+    ap.add_argument("--workers", type=int, default=None, help="concurrent requests (default 8)")
+    ap.add_argument("--rate", type=float, default=None, help="max requests per second (default 10)")
+    ap.add_argument("--base-url", default=None, help="API root, e.g. a local stub server")
+    ap.add_argument("--offline", action="store_true", help="serve only from the HTTP cache; never hit the network")
+    ap.add_argument("--no-cache", action="store_true", help="bypass the HTTP cache")
+    trace.add_arguments(ap)
     args = ap.parse_args()
-    main(args.config, args.outdir)
+    with trace.session(args, "fetch_worldbank"):
+        main(args.config, args.outdir, args.mode, args.workers, args.rate, args.base_url,
+             offline=args.offline, use_cache=not args.no_cache)
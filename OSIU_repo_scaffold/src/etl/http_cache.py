@@ -0,0 +1,192 @@
+# src/etl/http_cache.py
+# On-disk HTTP response cache for the fetchers: conditional requests, TTL, offline mode, LRU eviction.
+#
+# Each cached GET is two files under the cache root, keyed by sha256(url + sorted params):
+#   <key>.body  response body
+#   <key>.json  url, ETag, Last-Modified, fetched_at, size (its mtime is the LRU access time)
+# A caller that cannot parse a cached body `discard`s it, so an error page is never served again.
+# Large files go through `download`, which streams to their own destination path in chunks and
+# resumes a partial `.part` file with a Range request; only their metadata lives in the cache.
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+DEFAULT_DIR = ".cache/http"
+DEFAULT_TTL = 24 * 3600  # seconds before a cached entry is revalidated
+DEFAULT_MAX_BYTES = 512 * 2**20
+CHUNK = 2**20
+
+
+class CacheMiss(requests.exceptions.RequestException):
+    """Raised in offline mode when a URL has never been fetched."""
+
+
+def cache_key(url, params=None):
+    items = sorted((params or {}).items())
+    return hashlib.sha256(json.dumps([url, items], default=str).encode()).hexdigest()
+
+
+class HttpCache:
+    def __init__(self, root=DEFAULT_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.stats = {"fresh": 0, "revalidated": 0, "downloaded": 0, "offline": 0}
+
+    @classmethod
+    def from_config(cls, cfg, offline=False):
+        """Build from the `cache:` section of datasources.yaml (dir, ttl_hours, max_mb)."""
+        c = (cfg or {}).get("cache", {}) or {}
+        return cls(c.get("dir", DEFAULT_DIR), float(c.get("ttl_hours", DEFAULT_TTL / 3600)) * 3600,
+                   int(float(c.get("max_mb", DEFAULT_MAX_BYTES / 2**20)) * 2**20), offline)
+
+    def _meta(self, key):
+        fp = self.root / f"{key}.json"
+        try:
+            return json.loads(fp.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key, meta):
+        fp = self.root / f"{key}.json"
+        tmp = fp.with_suffix(f".json.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, fp)
+
+    def _touch(self, key):
+        try:
+            os.utime(self.root / f"{key}.json")
+        except OSError:
+            pass
+
+    def _count(self, what):
+        with self.lock:
+            self.stats[what] += 1
+
+    @staticmethod
+    def _validators(meta):
+        h = {}
+        if meta and meta.get("etag"):
+            h["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            h["If-Modified-Since"] = meta["last_modified"]
+        return h
+
+    def discard(self, url, params=None):
+        """Drop a cached response, e.g. one its caller could not parse (so it is not served again)."""
+        key = cache_key(url, params)
+        for suffix in (".body", ".json"):
+            (self.root / f"{key}{suffix}").unlink(missing_ok=True)
+
+    def get(self, session, url, params=None, timeout=60):
+        """Response body for a GET, from cache when fresh (or offline), else via a conditional request."""
+        key = cache_key(url, params)
+        body_fp = self.root / f"{key}.body"
+        meta = self._meta(key)
+        have = meta is not None and body_fp.exists()
+        if have and (self.offline or time.time() - meta["fetched_at"] < self.ttl):
+            self._touch(key)
+            self._count("offline" if self.offline else "fresh")
+            return body_fp.read_bytes()
+        if self.offline:
+            raise CacheMiss(f"offline and not cached: {url}")
+
+        r = session.get(url, params=params, timeout=timeout, headers=self._validators(meta) if have else {})
+        if r.status_code == 304 and have:
+            meta["fetched_at"] = time.time()
+            self._write_meta(key, meta)
+            self._count("revalidated")
+            return body_fp.read_bytes()
+        r.raise_for_status()
+        tmp = body_fp.with_suffix(f".body.{threading.get_ident()}.tmp")
+        tmp.write_bytes(r.content)
+        os.replace(tmp, body_fp)
+        self._write_meta(key, {"url": url, "params": params, "etag": r.headers.get("ETag"),
+                               "last_modified": r.headers.get("Last-Modified"),
+                               "fetched_at": time.time(), "size": len(r.content)})
+        self._count("downloaded")
+        self.evict()
+        return r.content
+
+    def download(self, session, url, dest, timeout=60, chunk=CHUNK):
+        """
+        Stream `url` to `dest` in `chunk`-byte pieces. An existing `dest` is revalidated
+        (or kept as-is within the TTL / offline); an interrupted download left at
+        `dest.part` resumes with a Range request guarded by If-Range.
+        Returns "fresh", "revalidated" or "downloaded".
+        """
+        dest = Path(dest)
+        part = dest.with_name(dest.name + ".part")
+        key = cache_key(url)
+        meta = self._meta(key) or {}
+        if dest.exists() and (self.offline or (meta and time.time() - meta.get("fetched_at", 0) < self.ttl)):
+            self._count("offline" if self.offline else "fresh")
+            return "fresh"
+        if self.offline:
+            raise CacheMiss(f"offline and not downloaded: {url}")
+
+        headers = {}
+        if dest.exists():
+            headers.update(self._validators(meta))
+        offset = part.stat().st_size if part.exists() else 0
+        if offset and meta.get("partial_validator"):
+            headers = {"Range": f"bytes={offset}-", "If-Range": meta["partial_validator"]}
+        else:
+            offset = 0
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with session.get(url, headers=headers, timeout=timeout, stream=True) as r:
+            if r.status_code == 416 and offset:
+                # stale .part longer than the file: discard it and start over once, without a Range
+                # (a 416 to that plain request raises below)
+                part.unlink(missing_ok=True)
+                return self.download(session, url, dest, timeout, chunk)
+            if r.status_code == 304:
+                meta["fetched_at"] = time.time()
+                self._write_meta(key, meta)
+                self._count("revalidated")
+                return "revalidated"
+            r.raise_for_status()
+            if r.status_code != 206:
+                offset = 0  # server ignored the range (or the file changed): start over
+            validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+            meta.update({"url": url, "etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified"),
+                         "partial_validator": validator, "size": 0})
+            self._write_meta(key, meta)
+            with open(part, "ab" if offset else "wb") as f:
+                for block in r.iter_content(chunk_size=chunk):
+                    f.write(block)
+        os.replace(part, dest)
+        meta.pop("partial_validator", None)
+        meta["size"] = dest.stat().st_size
+        meta["fetched_at"] = time.time()
+        self._write_meta(key, meta)
+        self._count("downloaded")
+        return "downloaded"
+
+    def evict(self):
+        """Drop least-recently-used bodies until the cache fits in max_bytes."""
+        with self.lock:
+            entries = []
+            for fp in self.root.glob("*.json"):
+                body = fp.with_suffix(".body")
+                if body.exists():
+                    st = fp.stat()
+                    entries.append((st.st_mtime, body.stat().st_size, fp, body))
+            total = sum(e[1] for e in entries)
+            for _, size, fp, body in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                body.unlink(missing_ok=True)
+                fp.unlink(missing_ok=True)
+                total -= size
+
+    def summary(self):
+        return ", ".join(f"{k} {v}" for k, v in self.stats.items())
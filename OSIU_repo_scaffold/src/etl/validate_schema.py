@@ -1,45 +1,300 @@
+# src/etl/validate_schema.py
+# Raw-file validation against data/metadata/indicators_schema.csv:
+#   column,dtype,required,key,min,max,notes
+# Headers are checked from the first bytes of each file; files with every required column are then
+# read (small ones whole with the csv module and checked together, large ones streamed in record
+# batches) and checked with vectorized masks for dtypes (str/int/float; ints must be integral), min/max ranges,
+# duplicate keys (the `key` columns, i.e. region, year, id) and missing values (warnings only:
+# the normalizer drops incomplete rows). Files are validated in parallel batches, and results
+# are cached per file content hash (plus schema and validator version) in .cache/validate/, so
+# unchanged files are not re-read.
+#
+#   python -m src.etl.validate_schema --schema data/metadata/indicators_schema.csv --glob 'data/raw/*.csv'
+import argparse, csv, glob, hashlib, json, sys
+from pathlib import Path
 
-import argparse, glob, sys
+import numpy as np
 import pandas as pd
 
-def validate(df: pd.DataFrame) -> bool:
-    required = {"region": "object", "year": "int64", "value": "float64", "id": "object"}
-    ok = True
-    for col, dt in required.items():
-        if col not in df.columns:
-            print(f"Missing column: {col}")
-            ok = False
+from src import trace
+
+SCHEMA = "data/metadata/indicators_schema.csv"
+CACHE = Path(".cache/validate/results.json")
+CHUNK_ROWS = 250_000
+HEADER_BYTES = 64 * 1024
+SMALL_BYTES = 8 * 2**20  # files up to this size are read whole with the csv module
+NA = ("", "NA", "N/A", "NaN", "nan", "NULL", "null", "None", "#N/A")  # read_csv's usual missing markers
+NUMERIC = ("int", "float")
+
+def _flag(v):
+    return str(v).strip().lower() in ("true", "1", "yes")
+
+def _bound(v):
+    return float(v) if str(v).strip() not in ("", "nan", "None") else None
+
+def load_schema(schema_csv: str = SCHEMA) -> dict:
+    """{column: {dtype, required, key, min, max}} from the schema CSV (key/min/max columns optional)."""
+    with open(schema_csv, newline="", encoding="utf-8-sig") as fh:
+        rows = list(csv.DictReader(line for line in fh if line.strip()))
+    return {r["column"].strip(): {"dtype": r.get("dtype", "str").strip(), "required": _flag(r.get("required", True)),
+                                  "key": _flag(r.get("key", False)), "min": _bound(r.get("min", "")),
+                                  "max": _bound(r.get("max", ""))} for r in rows}
+
+def read_header(fp, nbytes: int = HEADER_BYTES) -> list:
+    """Column names from the first line, reading at most `nbytes` (no full parse)."""
+    with open(fp, "rb") as fh:
+        head = fh.read(nbytes)
+    line = head.split(b"\n", 1)[0].rstrip(b"\r").decode("utf-8-sig", errors="replace")
+    return [c.strip() for c in next(csv.reader([line]), [])]
+
+def check_header(columns, schema) -> list:
+    return [f"missing column: {c}" for c, rule in schema.items() if rule["required"] and c not in columns]
+
+def validate(df: pd.DataFrame, schema: dict | None = None) -> bool:
+    """Header check of an already loaded frame (kept for callers that hold a DataFrame)."""
+    errors = check_header(list(df.columns), schema or load_schema())
+    for e in errors:
+        print(e.capitalize())
+    return not errors
+
+def validate_file(fp, schema: dict, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """{ok, rows, bytes, errors, warnings} for one raw CSV; every message names the first offending line."""
+    return validate_batch([fp], schema, chunk_rows)[0]
+
+def _read_small(fp, schema):
+    """Raw string columns, line numbers and row count of a small file via the csv module (no pandas overhead)."""
+    with open(fp, newline="", encoding="utf-8-sig") as fh:
+        reader = csv.reader(fh)
+        header = [c.strip() for c in next(reader, [])]
+        rows, lines = [], []
+        for r in reader:
+            if not r:
+                continue
+            if len(r) > len(header):
+                raise ValueError(f"line {reader.line_num} has {len(r)} fields, expected {len(header)}")
+            rows.append(r)
+            lines.append(reader.line_num)
+    cols = {}
+    for c in schema:
+        i = header.index(c) if c in header else None
+        cols[c] = [""] * len(rows) if i is None else [r[i] if i < len(r) else "" for r in rows]
+    return cols, lines, len(rows)
+
+def _read_chunks(fp, schema, chunk_rows):
+    """The same as _read_small, streamed in record batches for large files (pyarrow rejects ragged rows)."""
+    import pyarrow as pa
+    import pyarrow.csv as pcsv
+
+    present = [c for c in schema if c in read_header(fp)]
+    # all columns as raw strings (empty stays ""), so missing values are decided in one place
+    reader = pcsv.open_csv(fp, read_options=pcsv.ReadOptions(block_size=max(1 << 16, chunk_rows * 64)),
+                           convert_options=pcsv.ConvertOptions(include_columns=present,
+                                                               column_types={c: pa.string() for c in present}))
+    start = 2
+    for batch in reader:
+        n = batch.num_rows
+        yield ({c: batch.column(c).to_numpy(zero_copy_only=False) if c in present else [""] * n for c in schema},
+               np.arange(start, start + n), n)
+        start += n
+
+def _frames(files, codes, schema, chunk_rows, results):
+    """
+    Rows of the given files as {column: raw strings, _file: code, _line: line number} blocks of about
+    `chunk_rows` rows. Small files are read whole and concatenated, large ones streamed in chunks.
+    Unparseable files get an error.
+    """
+    buf, size = {c: [] for c in [*schema, "_file", "_line"]}, 0
+
+    def flush():
+        block = {c: np.concatenate([np.asarray(p, dtype=object) for p in buf[c]]) for c in schema}
+        block.update({c: np.concatenate(buf[c]).astype(np.int64) for c in ("_file", "_line")})
+        for parts in buf.values():
+            parts.clear()
+        return block
+
+    for code in codes:
+        fp = files[code]
+        try:
+            if results[code]["bytes"] <= SMALL_BYTES:
+                chunks = [_read_small(fp, schema)]
+            else:
+                chunks = _read_chunks(fp, schema, chunk_rows)
+            for cols, lines, n in chunks:
+                for c in schema:
+                    buf[c].append(cols[c])
+                buf["_file"].append(np.full(n, code))
+                buf["_line"].append(np.asarray(lines))
+                size += n
+                if size >= chunk_rows:
+                    yield flush()
+                    size = 0
+        except (ValueError, csv.Error, pd.errors.ParserError, UnicodeDecodeError) as e:
+            results[code]["errors"].append(f"unparseable: {e}")
+    if size:
+        yield flush()
+
+def validate_batch(files, schema: dict, chunk_rows: int = CHUNK_ROWS) -> list:
+    """
+    Validate several files with one set of vectorized checks per ~chunk_rows rows (per-file pandas
+    overhead would dominate thousands of small files). Problems are attributed per file by code.
+    """
+    results = [{"ok": False, "rows": 0, "bytes": Path(fp).stat().st_size, "errors": [], "warnings": []}
+               for fp in files]
+    readable = []
+    for code, fp in enumerate(files):
+        try:
+            results[code]["errors"] = check_header(read_header(fp), schema)
+        except OSError as e:
+            results[code]["errors"] = [f"unreadable: {e}"]
+        if not results[code]["errors"]:
+            readable.append(code)
+
+    keys = [c for c in schema if schema[c]["key"]]
+    problems = [{} for _ in files]  # per file: message -> [count, first line]
+    hashes, key_codes, key_lines = [], [], []
+
+    for block in _frames(files, readable, schema, chunk_rows, results):
+        codes, lines = block["_file"], block["_line"]
+        rows = np.bincount(codes, minlength=len(files))
+        for code in np.flatnonzero(rows):
+            results[code]["rows"] += int(rows[code])
+
+        def note(msg, mask):
+            if not mask.any():
+                return
+            hit, first, n = np.unique(codes[mask], return_index=True, return_counts=True)
+            for code, line, k in zip(hit, lines[mask][first], n):
+                p = problems[code].setdefault(msg, [0, int(line)])
+                p[0] += int(k)
+
+        typed = {}
+        for c, rule in schema.items():
+            s = pd.Series(block[c], dtype=object)
+            null = s.isin(NA).to_numpy()
+            if rule["required"]:
+                note(f"missing {c}", null)
+            if rule["dtype"] not in NUMERIC:
+                typed[c] = s.where(~null)
+                continue
+            num = pd.to_numeric(s.where(~null), errors="coerce").to_numpy(dtype=float)
+            note(f"{c} not {rule['dtype']}", ~null & np.isnan(num))
+            if rule["dtype"] == "int":
+                note(f"{c} not integral", np.isfinite(num) & (num % 1 != 0))
+            with np.errstate(invalid="ignore"):
+                if rule["min"] is not None:
+                    note(f"{c} < {rule['min']:g}", num < rule["min"])
+                if rule["max"] is not None:
+                    note(f"{c} > {rule['max']:g}", num > rule["max"])
+            typed[c] = num
+        if keys:
+            # keys are per file; 2000 and 2000.0 are the same key, so numeric columns are hashed as parsed
+            hashes.append(pd.util.hash_pandas_object(pd.DataFrame({"_file": codes, **{k: typed[k] for k in keys}}),
+                                                     index=False).to_numpy())
+            key_codes.append(codes)
+            key_lines.append(lines)
+
+    if hashes:
+        h, codes, lines = np.concatenate(hashes), np.concatenate(key_codes), np.concatenate(key_lines)
+        _, first = np.unique(h, return_index=True)
+        if len(first) < len(h):
+            dup = np.ones(len(h), dtype=bool)
+            dup[first] = False
+            order = np.argsort(codes[dup], kind="stable")
+            hit, start, n = np.unique(codes[dup][order], return_index=True, return_counts=True)
+            for code, i, k in zip(hit, start, n):
+                problems[code][f"duplicate ({', '.join(keys)}) key"] = [int(k), int(lines[dup][order][i:i + k].min())]
+
+    for res, probs in zip(results, problems):
+        for msg, (n, line) in probs.items():
+            target = res["warnings"] if msg.startswith("missing ") else res["errors"]
+            target.append(f"{msg}: {n} row{'s' if n > 1 else ''} (first at line {line})")
+        if not res["rows"] and not res["errors"]:
+            res["warnings"].append("no data rows")
+        res["ok"] = not res["errors"]
+    return results
+
+def _validate_batch(task):
+    files, schema, chunk_rows = task
+    return validate_batch(files, schema, chunk_rows)
+
+def _file_sha(fp, prev=None):
+    """Content hash of a file, reusing the cached one while size and mtime are unchanged."""
+    st = Path(fp).stat()
+    stat = [st.st_size, st.st_mtime_ns]
+    if prev and prev.get("stat") == stat:
+        return prev["sha"], stat
+    with open(fp, "rb") as fh:
+        return hashlib.file_digest(fh, "sha256").hexdigest()[:16], stat
+
+def validate_files(files, schema_csv: str = SCHEMA, workers: int = 0, force: bool = False,
+                   chunk_rows: int = CHUNK_ROWS, cache: Path | None = CACHE):
+    """
+    Validate `files`, skipping those whose content, schema and validator are unchanged since the
+    cached result. The rest run in parallel batches (workers=0: all cores, 1: in-process).
+    Returns ({path: result}, number of files actually validated).
+    """
+    from src.model.parallel import resolve_workers, run_tasks
+
+    schema = load_schema(schema_csv)
+    version = hashlib.sha256(json.dumps(schema, sort_keys=True).encode() + Path(__file__).read_bytes()).hexdigest()[:16]
+    cached = json.loads(cache.read_text(encoding="utf-8")) if cache and cache.exists() else {}
+    results, todo = {}, []
+    for fp in map(str, files):
+        prev = cached.get(fp)
+        sha, stat = _file_sha(fp, prev)
+        key = f"{sha}-{version}"
+        if prev and prev.get("key") == key and not force:
+            results[fp] = prev
         else:
-            # allow compatible dtypes
-            pass
-    return ok
+            todo.append((fp, {"sha": sha, "stat": stat, "key": key}))
+
+    with trace.span("validate.files", files=len(todo), cached=len(results)) as sp:
+        n = max(1, min(resolve_workers(workers), len(todo)))
+        # a few batches per worker: amortizes task overhead over many small files, keeps the pool busy
+        size = max(1, min(256, -(-len(todo) // (n * 4))))
+        batches = [todo[i:i + size] for i in range(0, len(todo), size)]
+        out = run_tasks(_validate_batch, [([fp for fp, _ in b], schema, chunk_rows) for b in batches], workers=n)
+        for b, res in zip(batches, out):
+            for (fp, meta), r in zip(b, res):
+                results[fp] = {**meta, **r}
+                sp.add(rows=r["rows"], bytes_read=r["bytes"])
 
-def main(schema_csv: str, pattern: str):
-    files = glob.glob(pattern)
+    if cache and (todo or any(not Path(fp).exists() for fp in cached)):
+        # entries of deleted files are dropped; other globs' files keep theirs
+        cached = {fp: r for fp, r in cached.items() if Path(fp).exists()}
+        cached.update(results)
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        cache.write_text(json.dumps(cached, indent=1), encoding="utf-8")
+    return results, len(todo)
+
+def main(schema_csv: str, pattern: str, workers: int = 0, force: bool = False, chunk_rows: int = CHUNK_ROWS):
+    # Skip placeholder README-style files
+    files = sorted(fp for fp in glob.glob(pattern) if "README" not in Path(fp).name.upper())
     if not files:
         print("No files matched:", pattern)
         return 0
+    results, checked = validate_files(files, schema_csv, workers, force, chunk_rows)
     bad = 0
-    for fp in files:
-        # Skip placeholder README-style files
-        if "README" in fp.upper():
-            continue
-        try:
-            df = pd.read_csv(fp)
-        except Exception as e:
-            print("Failed to read", fp, e)
+    for fp, r in results.items():
+        for w in r["warnings"]:
+            print(f"WARN {fp}: {w}")
+        if not r["ok"]:
             bad += 1
-            continue
-        if not validate(df):
             print("Schema invalid:", fp)
-            bad += 1
-    print("Checked", len(files), "files;", "bad:" , bad)
+            for e in r["errors"]:
+                print("  ", e)
+    print("Checked", len(files), "files", f"({checked} validated, {len(files) - checked} unchanged);", "bad:", bad)
     return bad
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--schema", required=True)
     ap.add_argument("--glob", required=True)
+    ap.add_argument("--workers", type=int, default=0, help="validation processes (0 = all cores, 1 = in-process)")
+    ap.add_argument("--force", action="store_true", help="revalidate files whose cached result is still current")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per streamed chunk")
+    trace.add_arguments(ap)
     a = ap.parse_args()
-    rc = main(a.schema, a.glob)
+    with trace.session(a, "validate"):
+        rc = main(a.schema, a.glob, a.workers, a.force, a.chunk_rows)
     sys.exit(1 if rc else 0)
@@ -1,13 +1,108 @@
 import argparse
+import hashlib
+import json
 from pathlib import Path
 import numpy as np
 import pandas as pd
 import yaml
 
-EPS = 1e-6
+from src import trace
+from src.model.formula import FormulaSet
+from src.model.panel import PanelIndex
+from src.storage import patch_partitions, read_table, storage_options, table_exists, table_fingerprint, write_table
+
+LATENTS = ["kappa", "sigma", "rho", "phi"]
+# Incremental state: last input observations, their pre-fallback interpolation and the medians, kept
+# next to the tables they describe (<processed_dir>/.cache/compute_M)
+STATE = Path(".cache/compute_M")
+
+def _state_dir(processed):
+    return Path(processed) / STATE
+
+def _interp_blocks(vals, codes, G):
+    """
+    Linear interpolation by row position within contiguous blocks (codes >= 0; -1 rows stay NaN).
+    Interior gaps come from one global np.interp (their neighbours are in the same block);
+    leading/trailing gaps take the block's edge values; blocks without data stay NaN.
+    """
+    n = len(vals)
+    grouped = codes >= 0
+    valid = grouped & ~np.isnan(vals)
+    out = np.full(n, np.nan)
+    out[valid] = vals[valid]
+    vpos = np.flatnonzero(valid)
+    if len(vpos):
+        pos = np.arange(n, dtype=float)
+        vg = codes[vpos]
+        g = np.unique(vg)
+        first = np.full(G, -1)
+        last = np.full(G, -1)
+        first[g] = vpos[np.searchsorted(vg, g, "left")]
+        last[g] = vpos[np.searchsorted(vg, g, "right") - 1]
+        cg = np.where(grouped, codes, 0)
+        fill = grouped & ~valid & (first[cg] >= 0)
+        out[fill] = np.interp(pos[fill], pos[vpos], vals[vpos])
+        lead = fill & (pos < first[cg])
+        out[lead] = vals[first[cg[lead]]]
+        trail = fill & (pos > last[cg])
+        out[trail] = vals[last[cg[trail]]]
+    return out
 
 def _impute_groupwise(df, cols):
     """
+    Safe per-region time imputation, vectorized over all regions:
+    1) one sort by (region, year) panel codes; regions become contiguous blocks
+    2) linear interpolation by row position within each block (edges held constant),
+       done with a single np.interp per column over all blocks (_interp_blocks)
+    3) per-region mean fill, then global median fallback
+    4) restore original row order
+    Same result (values, dtypes, index) as _impute_groupwise_pandas.
+    """
+    df = df.copy()
+
+    # Coerce year to integer (e.g., 2000.0 -> 2000)
+    if "year" in df.columns:
+        df["year"] = pd.to_numeric(df["year"], errors="coerce").astype("Int64")
+    for c in cols:
+        if c not in df.columns:
+            df[c] = np.nan
+
+    # Work in sorted space, then restore; the sort is on integer (region, year) panel codes, with
+    # missing regions/years last as in sort_values
+    index = PanelIndex.from_frame(df)
+    r, y = index.codes(df)
+    G, T = index.shape
+    order = np.lexsort((np.where(y < 0, T, y), np.where(r < 0, G, r)))
+    work = df.iloc[order].reset_index(drop=True)
+    n = len(work)
+    codes = r[order]  # 0, 0, 1, 1, ... in sorted space; -1 = missing region
+    grouped = codes >= 0
+
+    for c in cols:
+        # time-direction interpolation per region
+        out = _interp_blocks(work[c].to_numpy(dtype=float, na_value=np.nan), codes, G)
+
+        # per-region mean fill
+        has = grouped & ~np.isnan(out)
+        sums = np.bincount(codes[has], weights=out[has], minlength=G)
+        cnt = np.bincount(codes[has], minlength=G)
+        means = np.divide(sums, cnt, out=np.full(G, np.nan), where=cnt > 0)
+        need = grouped & np.isnan(out)
+        out[need] = means[codes[need]]
+
+        # global median fallback
+        if np.isnan(out).any() and not np.isnan(out).all():
+            out[np.isnan(out)] = np.nanmedian(out)
+        work[c] = out
+
+    # Restore original row order
+    inv = np.empty(n, dtype=np.int64)
+    inv[order] = np.arange(n)
+    return work.iloc[inv]
+
+def _impute_groupwise_pandas(df, cols):
+    """
+    Reference implementation (per-group lambdas); kept for benchmarks.
     Safe per-region time imputation:
     1) Sort by (region, year) and reset row index
     2) groupby('region').transform(interpolate) -> preserves row alignment
@@ -32,12 +127,12 @@ def _impute_groupwise(df, cols):
             work[c] = np.nan
 
         # time-direction interpolation per region
-        work[c] = work.groupby("region")[c].transform(
+        work[c] = work.groupby("region", observed=True)[c].transform(
             lambda s: s.interpolate(limit_direction="both")
         )
 
         # per-region mean fill
-        region_means = work.groupby("region")[c].transform(lambda s: s.mean(skipna=True))
+        region_means = work.groupby("region", observed=True)[c].transform(lambda s: s.mean(skipna=True))
         work[c] = work[c].fillna(region_means)
 
         # global median fallback
@@ -52,62 +147,264 @@ def _clip01(df, cols):
         df[c] = df[c].clip(0.0, 1.0)
     return df
 
-def main(config_path: str):
+def _M_rows(df, df_orig, formulas):
+    """
+    Clamp imputed latents, keep rows with >= 2 observed latents and add the formulas:
+    `M` as M_raw (and clipped as M), every other variant as a column of its own.
+    """
+    with trace.span("compute_M.clip"):
+        df = _clip01(df, LATENTS)
+
+    # Fallback priors if a latent is globally missing (avoids all-NaN M)
+    # priors = {"sigma": 0.5, "phi": 0.5}  # neutral, configurable later
+    # for c, prior in priors.items():
+    #     if df[c].isna().all():
+    #         print(f"[warn] '{c}' has no data globally; filling with prior={prior}.")
+    #         df[c] = prior
+
+    # Require at least two non-NaN latents originally to trust the row
+    signal_count = df_orig[LATENTS].notna().sum(axis=1)
+    df = df.loc[signal_count.values >= 2].copy()
+
+    # All formula variants in one pass over the latent table
+    with trace.span("compute_M.M", formulas=len(formulas.formulas)) as sp:
+        values = formulas.evaluate(df)
+        df["M_raw"] = values.pop("M")
+        # Clip for visualization sanity (raw kept for analysis)
+        df["M"] = df["M_raw"].clip(lower=-0.1, upper=0.1)
+        for name, v in values.items():
+            df[name] = v
+        sp.add(rows=len(df))
+    return df
+
+def _coverage(df_orig):
+    return (
+        df_orig.groupby("region", observed=True)[LATENTS]
+               .apply(lambda g: g.notna().mean())
+               .reset_index()
+               .rename(columns={"kappa":"cov_kappa","sigma":"cov_sigma",
+                                "rho":"cov_rho","phi":"cov_phi"})
+    )
+
+def _code_version(formulas):
+    h = hashlib.sha256(Path(__file__).read_bytes())
+    h.update(json.dumps(formulas.spec(), sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+def _observations(df):
+    """Latent observations sorted by (region, year), or None when keys are missing or duplicated."""
+    obs = df[["region", "year"] + LATENTS].copy()
+    obs["region"] = obs["region"].astype(str)
+    obs["year"] = pd.to_numeric(obs["year"], errors="coerce")
+    if obs["region"].isna().any() or obs["year"].isna().any() or obs.duplicated(["region", "year"]).any():
+        return None
+    obs["year"] = obs["year"].astype(np.int64)
+    return obs.sort_values(["region", "year"]).reset_index(drop=True)
+
+def _save_state(processed, obs, interp, medians, formulas):
+    """Snapshot for the next incremental run, tied to the M_timeseries it was taken with (its fingerprint)."""
+    state_dir = _state_dir(processed)
+    state_dir.mkdir(parents=True, exist_ok=True)
+    state = obs.rename(columns={c: f"obs_{c}" for c in LATENTS})
+    for c in LATENTS:
+        state[f"interp_{c}"] = interp[c]
+    state.to_parquet(state_dir / "state.parquet", index=False)
+    meta = {"code": _code_version(formulas), "medians": medians,
+            "M_timeseries": table_fingerprint(Path(processed) / "M_timeseries.csv")}
+    (state_dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+def _medians(interp):
+    return {c: (float(np.nanmedian(v)) if (~np.isnan(v)).any() else None) for c, v in interp.items()}
+
+def _windows(obs, codes, changes, c):
+    """
+    Rows of column `c` whose interpolated value can depend on the changes: for each one, the
+    span from the previous observed anchor to the next one (or the region edge) in the new data.
+    `changes` is (region code, position, present): a row of `obs` at `position` that is new or
+    changed, or (present=False) the insertion point of a row that disappeared.
+    """
+    n = len(obs)
+    idx = np.arange(n)
+    starts = np.searchsorted(codes, np.arange(codes.max() + 1), "left")
+    ends = np.searchsorted(codes, np.arange(codes.max() + 1), "right") - 1
+    valid = obs[c].notna().to_numpy()
+    prev_anchor = np.maximum.accumulate(np.where(valid, idx, -1))
+    next_anchor = np.minimum.accumulate(np.where(valid, idx, n)[::-1])[::-1]
+
+    r, p, present = changes
+    # anchors strictly before the change, and strictly after it (at or after an insertion point)
+    after = p + present
+    lo = np.maximum(np.where(p > 0, prev_anchor[np.maximum(p - 1, 0)], -1), starts[r])
+    hi = np.minimum(np.where(after < n, next_anchor[np.minimum(after, n - 1)], n), ends[r])
+
+    mark = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(mark, lo, 1)
+    np.add.at(mark, hi + 1, -1)
+    return np.cumsum(mark[:n]) > 0
+
+def _incremental(df, processed, fmt, csv_export, formulas):
+    """
+    Patch M_timeseries for the rows whose interpolation window saw new or changed observations.
+    Returns None when a full recompute is needed (no state, code change, M_timeseries rewritten
+    since the state was saved, unusual keys).
+    """
+    state_dir = _state_dir(processed)
+    meta_fp = state_dir / "meta.json"
+    M_fp, cov_fp = processed / "M_timeseries.csv", processed / "coverage_latents_by_region.csv"
+    if not (meta_fp.exists() and (state_dir / "state.parquet").exists() and table_exists(M_fp)
+            and table_exists(cov_fp)):
+        return None
+    meta = json.loads(meta_fp.read_text(encoding="utf-8"))
+    if meta.get("M_timeseries") != table_fingerprint(M_fp):
+        return None  # the table was written by another run: the state does not describe it
+    if set(df.columns) - {"region", "year", *LATENTS}:
+        return None  # extra latents are passed through by the full path; keep it simple
+    obs = _observations(df)
+    if meta.get("code") != _code_version(formulas) or obs is None or obs.empty:
+        return None
+    old = pd.read_parquet(state_dir / "state.parquet")
+    old_obs = old[["region", "year"] + [f"obs_{c}" for c in LATENTS]].rename(columns=lambda c: c.replace("obs_", ""))
+
+    trace.count(rows=len(obs))
+    # 1) diff observations on (region, year)
+    both = obs.merge(old_obs, on=["region", "year"], how="outer", suffixes=("", "_old"), indicator=True, sort=True)
+    same = np.ones(len(both), dtype=bool)
+    for c in LATENTS:
+        a, b = both[c].to_numpy(float), both[f"{c}_old"].to_numpy(float)
+        same &= (a == b) | (np.isnan(a) & np.isnan(b))
+    present = (both["_merge"] != "right_only").to_numpy()
+    if not both.loc[present, "region"].reset_index(drop=True).equals(obs["region"]):
+        return None
+    changed = present & ((both["_merge"] == "left_only").to_numpy() | ~same)
+    removed = (both["_merge"] == "right_only").to_numpy()
+    removed_keys = both.loc[removed, ["region", "year"]]
+
+    # each change as (region code, row position in obs, present); removals sit at their insertion point
+    codes, uniques = pd.factorize(obs["region"])
+    pos_in_obs = np.cumsum(present) - present
+    rem_codes = uniques.get_indexer(removed_keys["region"]) if len(uniques) else np.full(len(removed_keys), -1)
+    keep = rem_codes >= 0  # rows of regions that vanished entirely are only deleted
+    changes = (np.r_[codes[pos_in_obs[changed]], rem_codes[keep]].astype(np.int64),
+               np.r_[pos_in_obs[changed], pos_in_obs[removed][keep]].astype(np.int64),
+               np.r_[np.ones(changed.sum(), np.int64), np.zeros(keep.sum(), np.int64)])
+
+    # 2) recompute interpolation only inside the touched windows, per column
+    aligned = obs[["region", "year"]].merge(old.drop(columns=[f"obs_{c}" for c in LATENTS]),
+                                            on=["region", "year"], how="left")
+    interp, touched = {}, np.zeros(len(obs), dtype=bool)
+    for c in LATENTS:
+        vals = aligned[f"interp_{c}"].to_numpy(float).copy()
+        if len(changes[0]):
+            win = _windows(obs, codes, changes, c)
+            # consecutive window rows of one region form a block bounded by anchors or region edges
+            rows = np.flatnonzero(win)
+            brk = np.r_[True, (np.diff(rows) != 1) | (codes[rows[1:]] != codes[rows[:-1]])]
+            block = np.cumsum(brk) - 1
+            vals[rows] = _interp_blocks(obs[c].to_numpy(float)[rows], block, int(block[-1]) + 1)
+            touched |= win
+        interp[c] = vals
+
+    # 3) a moved median changes every row of the regions that never observed that latent
+    medians = _medians(interp)
+    for c in LATENTS:
+        if medians[c] != meta["medians"].get(c):
+            touched |= np.isnan(interp[c])
+    if not touched.any() and removed_keys.empty:
+        _save_state(processed, obs, interp, medians, formulas)
+        print("M_timeseries up to date (no changed observations)")
+        return 0
+
+    # 4) rebuild the touched rows and patch their regions in place
+    rows = obs.loc[touched, ["region", "year"]].copy()
+    sub_orig = obs.loc[touched].reset_index(drop=True)
+    sub = sub_orig.copy()
+    for c in LATENTS:
+        v = interp[c][touched]
+        if medians[c] is not None:
+            v = np.where(np.isnan(v), medians[c], v)
+        sub[c] = v
+    sub["year"] = sub["year"].astype("Int64")
+    patch = _M_rows(sub, sub_orig, formulas)
+    regions = sorted(set(rows["region"]) | set(removed_keys["region"]))
+    drop = pd.concat([rows, removed_keys], ignore_index=True)
+    kept = read_table(M_fp, filters={"region": regions})
+    kept = kept.astype({"region": str})
+    kept = kept.merge(drop.assign(_drop=True), on=["region", "year"], how="left")
+    kept = kept[kept["_drop"].isna()].drop(columns="_drop")
+    merged = pd.concat([kept, patch.astype({"region": str})], ignore_index=True)
+    merged = merged.sort_values(["region", "year"], kind="stable").reset_index(drop=True)
+    patch_partitions(merged, M_fp, regions, fmt, csv_export)
+
+    cov = read_table(cov_fp).astype({"region": str})
+    cov = cov[~cov["region"].isin(regions)]
+    cov_new = _coverage(obs[obs["region"].isin(regions)])
+    cov = pd.concat([cov, cov_new], ignore_index=True).sort_values("region", kind="stable").reset_index(drop=True)
+    write_table(cov, cov_fp, fmt, csv_export)
+
+    _save_state(processed, obs, interp, medians, formulas)
+    print(f"Patched M_timeseries: {int(touched.sum())} of {len(obs)} rows recomputed in {len(regions)} regions"
+          f"{f', {len(removed_keys)} removed' if len(removed_keys) else ''}")
+    return int(touched.sum())
+
+def main(config_path: str, incremental: bool = False):
     cfg = yaml.safe_load(Path(config_path).read_text())
     processed = Path(cfg["output"]["processed_dir"])
     processed.mkdir(parents=True, exist_ok=True)
 
+    fmt, csv_export = storage_options(cfg)
+    formulas = FormulaSet.from_config(cfg)
+    if "M" not in formulas:
+        raise SystemExit("formulas: needs an `M` entry (written to M_timeseries as M_raw / M)")
+
     latents_fp = processed / "latents.csv"
-    if not latents_fp.exists():
+    if not table_exists(latents_fp):
         raise SystemExit(f"Missing {latents_fp}. Run fit_latents first.")
 
-    df = pd.read_csv(latents_fp)
+    df = read_table(latents_fp)
 
     # Ensure columns exist
     for c in ["region","year","kappa","sigma","rho","phi"]:
         if c not in df.columns:
             df[c] = np.nan
 
+    if incremental:
+        with trace.span("compute_M.incremental") as sp:
+            patched = _incremental(df, processed, fmt, csv_export, formulas)
+            sp.add(patched_rows=patched)
+        if patched is not None:
+            return
+
     # Keep a copy of original (to check how much signal we had before imputation)
     df_orig = df.copy()
 
     # Impute & clamp to [0,1]
-    df = _impute_groupwise(df, ["kappa","sigma","rho","phi"])
-    df = _clip01(df, ["kappa","sigma","rho","phi"])
-
-    # Fallback priors if a latent is globally missing (avoids all-NaN M)
-    # priors = {"sigma": 0.5, "phi": 0.5}  # neutral, configurable later
-    # for c, prior in priors.items():
-    #     if df[c].isna().all():
-    #         print(f"[warn] '{c}' has no data globally; filling with prior={prior}.")
-    #         df[c] = prior
-
-
-    # Require at least two non-NaN latents originally to trust the row
-    signal_count = df_orig[["kappa","sigma","rho","phi"]].notna().sum(axis=1)
-    df = df.loc[signal_count.values >= 2].copy()
-
-    # Compute M with epsilon guard
-    df["M_raw"] = (df["kappa"] / (df["sigma"] + EPS)) * df["rho"] * df["phi"]
-    # Clip for visualization sanity (raw kept for analysis)
-    df["M"] = df["M_raw"].clip(lower=-0.1, upper=0.1)
+    with trace.span("compute_M.impute", rows=len(df)):
+        df = _impute_groupwise(df, LATENTS)
+    df = _M_rows(df, df_orig, formulas)
 
     # Coverage diagnostics
-    cov = (
-        df_orig.groupby("region")[["kappa","sigma","rho","phi"]]
-               .apply(lambda g: g.notna().mean())
-               .reset_index()
-               .rename(columns={"kappa":"cov_kappa","sigma":"cov_sigma",
-                                "rho":"cov_rho","phi":"cov_phi"})
-    )
+    with trace.span("compute_M.coverage"):
+        cov = _coverage(df_orig)
+
+    fp = write_table(df, processed / "M_timeseries.csv", fmt, csv_export)
+    cov_fp = write_table(cov, processed / "coverage_latents_by_region.csv", fmt, csv_export)
+    print("Wrote", fp)
+    print("Coverage by region ->", cov_fp)
 
-    df.to_csv(processed / "M_timeseries.csv", index=False)
-    cov.to_csv(processed / "coverage_latents_by_region.csv", index=False)
-    print("Wrote", processed / "M_timeseries.csv")
-    print("Coverage by region ->", processed / "coverage_latents_by_region.csv")
+    # Snapshot for later incremental runs
+    with trace.span("compute_M.save_state"):
+        obs = _observations(df_orig)
+        if obs is not None:
+            codes, uniques = pd.factorize(obs["region"])
+            interp = {c: _interp_blocks(obs[c].to_numpy(float), codes, len(uniques)) for c in LATENTS}
+            _save_state(processed, obs, interp, _medians(interp), formulas)
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True)
+    ap.add_argument("--incremental", action="store_true",
+                    help="patch only rows whose interpolation window saw new/changed latents (full run if no state)")
+    trace.add_arguments(ap)
     args = ap.parse_args()
-    main(args.config)
+    with trace.session(args, "compute_M"):
+        main(args.config, incremental=args.incremental)
@@ -0,0 +1,239 @@
+# src/model/ensemble.py
+# Online per-timestep statistics of simulation ensembles, without keeping trajectories.
+#
+#   stats = EnsembleStats(t_steps)                  # or groups=G for one ensemble per design point
+#   simulate(..., record=False, stats=stats)        # updated block by block of steps
+#   stats.merge(other_worker_stats)                 # exact for moments/extrema, approximate for quantiles
+#   stats.frame(quantiles=(0.05, 0.5, 0.95), normalize=True)
+#
+# Each (group, timestep) cell holds a count, a mean and sum of squared deviations (Welford's
+# recurrence, applied to whole blocks with Chan's pairwise update), running min/max, and a merging
+# t-digest of at most `compression` centroids for quantiles. Memory is O(groups x T x compression)
+# whatever the number of universes. Normalized curves use the merged extrema of the whole ensemble in
+# place of each run's own min/max.
+from pathlib import Path
+
+import numpy as np
+
+
+_STATE = ("n", "mean", "m2", "min", "max", "c_mean", "c_weight")
+
+
+def _bucket(q, C):
+    """t-digest k1 scale: quantile q -> one of C buckets, narrow at the tails (size ~ sqrt(q (1 - q)))."""
+    return np.minimum((C * (0.5 + np.arcsin(2 * q - 1) / np.pi)).astype(np.int64), C - 1)
+
+
+class EnsembleStats:
+    """Per-(group, timestep) count, mean/variance, extrema and quantile sketch; mergeable across workers."""
+
+    def __init__(self, t_steps, groups=1, compression=100):
+        G, T, C = int(groups), int(t_steps), int(compression)
+        self.compression = C
+        self.n = np.zeros((G, T))
+        self.mean = np.zeros((G, T))
+        self.m2 = np.zeros((G, T))
+        self.min = np.full((G, T), np.inf)
+        self.max = np.full((G, T), -np.inf)
+        # t-digest centroids per cell, in increasing order; unused slots have weight 0
+        self.c_mean = np.zeros((G, T, C))
+        self.c_weight = np.zeros((G, T, C))
+
+    @property
+    def shape(self):
+        return self.n.shape
+
+    def update(self, t0, X, groups=None):
+        """
+        Add a block of values X (steps, U) for timesteps t0 .. t0 + steps - 1 (time-major, as simulate
+        produces them); `groups` (U,) assigns each universe to a group (default: all in group 0).
+        """
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X[None, :]
+        steps, U = X.shape
+        if U == 0:
+            return self
+        if groups is None:
+            present, starts, counts = np.array([0]), np.array([0]), np.array([U])
+        else:
+            order = np.argsort(groups, kind="stable")
+            X = X[:, order]
+            present, starts, counts = np.unique(np.asarray(groups)[order], return_index=True, return_counts=True)
+        ts = slice(t0, t0 + steps)
+        # block moments per (step, group), two-pass within the block
+        mean_b = np.add.reduceat(X, starts, axis=1) / counts
+        dev = X - np.repeat(mean_b, counts, axis=1)
+        m2_b = np.add.reduceat(dev * dev, starts, axis=1)
+        self._combine(present, ts, counts[None, :].astype(float), mean_b, m2_b,
+                      np.minimum.reduceat(X, starts, axis=1), np.maximum.reduceat(X, starts, axis=1))
+
+        # the block's own digest: values sorted within each (step, group), bucketed by rank
+        if len(present) == 1:
+            X = np.sort(X, axis=1)
+        else:
+            X = np.concatenate([np.sort(X[:, s:s + c], axis=1) for s, c in zip(starts, counts)], axis=1)
+        C = self.compression
+        q = (np.arange(U) - np.repeat(starts, counts) + 0.5) / np.repeat(counts, counts)
+        rows = (present[:, None] * self.shape[1] + np.arange(t0, t0 + steps)[None, :])  # (groups, steps)
+        key = (np.repeat(rows.T, counts, axis=1) * C + _bucket(q, C)).ravel()
+        start = np.flatnonzero(np.append(True, key[1:] != key[:-1]))
+        w = np.diff(np.append(start, key.size)).astype(float)
+        self._digest(rows.ravel(), key[start] // C, np.add.reduceat(X.ravel(), start) / w, w)
+        return self
+
+    def _combine(self, g, ts, n_b, mean_b, m2_b, min_b, max_b):
+        """Chan's pairwise update of cells (g, ts) with block statistics shaped (steps, groups)."""
+        n_a, mean_a, m2_a = self.n[g, ts], self.mean[g, ts], self.m2[g, ts]
+        n_b, mean_b, m2_b = np.broadcast_to(n_b.T, mean_b.T.shape), mean_b.T, m2_b.T
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean[g, ts] = np.where(n > 0, mean_a + delta * (n_b / n), 0.0)
+            self.m2[g, ts] = np.where(n > 0, m2_a + m2_b + delta * delta * (n_a * n_b / n), 0.0)
+        self.n[g, ts] = n
+        self.min[g, ts] = np.minimum(self.min[g, ts], min_b.T)
+        self.max[g, ts] = np.maximum(self.max[g, ts], max_b.T)
+
+    def _digest(self, rows, new_rows, new_means, new_weights):
+        """Re-compress the centroids of flat cells `rows` together with new (row, mean, weight) points."""
+        C = self.compression
+        cm = self.c_mean.reshape(-1, C)
+        cw = self.c_weight.reshape(-1, C)
+        old = cw[rows] > 0
+        r = np.concatenate([np.repeat(rows, old.sum(axis=1)), new_rows])
+        m = np.concatenate([cm[rows][old], new_means])
+        w = np.concatenate([cw[rows][old], new_weights])
+        order = np.lexsort((m, r))
+        r, m, w = r[order], m[order], w[order]
+
+        # quantile midpoint of each point within its cell, through the k1 scale function
+        first = np.ones(len(r), dtype=bool)
+        first[1:] = r[1:] != r[:-1]
+        cell = np.cumsum(first) - 1
+        cum = np.cumsum(w)
+        base = (cum - w)[first]
+        total = np.add.reduceat(w, np.flatnonzero(first))
+        q = (cum - w / 2 - base[cell]) / total[cell]
+
+        # points of a cell sharing a bucket become one centroid (keys are sorted, so runs are contiguous)
+        key = r * C + _bucket(q, C)
+        start = np.flatnonzero(np.append(True, key[1:] != key[:-1]))
+        wk = np.add.reduceat(w, start)
+        mk = np.add.reduceat(w * m, start) / wk
+        cw[rows] = 0.0
+        cm[rows] = 0.0
+        cw.reshape(-1)[key[start]] = wk
+        cm.reshape(-1)[key[start]] = mk
+
+    def merge(self, other, groups=None):
+        """
+        Fold another accumulator over the same timesteps (e.g. from another worker) into this one;
+        `groups` maps its groups to groups of this one (default: the same indices).
+        """
+        if other.shape[1] != self.shape[1] or other.compression != self.compression:
+            raise ValueError(f"cannot merge EnsembleStats {other.shape}/{other.compression} into "
+                             f"{self.shape}/{self.compression}")
+        T = self.shape[1]
+        g = np.arange(other.shape[0]) if groups is None else np.asarray(groups, dtype=np.int64)
+        if len(g) != other.shape[0] or (len(g) and (g.min() < 0 or g.max() >= self.shape[0])):
+            raise ValueError(f"groups must map {other.shape[0]} groups into 0..{self.shape[0] - 1}")
+        self._combine(g, slice(None), other.n.T, other.mean.T, other.m2.T, other.min.T, other.max.T)
+        have = other.c_weight > 0
+        rows = (g[:, None] * T + np.arange(T)[None, :]).ravel()
+        self._digest(rows, np.repeat(rows, have.reshape(len(rows), -1).sum(axis=1)), other.c_mean[have],
+                     other.c_weight[have])
+        return self
+
+    @classmethod
+    def combine(cls, parts):
+        """Merge a sequence of accumulators into a new one."""
+        parts = list(parts)
+        out = cls(parts[0].shape[1], parts[0].shape[0], parts[0].compression)
+        for p in parts:
+            out.merge(p)
+        return out
+
+    def var(self, ddof=1):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n > ddof, self.m2 / (self.n - ddof), np.nan)
+
+    def quantile(self, q):
+        """(groups, T) estimate of quantile q, interpolated between centroids and anchored at the extrema."""
+        G, T = self.shape
+        C = self.compression
+        w = self.c_weight.reshape(G * T, C)
+        # centroids to the front of each row, keeping their order
+        order = np.argsort(w == 0, axis=1, kind="stable")
+        w = np.take_along_axis(w, order, axis=1)
+        m = np.take_along_axis(self.c_mean.reshape(G * T, C), order, axis=1)
+        k = (w > 0).sum(axis=1)
+        n = w.sum(axis=1)
+        # (position, value) knots: min at 1/2, centroid centers, max at n - 1/2; unit-weight
+        # centroids then reproduce np.quantile's linear interpolation exactly
+        pos = np.full((G * T, C + 2), np.inf)
+        val = np.zeros((G * T, C + 2))
+        pos[:, 0], val[:, 0] = 0.5, self.min.ravel()
+        pos[:, 1:C + 1] = np.where(w > 0, np.cumsum(w, axis=1) - w / 2, np.inf)
+        val[:, 1:C + 1] = m
+        last = (k + 1)[:, None]
+        np.put_along_axis(pos, last, (n - 0.5)[:, None], axis=1)
+        np.put_along_axis(val, last, self.max.ravel()[:, None], axis=1)
+
+        p = q * (n - 1) + 0.5
+        lo = np.clip((pos <= p[:, None]).sum(axis=1) - 1, 0, k + 1)
+        hi = np.minimum(lo + 1, k + 1)
+        p_lo, p_hi, v_lo, v_hi = (np.take_along_axis(a, i[:, None], axis=1)[:, 0]
+                                  for a, i in ((pos, lo), (pos, hi), (val, lo), (val, hi)))
+        with np.errstate(invalid="ignore", divide="ignore"):  # empty cells (extrema still +-inf)
+            frac = np.where(p_hi > p_lo, (p - p_lo) / (p_hi - p_lo), 0.0)
+            out = v_lo + np.clip(frac, 0.0, 1.0) * (v_hi - v_lo)
+        return np.where(n > 0, out, np.nan).reshape(G, T)
+
+    def extrema(self):
+        """Per-group (min, max) over every timestep and universe seen (merged across workers)."""
+        return self.min.min(axis=1), self.max.max(axis=1)
+
+    def frame(self, quantiles=(0.05, 0.5, 0.95), normalize=False, group_ids=None):
+        """
+        Long table (group, t, n, mean, std, min, max, q05, ...). normalize=True maps each group's values
+        to [0, 1] by its merged extrema, as the simulators' per-run min-max normalization did.
+        """
+        import pandas as pd
+
+        G, T = self.shape
+        cols = {"mean": self.mean, "std": np.sqrt(self.var()), "min": self.min, "max": self.max}
+        for q in quantiles:
+            cols[f"q{round(q * 100):02d}"] = self.quantile(q)
+        cols = {c: np.where(self.n > 0, v, np.nan) for c, v in cols.items()}
+        if normalize:
+            lo, hi = self.extrema()
+            span = (hi - lo + 1e-12)[:, None]
+            cols = {c: (v if c == "std" else v - lo[:, None]) / span for c, v in cols.items()}
+        groups = np.arange(G) if group_ids is None else np.asarray(group_ids)
+        return pd.DataFrame({"group": np.repeat(groups, T), "t": np.tile(np.arange(T), G),
+                             "n": self.n.ravel().astype(np.int64), **{c: v.ravel() for c, v in cols.items()}})
+
+    def state(self):
+        """The accumulator's arrays, e.g. for np.savez next to other arrays."""
+        return {k: getattr(self, k) for k in _STATE}
+
+    @classmethod
+    def from_state(cls, state):
+        G, T, C = state["c_mean"].shape
+        out = cls(T, G, C)
+        for k in _STATE:
+            setattr(out, k, np.array(state[k], dtype=float))
+        return out
+
+    def save(self, path):
+        """Write the accumulator state (np.savez) so parts from separate runs can be merged later."""
+        path = Path(path)
+        with open(path, "wb") as fh:
+            np.savez(fh, **self.state())
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            return cls.from_state(z)
@@ -1,4 +1,282 @@
+# src/model/fit_dynamics.py
+# Latent dynamics per region, fitted for all regions at once:
+#   ARX       y_t = c + sum_i a_i y_{t-i} + sum_j sum_k b_jk x_{j,t-k} + e_t   (x = the other variables)
+#   logistic  y(t) = K / (1 + exp(-r (t - t0)))
+# Series are laid out as a (variables, regions, years) panel on the full annual grid; lagged designs
+# are stacked into one (regions, rows, terms) tensor and solved as batched normal equations (ARX) or
+# batched Levenberg-damped Gauss-Newton steps (logistic). Missing years only drop their own rows.
+# Logistic fits start from the previous run's coefficients when present (warm start).
+#
+#   dynamics:
+#     targets: [kappa, sigma, rho, phi, M]   # ARX targets (latents or M_timeseries columns)
+#     ar_order: 1                            # own lags
+#     exog_order: 1                          # lags of every other target (0 = pure AR)
+#     logistic: [kappa, sigma, rho, phi]
+#
+# Writes data/processed/dynamics_coefficients (region, model, target, term, coef, se) and
+# dynamics_diagnostics (n, k, rss, r2, aic, durbin_watson, resid_ac1, iterations, converged).
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from src import trace
+from src.model.panel import PanelIndex
+from src.storage import read_table, storage_options, table_exists, write_table
+
+LATENTS = ["kappa", "sigma", "rho", "phi"]
+DEFAULTS = {"targets": LATENTS + ["M"], "ar_order": 1, "exog_order": 1, "logistic": LATENTS,
+            "min_obs": 5, "max_iter": 100, "tol": 1e-10}
+LOGISTIC_TERMS = ["K", "r", "t0"]
+
+
+def panel(df, cols):
+    """(regions, years, Y) with Y[v, region, year] on the full annual grid (NaN where unobserved)."""
+    index = PanelIndex.from_frame(df)
+    X, _ = index.dense(df, cols)
+    return list(index.regions), index.years, np.ascontiguousarray(np.moveaxis(X, -1, 0))
+
+
+def lag_design(Y, names, target, ar_order=1, exog_order=1):
+    """
+    Stacked ARX design for one target: X (regions, rows, terms), y (regions, rows) and the term
+    names (const, <target>_l1.., <other>_l1..). Row t uses years t - lag; rows with any NaN are
+    dropped by the fit, not here.
+    """
+    i = names.index(target)
+    p = max(ar_order, exog_order)
+    R, T = Y.shape[1:]
+    cols, terms = [np.ones((R, T - p))], ["const"]
+    for v, name in enumerate(names):
+        order = ar_order if v == i else exog_order
+        for lag in range(1, order + 1):
+            cols.append(Y[v, :, p - lag:T - lag])
+            terms.append(f"{name}_l{lag}")
+    return np.stack(cols, axis=-1), Y[i, :, p:], terms
+
+
+def _residual_stats(resid, y, mask, k):
+    """n, rss, r2, aic, Durbin-Watson and lag-1 residual autocorrelation per region (NaN residuals ignored)."""
+    n = mask.sum(axis=1)
+    rss = np.nansum(resid**2, axis=1)
+    ybar = np.nansum(np.where(mask, y, 0.0), axis=1) / np.maximum(n, 1)
+    tss = np.nansum(np.where(mask, (y - ybar[:, None]) ** 2, 0.0), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = np.where(tss > 0, 1.0 - rss / tss, np.nan)
+        aic = n * np.log(rss / n) + 2 * k
+        dw = np.nansum(np.diff(resid, axis=1) ** 2, axis=1) / rss
+        ac1 = np.nansum(resid[:, 1:] * resid[:, :-1], axis=1) / rss
+    return {"n": n, "rss": rss, "r2": r2, "aic": aic, "durbin_watson": dw, "resid_ac1": ac1}
+
+
+def fit_arx(X, y, min_obs=5, rcond=1e-12):
+    """
+    Least squares for every region at once: the masked design (zeroed rows add nothing) gives
+    stacked normal equations X'X b = X'y, solved through one batched eigendecomposition of the
+    small (terms x terms) matrices. Eigenvalues below rcond * the largest are dropped, giving the
+    minimum-norm lstsq solution for rank-deficient designs (e.g. a constant stub latent).
+    Returns coef/se (regions, terms) and residual diagnostics; regions with fewer than
+    max(min_obs, terms + 1) complete rows are NaN.
+    """
+    mask = ~np.isnan(y) & ~np.isnan(X).any(axis=-1)
+    Xm = np.where(mask[..., None], X, 0.0)
+    ym = np.where(mask, y, 0.0)
+    Xt = Xm.transpose(0, 2, 1)
+    w, V = np.linalg.eigh(Xt @ Xm)
+    keep = w > rcond * w[:, -1:]
+    inv = np.where(keep, 1.0 / np.where(keep, w, 1.0), 0.0)
+    coef = (V @ (inv[..., None] * (V.transpose(0, 2, 1) @ (Xt @ ym[..., None]))))[..., 0]
+    rank = keep.sum(axis=1)
+
+    resid = np.where(mask, ym - (Xm @ coef[..., None])[..., 0], np.nan)
+    stats = _residual_stats(resid, y, mask, rank)
+    ok = stats["n"] >= np.maximum(min_obs, X.shape[-1] + 1)
+    sigma2 = stats["rss"] / np.maximum(stats["n"] - rank, 1)
+    # diag of (X'X)^+ = sum_j V_kj^2 / w_j
+    se = np.sqrt(sigma2[:, None] * ((V**2) @ inv[..., None])[..., 0])
+    out = {"coef": coef, "se": se, "k": rank, "iterations": np.zeros(len(y), dtype=int), "converged": ok, **stats}
+    for key in ("coef", "se", "rss", "r2", "aic", "durbin_watson", "resid_ac1"):
+        out[key] = np.where(ok.reshape((-1,) + (1,) * (out[key].ndim - 1)), out[key], np.nan)
+    return out
+
+
+def _logistic(theta, t):
+    K, r, t0 = theta[:, 0:1], theta[:, 1:2], theta[:, 2:3]
+    e = np.exp(np.clip(-r * (t - t0), -50.0, 50.0))
+    g = 1.0 / (1.0 + e)
+    J = np.stack([g, K * g * g * e * (t - t0), -K * g * g * e * r], axis=-1)
+    return K * g, J
+
+
+def logistic_init(y, t):
+    """Cold start per region: K above the observed max, slope-matched r, midpoint t0 on the linear trend."""
+    t = np.broadcast_to(t, y.shape)
+    mask = ~np.isnan(y)
+    n = np.maximum(mask.sum(axis=1), 1)
+    tbar = np.where(mask, t, 0.0).sum(axis=1) / n
+    ybar = np.nansum(y, axis=1) / n
+    dt = np.where(mask, t - tbar[:, None], 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        b = np.nansum(dt * np.where(mask, y - ybar[:, None], 0.0), axis=1) / (dt**2).sum(axis=1)
+    b = np.nan_to_num(b)
+    K = np.maximum(np.nanmax(np.where(mask, y, -np.inf), axis=1) * 1.1, 1e-3)
+    r = 4.0 * b / K
+    r = np.where(np.abs(r) < 1e-3, np.where(r < 0, -1e-3, 1e-3), r)
+    span = t.max() - t.min() + 1.0
+    t0 = np.where(b != 0, tbar + (K / 2 - ybar) / np.where(b != 0, b, 1.0), tbar)
+    return np.column_stack([K, r, np.clip(t0, t.min() - span, t.max() + span)])
+
+
+def fit_logistic(y, t, theta0=None, min_obs=5, max_iter=100, tol=1e-10):
+    """
+    Logistic growth for every region at once: batched Gauss-Newton with Levenberg damping
+    (per-region damping, a step is kept only if it lowers that region's RSS). Each iteration
+    works on the regions still moving, so warm starts (`theta0`, (regions, 3) K, r, t0; NaN
+    rows fall back to logistic_init) finish in a step or two.
+    """
+    t = np.asarray(t, dtype=float)
+    mask = ~np.isnan(y)
+    ym = np.where(mask, y, 0.0)
+    theta = logistic_init(y, t)
+    if theta0 is not None:
+        warm = np.isfinite(theta0).all(axis=1)
+        theta[warm] = theta0[warm]
+    ok = mask.sum(axis=1) >= max(min_obs, 4)
+
+    def evaluate(th, rows):
+        f, J = _logistic(th, t)
+        res = np.where(mask[rows], ym[rows] - f, 0.0)
+        return (res**2).sum(axis=1), res, J * mask[rows][..., None]
+
+    rss = np.full(len(y), np.nan)
+    res = np.zeros(y.shape)
+    J = np.zeros(y.shape + (3,))
+    act = np.flatnonzero(ok)
+    rss[act], res[act], J[act] = evaluate(theta[act], act)
+    lam = np.full(len(y), 1e-3)
+    iters = np.zeros(len(y), dtype=int)
+    converged = np.zeros(len(y), dtype=bool)
+    eye = np.eye(3)
+    for _ in range(max_iter):
+        if not len(act):
+            break
+        Ja = J[act]
+        Jt = Ja.transpose(0, 2, 1)
+        A = Jt @ Ja
+        g = (Jt @ res[act][..., None])[..., 0]
+        D = A * eye + 1e-12 * eye
+        step = np.linalg.solve(A + lam[act, None, None] * D, g[..., None])[..., 0]
+        cand = theta[act] + step
+        new_rss, new_res, new_J = evaluate(cand, act)
+        better = np.isfinite(new_rss) & (new_rss <= rss[act])
+        iters[act] += 1
+        # converged: the accepted step no longer changes the RSS (relative) or the parameters
+        small = better & ((rss[act] - new_rss <= tol * np.maximum(rss[act], 1e-300))
+                          | (np.abs(step) <= tol * (np.abs(theta[act]) + tol)).all(axis=1))
+        b = act[better]
+        theta[b], rss[b], res[b], J[b] = cand[better], new_rss[better], new_res[better], new_J[better]
+        lam[act] = np.where(better, lam[act] / 10, np.minimum(lam[act] * 10, 1e12))
+        # a region whose damping saturates without progress is at a (local) minimum
+        fin = small | (~better & (lam[act] >= 1e12))
+        converged[act[fin]] = True
+        act = act[~fin]
+
+    f, _ = _logistic(theta, t)
+    stats = _residual_stats(np.where(mask, y - f, np.nan), y, mask, 3)
+    # standard errors from the Gauss-Newton approximation sigma^2 (J'J)^-1
+    cov = np.linalg.pinv(J.transpose(0, 2, 1) @ J, hermitian=True)
+    se = np.sqrt(np.abs(np.diagonal(cov, axis1=1, axis2=2)) * (stats["rss"] / np.maximum(stats["n"] - 3, 1))[:, None])
+    out = {"coef": theta, "se": se, "k": np.full(len(y), 3), "iterations": iters, "converged": converged, **stats}
+    for key in ("coef", "se", "rss", "r2", "aic", "durbin_watson", "resid_ac1"):
+        out[key] = np.where(ok.reshape((-1,) + (1,) * (out[key].ndim - 1)), out[key], np.nan)
+    return out
+
+
+def _tables(fit, regions, model, target, terms):
+    R, K = len(regions), len(terms)
+    coef = pd.DataFrame({"region": np.repeat(regions, K), "model": model, "target": target,
+                         "term": np.tile(terms, R), "coef": fit["coef"].ravel(), "se": fit["se"].ravel()})
+    diag = pd.DataFrame({"region": regions, "model": model, "target": target,
+                         **{c: fit[c] for c in ("n", "k", "rss", "r2", "aic", "durbin_watson", "resid_ac1",
+                                                "iterations", "converged")}})
+    return coef, diag
+
+
+def _prior_logistic(prior, regions, target):
+    """Previous run's logistic (K, r, t0) per region for warm starts (NaN where unavailable)."""
+    prior = prior[(prior["model"].astype(str) == "logistic") & (prior["target"].astype(str) == target)]
+    wide = prior.pivot(index="region", columns="term", values="coef")
+    wide.index = wide.index.astype(str)
+    return wide.reindex(index=regions, columns=LOGISTIC_TERMS).to_numpy(dtype=float)
+
+
+def fit_panel(df, spec, prior=None):
+    """ARX and logistic fits for every target; `prior(target)` returns warm-start thetas. -> (coef, diag)"""
+    targets = [c for c in spec["targets"] if c in df.columns]
+    regions, years, Y = panel(df, targets)
+    coefs, diags = [], []
+    with trace.span("fit_dynamics.arx", regions=len(regions), targets=len(targets)):
+        for target in targets:
+            X, y, terms = lag_design(Y, targets, target, spec["ar_order"], spec["exog_order"])
+            c, d = _tables(fit_arx(X, y, spec["min_obs"]), regions, "arx", target, terms)
+            coefs.append(c)
+            diags.append(d)
+    with trace.span("fit_dynamics.logistic", regions=len(regions)) as sp:
+        for target in [c for c in spec["logistic"] if c in targets]:
+            y = Y[targets.index(target)]
+            theta0 = prior(target, regions) if prior else None
+            # time relative to the first year keeps the Jacobian well scaled; t0 is stored in calendar years
+            if theta0 is not None:
+                theta0 = theta0 - np.array([0.0, 0.0, years[0]])
+            fit = fit_logistic(y, years - years[0], theta0, spec["min_obs"], spec["max_iter"], spec["tol"])
+            fit["coef"] = fit["coef"] + np.array([0.0, 0.0, years[0]])
+            sp.add(iterations=int(fit["iterations"].max(initial=0)))
+            c, d = _tables(fit, regions, "logistic", target, LOGISTIC_TERMS)
+            coefs.append(c)
+            diags.append(d)
+    return pd.concat(coefs, ignore_index=True), pd.concat(diags, ignore_index=True)
+
+
+def main(config_path: str, warm_start: bool = True):
+    cfg = yaml.safe_load(Path(config_path).read_text())
+    processed = Path(cfg["output"]["processed_dir"])
+    fmt, csv_export = storage_options(cfg)
+    spec = {**DEFAULTS, **(cfg.get("dynamics") or {})}
+
+    latents_fp = processed / "latents.csv"
+    if not table_exists(latents_fp):
+        raise SystemExit(f"Missing {latents_fp}. Run fit_latents first.")
+    df = read_table(latents_fp)
+    df["region"] = df["region"].astype(str)
+    extra = [c for c in spec["targets"] if c not in df.columns]
+    if extra:
+        M_fp = processed / "M_timeseries.csv"
+        if not table_exists(M_fp):
+            raise SystemExit(f"Missing {M_fp} for targets {extra}. Run compute_M first.")
+        M = read_table(M_fp, columns=["region", "year", *extra])
+        M["region"] = M["region"].astype(str)
+        df = df.merge(M, on=["region", "year"], how="outer")
+
+    coef_fp = processed / "dynamics_coefficients.csv"
+    prev = read_table(coef_fp) if warm_start and table_exists(coef_fp) else None
+
+    def prior(target, regions):
+        return _prior_logistic(prev, regions, target)
+    coef, diag = fit_panel(df, spec, prior if prev is not None else None)
+    print("Wrote", write_table(coef, coef_fp, fmt, csv_export))
+    print("Wrote", write_table(diag, processed / "dynamics_diagnostics.csv", fmt, csv_export))
+    print(f"Converged {int(diag['converged'].sum())} of {len(diag)} region x target models "
+          f"(median R² arx {diag.loc[diag['model'] == 'arx', 'r2'].median():.3f}, "
+          f"logistic {diag.loc[diag['model'] == 'logistic', 'r2'].median():.3f})")
+
 
-# Placeholder for future ARX/logistic dynamics fitting.
 if __name__ == "__main__":
-    print("fit_dynamics is a placeholder. Implement as needed.")
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", required=True)
+    ap.add_argument("--cold", action="store_true", help="ignore the previous logistic fits (no warm start)")
+    trace.add_arguments(ap)
+    args = ap.parse_args()
+    with trace.session(args, "fit_dynamics"):
+        main(args.config, warm_start=not args.cold)
@@ -5,6 +5,12 @@ import numpy as np
 from pathlib import Path
 import yaml
 
+from src import trace
+from src.model.panel import PanelIndex, save_indicator_panel
+from src.storage import TableWriter, read_table, storage_options, write_table
+
+RAW_COLUMNS = ["region", "year", "value", "id"]
+
 def minmax(series: pd.Series):
     s = series.astype(float)
     mn, mx = np.nanmin(s), np.nanmax(s)
@@ -12,26 +18,140 @@ def minmax(series: pd.Series):
         return pd.Series(np.zeros(len(s)), index=s.index)
     return (s - mn) / (mx - mn)
 
-def normalize_indicators(raw_dir: str, cfg: dict) -> pd.DataFrame:
-    # Concatenate all raw files
-    raw_files = list(Path(raw_dir).glob("*.csv"))
-    frames = []
-    for fp in raw_files:
-        try:
-            df = pd.read_csv(fp)
-            frames.append(df)
-        except Exception:
+def _iter_raw(raw_dir: str, chunk_rows: int | None = None, skip=()):
+    """
+    Yield (path, rows) for every raw CSV (or for the one file `raw_dir` names), keeping complete
+    rows of the required columns (year as float, as in the legacy interim CSV). With chunk_rows
+    each file is read in pieces of at most that many rows; unreadable files are reported and
+    yield (path, None).
+    """
+    raw = Path(raw_dir)
+    for fp in ([raw] if raw.is_file() else sorted(raw.glob("*.csv"))):
+        if fp in skip:
             continue
+        try:
+            reader = pd.read_csv(fp, usecols=lambda c: c in RAW_COLUMNS, chunksize=chunk_rows)
+            trace.count(bytes_read=fp.stat().st_size)
+            for chunk in ([reader] if chunk_rows is None else reader):
+                chunk = chunk.reindex(columns=RAW_COLUMNS).dropna()
+                chunk["year"] = chunk["year"].astype(float)
+                trace.count(rows=len(chunk))
+                yield fp, chunk
+        except (OSError, ValueError) as e:
+            print(f"WARN: skipping unreadable raw file {fp}: {e}")
+            yield fp, None
+
+def normalize_indicators(raw_dir: str, cfg: dict) -> pd.DataFrame:
+    frames = [df for _, df in _iter_raw(raw_dir) if df is not None]
     if not frames:
         raise SystemExit("No raw data found.")
     df = pd.concat(frames, ignore_index=True)
-    # Keep required columns
-    df = df[["region","year","value","id"]].dropna()
     # Normalize per id
     df["norm"] = df.groupby("id")["value"].transform(minmax)
     return df
 
-def build_latents(df_norm: pd.DataFrame, cfg: dict) -> pd.DataFrame:
+def normalize_indicators_streaming(raw_dir: str, out_csv_path, chunk_rows: int, fmt="parquet", csv_export=False):
+    """
+    Two-pass normalize for raw sets larger than memory: pass 1 collects per-id min/max
+    (and the category values), pass 2 streams normalized chunks into the interim store.
+    Peak memory is one chunk of `chunk_rows` rows; the written table equals the in-memory path's.
+    """
+    per_file, bad = {}, set()
+    for fp, chunk in _iter_raw(raw_dir, chunk_rows):
+        if chunk is None:
+            # a file that fails part-way is dropped entirely, as in the in-memory path
+            bad.add(fp)
+            per_file.pop(fp, None)
+            continue
+        stats = chunk.groupby("id", sort=False)["value"].agg(["min", "max"])
+        per_file.setdefault(fp, []).append((stats, set(chunk["region"].astype(str).unique())))
+    parts = [st for chunks in per_file.values() for st, _ in chunks]
+    if not parts:
+        raise SystemExit("No raw data found.")
+
+    stats = pd.concat(parts).groupby(level=0).agg({"min": "min", "max": "max"})
+    mins, maxs = stats["min"].astype(float), stats["max"].astype(float)
+    regions = set().union(*(r for chunks in per_file.values() for _, r in chunks))
+    cats = {"region": sorted(regions), "id": sorted(map(str, stats.index))}
+    with TableWriter(out_csv_path, fmt, csv_export, categories=cats) as w:
+        for _, chunk in _iter_raw(raw_dir, chunk_rows, skip=bad):
+            mn = chunk["id"].map(mins).to_numpy()
+            span = chunk["id"].map(maxs).to_numpy() - mn
+            v = chunk["value"].astype(float).to_numpy()
+            # same expression as minmax(); constant ids normalize to 0
+            chunk["norm"] = np.where(span == 0, 0.0, (v - mn) / np.where(span == 0, 1.0, span))
+            w.write(chunk)
+    return w.close()
+
+def latent_weights(cfg: dict):
+    """
+    The config's (indicator x latent) weight matrix in sparse CSR form over indicators:
+    (ids, latents, indptr, latent_idx, weight, entry_order). Row i's entries are
+    indptr[i]:indptr[i+1]; entry_order is each entry's position in the config.
+    """
+    latents = list(cfg["latents"])
+    pos, entries = {}, []
+    for j, latent in enumerate(latents):
+        for ind in cfg["latents"][latent]["indicators"]:
+            entries.append((pos.setdefault(ind["id"], len(pos)), j, float(ind.get("weight", 1.0)), len(entries)))
+    entries.sort(key=lambda e: e[0])  # stable: keeps config order within an indicator
+    ind_idx = np.array([e[0] for e in entries], dtype=np.int64)
+    indptr = np.searchsorted(ind_idx, np.arange(len(pos) + 1))
+    lat_idx = np.array([e[1] for e in entries], dtype=np.int64)
+    weight = np.array([e[2] for e in entries], dtype=float)
+    entry_order = np.array([e[3] for e in entries], dtype=np.int64)
+    return list(pos), latents, indptr, lat_idx, weight, entry_order
+
+def build_latents(df_norm: pd.DataFrame, cfg: dict, index: PanelIndex | None = None) -> pd.DataFrame:
+    """
+    Weighted mean of normalized indicators per (region, year) for every latent in one pass:
+    the long (region-year, indicator, norm) table is treated as a sparse matrix and multiplied
+    by the sparse (indicator x latent) weights; the denominator sums the weights of the
+    indicators actually observed in each cell, so missing indicators drop out of the mean.
+    Rows are cells of the shared panel index (built from df_norm unless given).
+    """
+    ids, latents, indptr, lat_idx, weight, entry_order = latent_weights(cfg)
+    ind = pd.Index(ids).get_indexer(df_norm["id"])
+    norm = df_norm["norm"].to_numpy(dtype=float)
+    index = index or PanelIndex.from_frame(df_norm)
+    cell = index.cells(df_norm)
+    keep = (ind >= 0) & ~np.isnan(norm) & (cell >= 0)
+    ind, norm = ind[keep], norm[keep]
+
+    # region-year rows, numbered in (region, year) order by their panel cell code
+    cells, row = np.unique(cell[keep], return_inverse=True)
+
+    # expand each observation over the latents its indicator feeds (usually exactly one)
+    counts = indptr[ind + 1] - indptr[ind]
+    if np.all(counts == 1):
+        entry, obs = indptr[ind], slice(None)
+    else:
+        obs = np.repeat(np.arange(len(ind)), counts)
+        entry = indptr[ind][obs] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    n_lat = len(latents)
+    flat = row[obs] * n_lat + lat_idx[entry]
+    # one grouped sum over (cell, latent); observations are summed in config-entry order, then
+    # row order, so the compensated sums round exactly like the per-latent loop
+    seq = np.argsort(entry_order[entry], kind="stable")
+    sums = pd.DataFrame({"cell": flat[seq], "wv": (norm[obs] * weight[entry])[seq], "w": weight[entry][seq]}) \
+        .groupby("cell", sort=False).sum()
+    num = np.zeros(len(cells) * n_lat)
+    den = np.zeros(len(cells) * n_lat)
+    num[sums.index] = sums["wv"].to_numpy()
+    den[sums.index] = sums["w"].to_numpy()
+    num, den = num.reshape(-1, n_lat), den.reshape(-1, n_lat)
+    # cells a latent never saw have den == 0, as do zero-weight cells: both are NaN
+    values = np.full_like(num, np.nan)
+    np.divide(num, den, out=values, where=den != 0)
+
+    L = index.frame(cells)
+    L["year"] = L["year"].astype(df_norm["year"].dtype)
+    for j, latent in enumerate(latents):
+        L[latent] = values[:, j]
+    return L
+
+def _build_latents_loop(df_norm: pd.DataFrame, cfg: dict) -> pd.DataFrame:
+    """Reference implementation (per-latent filter/groupby/merge); kept for benchmarks."""
     out_rows = []
     for latent, spec in cfg["latents"].items():
         for ind in spec["indicators"]:
@@ -50,7 +170,7 @@ def build_latents(df_norm: pd.DataFrame, cfg: dict) -> pd.DataFrame:
         # compute weighted average explicitly to avoid groupby.apply index quirks
         sub["_wv"] = sub[f"{latent}_part"] * sub["weight"]
         tmp = (
-            sub.groupby(["region", "year"], as_index=False)
+            sub.groupby(["region", "year"], as_index=False, observed=True)
             .agg({"_wv": "sum", "weight": "sum"})
         )
         tmp[latent] = tmp["_wv"] / tmp["weight"].replace(0, np.nan)
@@ -61,23 +181,44 @@ def build_latents(df_norm: pd.DataFrame, cfg: dict) -> pd.DataFrame:
         L = L.merge(nxt, on=["region","year"], how="outer")
     return L.sort_values(["region","year"]).reset_index(drop=True)
 
-def main(config_path: str, normalize_only: bool=False):
+def main(config_path: str, normalize_only: bool=False, chunk_rows: int | None = None):
     cfg = yaml.safe_load(Path(config_path).read_text())
     interim = Path(cfg["output"]["interim_dir"]); interim.mkdir(parents=True, exist_ok=True)
     processed = Path(cfg["output"]["processed_dir"]); processed.mkdir(parents=True, exist_ok=True)
 
-    df_norm = normalize_indicators("data/raw", cfg)
-    df_norm.to_csv(interim / "indicators_normalized.csv", index=False)
+    fmt, csv_export = storage_options(cfg)
+
+    if chunk_rows:
+        with trace.span("fit_latents.normalize", streaming=True, chunk_rows=chunk_rows):
+            fp = normalize_indicators_streaming("data/raw", interim / "indicators_normalized.csv", chunk_rows,
+                                                fmt, csv_export)
+        if normalize_only:
+            print("Wrote", fp)
+            return
+        df_norm = read_table(interim / "indicators_normalized.csv", columns=["region", "year", "id", "norm"])
+    else:
+        with trace.span("fit_latents.normalize"):
+            df_norm = normalize_indicators("data/raw", cfg)
+            fp = write_table(df_norm, interim / "indicators_normalized.csv", fmt, csv_export)
+    # one (region, year) index for the panel later stages memory-map and for the latent rows
+    index = PanelIndex.from_frame(df_norm)
+    print("Wrote", save_indicator_panel(df_norm, interim / "indicators_normalized.csv", index))
     if normalize_only:
-        print("Wrote", interim / "indicators_normalized.csv")
+        print("Wrote", fp)
         return
-    latents = build_latents(df_norm, cfg)
-    latents.to_csv(processed / "latents.csv", index=False)
-    print("Wrote", processed / "latents.csv")
+    with trace.span("fit_latents.build_latents", latents=len(cfg["latents"])) as sp:
+        latents = build_latents(df_norm, cfg, index)
+        sp.add(rows=len(latents))
+    fp = write_table(latents, processed / "latents.csv", fmt, csv_export)
+    print("Wrote", fp)
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True)
     ap.add_argument("--normalize-only", action="store_true")
+    ap.add_argument("--chunk-rows", type=int, default=None,
+                    help="stream raw files in chunks of this many rows (bounded memory) instead of loading them all")
+    trace.add_arguments(ap)
     args = ap.parse_args()
-    main(args.config, normalize_only=args.normalize_only)
+    with trace.session(args, "fit_latents"):
+        main(args.config, normalize_only=args.normalize_only, chunk_rows=args.chunk_rows)
@@ -6,6 +6,10 @@ import pandas as pd
 from pathlib import Path
 import yaml
 
+from src import trace
+from src.model.panel import IndicatorPanel, indicator_panel
+from src.model.parallel import get_shared, run_tasks
+
 def project_simplex(v):
     n = v.shape[0]
     u = np.sort(v)[::-1]
@@ -26,11 +30,23 @@ def kl_div(Q, P):
     P = np.clip(P, eps, 1.0)
     return np.sum(Q * (np.log(Q) - np.log(P)))
 
-def build_sigma_matrix(df_norm: pd.DataFrame, sigma_ids):
+def build_sigma_matrix(source, sigma_ids):
+    """
+    (N, K) matrix of the sigma indicators over the (region, year) cells where all K are observed,
+    and those cells' region/year. `source` is an IndicatorPanel (e.g. the memory-mapped one from
+    indicator_panel) or a long normalized frame; rows are in (region, year) order.
+    """
+    panel = source if isinstance(source, IndicatorPanel) else IndicatorPanel.from_long(source, ids=sigma_ids)
+    X = panel.view(sigma_ids).reshape(-1, len(sigma_ids))
+    cells = np.flatnonzero(~np.isnan(X).any(axis=1))
+    return np.asarray(X[cells], dtype=float), panel.index.frame(cells)
+
+def _build_sigma_matrix_merge(df_norm: pd.DataFrame, sigma_ids):
+    """Reference implementation (left-join of every indicator onto the first one's rows); kept for benchmarks."""
     mats = []
     obs_index = None
     for sid in sigma_ids:
-        sub = df_norm[df_norm["id"] == sid][["region","year","norm"]].copy()
+        sub = df_norm[df_norm["id"] == sid][["region","year","norm"]].reset_index(drop=True)
         sub = sub.rename(columns={"norm": sid})
         if obs_index is None:
             obs_index = sub[["region","year"]]
@@ -48,10 +64,7 @@ def build_target_Q(M):
     Q = softmax(avg, axis=0)
     return Q.squeeze()
 
-def loss_and_grad(w, M, Q):
-    sigma_hat = M @ w
-    P = softmax(sigma_hat.reshape(-1,1), axis=0).squeeze()
-    L = kl_div(Q, P)
+def _numeric_grad(w, M, Q):
     grad = np.zeros_like(w)
     delta = 1e-3
     for i in range(len(w)):
@@ -62,16 +75,34 @@ def loss_and_grad(w, M, Q):
         L_pos = kl_div(Q, P_pos)
         L_neg = kl_div(Q, P_neg)
         grad[i] = (L_pos - L_neg) / (np.linalg.norm(w_pos - w_neg) + 1e-12)
-    return L, grad
+    return grad
 
-def fit_weights(M, Q, max_iter=500, lr=0.1, tol=1e-6, seed=42):
-    rng = np.random.default_rng(seed)
-    K = M.shape[1]
-    w = rng.random(K)
-    w = project_simplex(w)
+def _kl_softmax(w, M, Q):
+    # KL(Q || softmax(M w)) in log-space, plus softmax P for the gradient
+    s = M @ w
+    s = s - s.max()
+    lse = np.log(np.sum(np.exp(s)))
+    log_P = s - lse
+    L = np.sum(Q * (np.log(np.clip(Q, 1e-12, 1.0)) - log_P))
+    return L, np.exp(log_P)
+
+def loss_and_grad(w, M, Q, grad="analytic"):
+    """
+    KL(Q || softmax(M w)) and its gradient w.r.t. w.
+    grad="analytic": closed form M^T (P * sum(Q) - Q), two passes over M.
+    grad="numeric":  projected central differences (reference, O(K*N) per call).
+    """
+    if grad == "numeric":
+        sigma_hat = M @ w
+        P = softmax(sigma_hat.reshape(-1,1), axis=0).squeeze()
+        return kl_div(Q, P), _numeric_grad(w, M, Q)
+    L, P = _kl_softmax(w, M, Q)
+    return L, M.T @ (P * Q.sum() - Q)
+
+def _fit_projected_numeric(w, M, Q, max_iter, lr, tol):
     prev = 1e18
     for t in range(max_iter):
-        L, g = loss_and_grad(w, M, Q)
+        L, g = loss_and_grad(w, M, Q, grad="numeric")
         if abs(prev - L) < tol:
             break
         prev = L
@@ -79,13 +110,124 @@ def fit_weights(M, Q, max_iter=500, lr=0.1, tol=1e-6, seed=42):
         w = project_simplex(w)
         if (t+1) % 50 == 0:
             lr = lr * 0.5
-    return w, prev
+    return w, prev, t + 1
+
+def _fit_mirror_descent(w, M, Q, max_iter, lr, tol):
+    """
+    Exponentiated-gradient (entropic mirror descent) on the simplex with
+    backtracking on the relative-smoothness condition. Weights are kept in
+    log-space so no coordinate underflows to an absorbing zero. Stops once the
+    Frank-Wolfe gap g.w - min(g), an upper bound on L(w) - L*, drops below tol.
+    """
+    log_w = np.log(w)
+    L, g = loss_and_grad(w, M, Q)
+    eta = lr
+    it = 0
+    for it in range(1, max_iter + 1):
+        if g @ w - g.min() < tol:
+            break
+        while True:
+            z = log_w - eta * g
+            z = z - z.max()
+            z = z - np.log(np.sum(np.exp(z)))
+            w_new = np.exp(z)
+            L_new, P_new = _kl_softmax(w_new, M, Q)
+            bregman = np.sum(w_new * (z - log_w))
+            if L_new <= L + g @ (w_new - w) + bregman / eta + 1e-12 or eta < 1e-12:
+                break
+            eta *= 0.5
+        log_w, w, L = z, w_new, L_new
+        g = M.T @ (P_new * Q.sum() - Q)
+        eta *= 2.0
+    return w, L, it
 
-def bootstrap_ci(M, Q, B=100, **fit_kwargs):
+def fit_weights(M, Q, max_iter=500, lr=0.1, tol=1e-6, seed=42, grad="analytic"):
+    rng = np.random.default_rng(seed)
+    K = M.shape[1]
+    w = rng.random(K)
+    with trace.span("fit_weights.fit", grad=grad, N=M.shape[0], K=K) as sp:
+        if grad == "numeric":
+            w = project_simplex(w)
+            w, loss, it = _fit_projected_numeric(w, M, Q, max_iter, lr, tol)
+        else:
+            w = w / w.sum()
+            w, loss, it = _fit_mirror_descent(w, M, Q, max_iter, lr, tol)
+        sp.add(iterations=it)
+    return w, loss
+
+def bootstrap_counts(rng, B, N, scheme="multinomial"):
+    """
+    (B, N) resample multiplicities. "multinomial" consumes the generator exactly
+    like the sequential path (one integers(0, N, N) draw per replicate), so both
+    modes see identical resamples for the same seed; "poisson" uses Poisson(1) counts.
+    """
+    if scheme == "poisson":
+        return rng.poisson(1.0, size=(B, N)).astype(float)
+    C = np.empty((B, N))
+    for b in range(B):
+        C[b] = np.bincount(rng.integers(0, N, size=N), minlength=N)
+    return C
+
+def _kl_softmax_counts(W, M, C, mass, mass_log_mass):
+    # Row-wise KL(mass || softmax over the resampled copies), expressed with counts C.
+    # With S = W M^T: KL = sum(mass log q) - sum(mass S) + log sum(C exp S), since sum(mass) = 1.
+    S = W @ M.T
+    S = S - S.max(axis=1, keepdims=True)
+    E = np.exp(S)
+    Z = np.einsum("bn,bn->b", C, E)
+    L = mass_log_mass - np.einsum("bn,bn->b", mass, S) + np.log(Z)
+    return L, E / Z[:, None]
+
+def _fit_mirror_descent_batched(W, M, Q, C, max_iter, lr, tol):
+    """
+    Stacked version of _fit_mirror_descent: all rows of W (B, K) take one
+    exponentiated-gradient step per iteration, each with its own step size and
+    stopping test. Resample b is encoded by its counts C[b] instead of copied rows.
+    """
+    mass = C * Q
+    mass = mass / mass.sum(axis=1, keepdims=True)
+    # per-copy target probability is mass / C; constant term of the KL
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_q = np.where(C > 0, np.log(np.clip(mass / np.maximum(C, 1), 1e-12, 1.0)), 0.0)
+    mlm = np.einsum("bn,bn->b", mass, log_q)
+    del log_q
+    log_W = np.log(W)
+    L, P = _kl_softmax_counts(W, M, C, mass, mlm)
+    G = (C * P - mass) @ M
+    eta = np.full(W.shape[0], float(lr))
+    it = 0
+    for it in range(1, max_iter + 1):
+        pending = np.sum(G * W, axis=1) - G.min(axis=1) >= tol
+        if not pending.any():
+            break
+        while pending.any():
+            # plain slice when every row is still moving, to avoid gathering (b, N) copies
+            idx = np.nonzero(pending)[0]
+            sel = slice(None) if len(idx) == len(pending) else idx
+            Z = log_W[sel] - eta[sel, None] * G[sel]
+            Z = Z - Z.max(axis=1, keepdims=True)
+            Z = Z - np.log(np.sum(np.exp(Z), axis=1, keepdims=True))
+            W_new = np.exp(Z)
+            L_new, P_new = _kl_softmax_counts(W_new, M, C[sel], mass[sel], mlm[sel])
+            bregman = np.sum(W_new * (Z - log_W[sel]), axis=1)
+            bound = L[sel] + np.sum(G[sel] * (W_new - W[sel]), axis=1) + bregman / eta[sel] + 1e-12
+            ok = (L_new <= bound) | (eta[sel] < 1e-12)
+            acc = idx[ok]
+            log_W[acc], W[acc], L[acc] = Z[ok], W_new[ok], L_new[ok]
+            if ok.all():
+                G[sel] = (C[sel] * P_new - mass[sel]) @ M
+            else:
+                G[acc] = (C[acc] * P_new[ok] - mass[acc]) @ M
+            eta[acc] *= 2.0
+            eta[idx[~ok]] *= 0.5
+            pending[acc] = False
+    trace.count(iterations=it)
+    return W, L
+
+def _bootstrap_sequential(M, Q, B, rng, **fit_kwargs):
     N = M.shape[0]
     W = []
     Ls = []
-    rng = np.random.default_rng(0)
     for b in range(B):
         idx = rng.integers(0, N, size=N)
         Mb = M[idx, :]
@@ -94,22 +236,86 @@ def bootstrap_ci(M, Q, B=100, **fit_kwargs):
         w, loss = fit_weights(Mb, Qb, **fit_kwargs)
         W.append(w)
         Ls.append(loss)
-    W = np.stack(W, axis=0)
+    return np.stack(W, axis=0), np.asarray(Ls)
+
+def _bootstrap_batched(M, Q, B, rng, chunk=None, scheme="multinomial",
+                       max_iter=500, lr=0.1, tol=1e-6, seed=42):
+    N, K = M.shape
+    if not chunk:
+        # keep each (chunk, N) working array around 2^24 cells (~128 MB in float64)
+        chunk = max(1, (1 << 24) // max(N, 1))
+    w0 = np.random.default_rng(seed).random(K)
+    w0 = w0 / w0.sum()
+    W = np.empty((B, K))
+    Ls = np.empty(B)
+    for start in range(0, B, chunk):
+        stop = min(B, start + chunk)
+        with trace.span("fit_weights.bootstrap_chunk", replicates=stop - start, N=N):
+            C = bootstrap_counts(rng, stop - start, N, scheme=scheme)
+            Wc = np.tile(w0, (stop - start, 1))
+            W[start:stop], Ls[start:stop] = _fit_mirror_descent_batched(Wc, M, Q, C, max_iter, lr, tol)
+    return W, Ls
+
+def _bootstrap_block(task, rng):
+    n, mode, chunk, scheme, fit_kwargs = task
+    M, Q = get_shared("M"), get_shared("Q")
+    if mode == "batched":
+        return _bootstrap_batched(M, Q, n, rng, chunk=chunk, scheme=scheme, **fit_kwargs)
+    return _bootstrap_sequential(M, Q, n, rng, **fit_kwargs)
+
+def bootstrap_ci(M, Q, B=100, mode="sequential", chunk=None, scheme="multinomial", seed=0, workers=None,
+                 **fit_kwargs):
+    """
+    Percentile bootstrap of the sigma weights.
+    mode="sequential": refit on copied rows M[idx] once per replicate.
+    mode="batched":    (B, N) count weights, all replicates optimized together in
+                       chunks of `chunk` replicates (analytic gradient only).
+    workers:           None keeps a single generator stream in-process. Any integer
+                       splits B into fixed blocks of `chunk` (default 32) replicates,
+                       each with its own SeedSequence child, run over a process pool;
+                       the result is identical for every worker count.
+    """
+    if mode == "batched" and fit_kwargs.pop("grad", "analytic") != "analytic":
+        raise ValueError("batched bootstrap requires grad='analytic'")
+    if mode != "batched" and scheme != "multinomial":
+        raise ValueError("sequential bootstrap only supports scheme='multinomial'")
+    with trace.span("fit_weights.bootstrap", B=B, mode=mode, workers=workers):
+        W, Ls = _bootstrap(M, Q, B, mode, chunk, scheme, seed, workers, fit_kwargs)
     mean = W.mean(axis=0)
     lo = np.percentile(W, 2.5, axis=0)
     hi = np.percentile(W, 97.5, axis=0)
     return mean, lo, hi, float(np.mean(Ls))
 
-def main(config_path: str, df_norm_path: str = 'data/interim/indicators_normalized.csv', out_json='data/processed/weights_sigma.json'):
+def _bootstrap(M, Q, B, mode, chunk, scheme, seed, workers, fit_kwargs):
+    if workers is not None:
+        block = chunk or 32
+        tasks = [(min(block, B - s), mode, chunk, scheme, fit_kwargs) for s in range(0, B, block)]
+        parts = run_tasks(_bootstrap_block, tasks, workers=workers, shared={"M": M, "Q": Q}, seed=seed)
+        W = np.concatenate([p[0] for p in parts], axis=0)
+        Ls = np.concatenate([p[1] for p in parts])
+    elif mode == "batched":
+        W, Ls = _bootstrap_batched(M, Q, B, np.random.default_rng(seed), chunk=chunk, scheme=scheme, **fit_kwargs)
+    else:
+        W, Ls = _bootstrap_sequential(M, Q, B, np.random.default_rng(seed), **fit_kwargs)
+    return W, Ls
+
+def main(config_path: str, df_norm_path: str = 'data/interim/indicators_normalized.csv', out_json='data/processed/weights_sigma.json', grad: str = 'analytic',
+         boot_B: int = 50, boot_mode: str = 'batched', boot_chunk: int | None = None, boot_scheme: str = 'multinomial',
+         workers: int | None = None):
     cfg = yaml.safe_load(Path(config_path).read_text())
     sigma_ids = [i['id'] for i in cfg['latents']['sigma']['indicators']]
-    df_norm = pd.read_csv(df_norm_path)
-    M, obs = build_sigma_matrix(df_norm, sigma_ids)
+    with trace.span('fit_weights.sigma_matrix', ids=len(sigma_ids)) as sp:
+        # memory-mapped (region, year, indicator) panel written by fit_latents (rebuilt if stale)
+        M, obs = build_sigma_matrix(indicator_panel(df_norm_path), sigma_ids)
+        sp.add(rows=M.shape[0])
     if M.size == 0:
         raise SystemExit('No matching rows for sigma indicators; ensure IDs align with normalized data.')
     Q = build_target_Q(M)
-    w, loss = fit_weights(M, Q, max_iter=300, lr=0.2)
-    mean, lo, hi, boot_loss = bootstrap_ci(M, Q, B=50, max_iter=200, lr=0.2)
+    w, loss = fit_weights(M, Q, max_iter=300, lr=0.2, grad=grad)
+    if grad == 'numeric':
+        boot_mode = 'sequential'
+    mean, lo, hi, boot_loss = bootstrap_ci(M, Q, B=boot_B, mode=boot_mode, chunk=boot_chunk, scheme=boot_scheme,
+                                           workers=workers, max_iter=200, lr=0.2, grad=grad)
 
     out = {
         'sigma_ids': sigma_ids,
@@ -129,5 +335,18 @@ if __name__ == '__main__':
     ap.add_argument('--config', required=True)
     ap.add_argument('--norm', default='data/interim/indicators_normalized.csv')
     ap.add_argument('--out', default='data/processed/weights_sigma.json')
+    ap.add_argument('--grad', choices=['analytic', 'numeric'], default='analytic',
+                    help='analytic: closed-form gradient + mirror descent; numeric: finite-difference reference')
+    ap.add_argument('--bootstrap', choices=['batched', 'sequential'], default='batched',
+                    help='batched: stacked (B, K) optimizer over count weights; sequential: one refit per draw')
+    ap.add_argument('--bootstrap-B', type=int, default=50)
+    ap.add_argument('--bootstrap-chunk', type=int, default=None,
+                    help='replicates per batched block (bounds memory at ~chunk*N); default sized automatically')
+    ap.add_argument('--bootstrap-scheme', choices=['multinomial', 'poisson'], default='multinomial')
+    ap.add_argument('--workers', type=int, default=None,
+                    help='run bootstrap blocks on a process pool (0 = all cores); output is independent of N')
+    trace.add_arguments(ap)
     args = ap.parse_args()
-    main(args.config, args.norm, args.out)
+    with trace.session(args, 'fit_weights'):
+        main(args.config, args.norm, args.out, grad=args.grad, boot_B=args.bootstrap_B, boot_mode=args.bootstrap,
+             boot_chunk=args.bootstrap_chunk, boot_scheme=args.bootstrap_scheme, workers=args.workers)
@@ -0,0 +1,173 @@
+# src/model/formula.py
+# Moral-gradient formulas: M(t) and its variants as small expressions over the latents,
+# declared under `formulas:` in configs/indicators.yaml and compiled once into vectorized callables.
+#
+#   formulas:
+#     M:        { expr: "kappa / (sigma + eps) * rho * phi", params: { eps: 1.0e-6 } }
+#     M_log:    { expr: "log(kappa + eps) - log(sigma + eps) + log(rho + eps) + log(phi + eps)" }
+#     M_dir:    { expr: "kappa * sigma_dir * rho * phi" }
+#
+# Names are latents, params (overridable per call, scalars or arrays) or `<latent>_dir`: the latent
+# oriented by its `direction` (x when positive, 1 - x when negative). Only arithmetic, comparisons
+# and the functions in FUNCTIONS are accepted. With numexpr installed an expression is evaluated
+# in one fused pass without full-size temporaries; otherwise NumPy evaluates it block by block,
+# so temporaries stay cache-sized. Results are elementwise identical to the hand-written forms.
+import ast
+
+import numpy as np
+
+LATENTS = ("kappa", "sigma", "rho", "phi")
+DEFAULT_M = "kappa / (sigma + eps) * rho * phi"
+FUNCTIONS = {"log": np.log, "log1p": np.log1p, "exp": np.exp, "sqrt": np.sqrt, "abs": np.abs, "where": np.where}
+BLOCK = 1 << 16  # elements per NumPy block
+
+_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load, ast.Constant,
+          ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd,
+          ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+
+def _numexpr():
+    try:
+        import numexpr
+    except ImportError:
+        return None
+    return numexpr
+
+
+class _Orient(ast.NodeTransformer):
+    """Rewrite `<latent>_dir` to the latent itself or (1 - latent)."""
+
+    def __init__(self, directions):
+        self.directions = directions
+
+    def visit_Name(self, node):
+        base = node.id[:-4] if node.id.endswith("_dir") else None
+        if base not in self.directions:
+            return node
+        x = ast.Name(id=base, ctx=ast.Load())
+        if self.directions[base] == "negative":
+            x = ast.BinOp(left=ast.Constant(1.0), op=ast.Sub(), right=x)
+        return ast.copy_location(x, node)
+
+
+class Formula:
+    """One compiled expression; call it with the latent arrays (and optional param overrides)."""
+
+    def __init__(self, expr, params=None, name="M", latents=LATENTS, directions=None, engine="auto"):
+        self.name, self.expr = name, str(expr)
+        self.params = {k: float(v) for k, v in (params or {}).items()}
+        try:
+            tree = ast.parse(self.expr, mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"formula {name!r}: {e.msg} in {self.expr!r}") from None
+        tree = ast.fix_missing_locations(_Orient(dict(directions or {})).visit(tree))
+        names, funcs = set(), set()
+        for node in ast.walk(tree):
+            if not isinstance(node, _NODES):
+                raise ValueError(f"formula {name!r}: {type(node).__name__} is not allowed in {self.expr!r}")
+            if isinstance(node, ast.Call):
+                if not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS) or node.keywords:
+                    raise ValueError(f"formula {name!r}: unknown function in {self.expr!r}")
+                funcs.add(id(node.func))
+            elif isinstance(node, ast.Name) and id(node) not in funcs:
+                names.add(node.id)
+        unknown = names - set(latents) - set(self.params)
+        if unknown:
+            raise ValueError(f"formula {name!r}: unknown names {sorted(unknown)} in {self.expr!r}")
+        self.inputs = [c for c in latents if c in names]
+        self.source = ast.unparse(tree)
+
+        ne = _numexpr() if engine in ("auto", "numexpr") else None
+        if engine == "numexpr" and ne is None:
+            raise ValueError("engine 'numexpr' requested but numexpr is not installed")
+        self.engine = "numexpr" if ne is not None else "numpy"
+        self._ne = ne
+        self._code = compile(tree, f"<formula {name}>", "eval")
+
+    def __repr__(self):
+        return f"Formula({self.name!r}, {self.source!r}, engine={self.engine!r})"
+
+    def __call__(self, data=None, out=None, block=BLOCK, **params):
+        """
+        Evaluate over `data` (a DataFrame or mapping of latent arrays; keyword arrays work too).
+        Inputs broadcast against each other; `out` receives the result when given.
+        """
+        env = {**self.params, **params}
+        for c in self.inputs:
+            if c not in env:
+                env[c] = data[c]
+        env = {k: np.asarray(v, dtype=float) for k, v in env.items()}
+        shape = np.broadcast_shapes(*(v.shape for v in env.values()))
+        if out is None:
+            out = np.empty(shape)
+        if self._ne is not None:
+            return self._ne.evaluate(self.source, local_dict=env, out=out, casting="unsafe")
+        if not shape:
+            out[...] = eval(self._code, {"__builtins__": {}, **FUNCTIONS}, env)
+            return out
+        env = {k: np.broadcast_to(v, shape) for k, v in env.items()}
+        rows = max(1, block // max(1, int(np.prod(shape[1:]))))
+        for i in range(0, shape[0], rows):
+            sl = {k: v[i:i + rows] for k, v in env.items()}
+            out[i:i + rows] = eval(self._code, {"__builtins__": {}, **FUNCTIONS}, sl)
+        return out
+
+
+class FormulaSet:
+    """The config's formulas, evaluated together over one latent table."""
+
+    def __init__(self, formulas):
+        self.formulas = dict(formulas)
+
+    @classmethod
+    def from_config(cls, cfg, engine="auto"):
+        """Compile `formulas:` from indicators.yaml; without it, only the default M (eps 1e-6)."""
+        latents = list((cfg or {}).get("latents") or LATENTS)
+        directions = {k: (v or {}).get("direction", "positive") for k, v in ((cfg or {}).get("latents") or {}).items()}
+        spec = (cfg or {}).get("formulas") or {"M": {"expr": DEFAULT_M, "params": {"eps": 1e-6}}}
+        out = {}
+        for name, f in spec.items():
+            f = {"expr": f} if isinstance(f, str) else f
+            out[name] = Formula(f["expr"], f.get("params"), name, latents, directions, f.get("engine", engine))
+        return cls(out)
+
+    def __iter__(self):
+        return iter(self.formulas)
+
+    def __getitem__(self, name):
+        return self.formulas[name]
+
+    def spec(self):
+        """Canonical description (for cache keys)."""
+        return {n: [f.source, f.params] for n, f in self.formulas.items()}
+
+    def evaluate(self, data, block=BLOCK):
+        """
+        {name: values} for every formula in one pass over `data`: with the NumPy engine all
+        formulas are evaluated on each row block before moving on, so each input block is
+        loaded once while it is still in cache.
+        """
+        inputs = sorted({c for f in self.formulas.values() for c in f.inputs})
+        cols = {c: np.asarray(data[c], dtype=float) for c in inputs}
+        n = len(next(iter(cols.values()))) if cols else len(data)
+        res = {name: np.empty(n) for name in self.formulas}
+        fused = [f for f in self.formulas.values() if f.engine == "numexpr"]
+        for f in fused:
+            f(cols, out=res[f.name])
+        rest = [f for f in self.formulas.values() if f.engine != "numexpr"]
+        for i in range(0, n, block):
+            sl = {c: v[i:i + block] for c, v in cols.items()}
+            for f in rest:
+                f(sl, out=res[f.name][i:i + block], block=block)
+        return res
+
+
+_DEFAULT = {}
+
+
+def moral_gradient(kappa, sigma, rho, phi, eps, out=None):
+    """The default M = kappa / (sigma + eps) * rho * phi (inputs broadcast; eps may be an array)."""
+    f = _DEFAULT.get("M")
+    if f is None:
+        f = _DEFAULT["M"] = Formula(DEFAULT_M, {"eps": 0.0})
+    return f({"kappa": kappa, "sigma": sigma, "rho": rho, "phi": phi}, out=out, eps=eps)
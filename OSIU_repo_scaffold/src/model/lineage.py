@@ -0,0 +1,233 @@
+# src/model/lineage.py
+# Lineages of universes over many generations: every universe spawns children that start from its final
+# (rho, phi), as in sim_multigenerational, but for k children per universe and any number of generations.
+#
+#   python -m src.model.lineage --spec configs/lineage.yaml [--plot]
+#
+# The tree is a handful of arrays (parent index, child slot and parameters per node), numbered
+# breadth-first so that generation g is the contiguous node range offsets[g]:offsets[g + 1]. Each
+# generation is one batched simulate(record=False) over all of its nodes, seeded by gathering the
+# parents' final states (sim_engine.spawn); only per-node summaries and per-generation EnsembleStats
+# are kept, never trajectories.
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from src import trace
+from src.model.ensemble import EnsembleStats
+from src.model.sim_engine import regime, simulate, spawn
+
+PARAMS = ("kappa", "sigma", "drift", "lo", "hi")
+SUMMARY = ("M0", "M_mean", "M_min", "M_max", "M_final", "rho_final", "phi_final")
+
+
+class LineageTree:
+    """
+    Universes of a lineage as arrays: parent[i] (-1 for roots), slot[i] (which child of its parent it is,
+    -1 for roots) and the simulation parameters kappa, sigma, drift, lo, hi of every node. Children are
+    appended a generation at a time, contiguous and in parent order.
+    """
+
+    def __init__(self, kappa, sigma, drift, lo=-np.inf, hi=np.inf, rho0=0.7, phi0=0.6):
+        cols = [np.atleast_1d(np.asarray(x, dtype=float)) for x in (kappa, sigma, drift, lo, hi, rho0, phi0)]
+        n = np.broadcast(*cols).shape[0]
+        for name, x in zip(PARAMS, cols):
+            setattr(self, name, np.broadcast_to(x, (n,)).copy())
+        # initial state of the roots; later generations start from their parents' final states
+        self.rho0, self.phi0 = (np.broadcast_to(x, (n,)).copy() for x in cols[5:])
+        self.parent = np.full(n, -1, dtype=np.int32)
+        self.slot = np.full(n, -1, dtype=np.int16)
+        self.offsets = np.array([0, n], dtype=np.int64)
+
+    @property
+    def n_nodes(self):
+        return int(self.offsets[-1])
+
+    @property
+    def n_generations(self):
+        return len(self.offsets) - 1
+
+    def generation(self, g):
+        """Node range of generation g (0 = roots)."""
+        return slice(int(self.offsets[g]), int(self.offsets[g + 1]))
+
+    def generation_of(self, nodes=None):
+        """Generation of each node (of all nodes by default)."""
+        nodes = np.arange(self.n_nodes) if nodes is None else np.asarray(nodes)
+        return np.searchsorted(self.offsets, nodes, side="right") - 1
+
+    def ancestor(self, nodes, up=1):
+        """The ancestor `up` generations above each node (-1 past the roots), by repeated parent gathers."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        for _ in range(up):
+            nodes = np.where(nodes >= 0, self.parent[np.maximum(nodes, 0)], -1)
+        return nodes
+
+    def add_generation(self, parent, slot, **params):
+        """
+        Append a generation: child j descends from node parent[j] of the current last generation (sorted,
+        so siblings stay contiguous) as its slot[j]-th child, with per-child parameters `params`
+        (kappa, sigma, drift, lo, hi; arrays or scalars). Returns the new generation's node range.
+        """
+        parent = np.asarray(parent, dtype=np.int64)
+        last = self.generation(self.n_generations - 1)
+        if len(parent) and (parent[0] < last.start or parent[-1] >= last.stop or (np.diff(parent) < 0).any()):
+            raise ValueError(f"parents must be sorted nodes of the last generation ({last.start}..{last.stop - 1})")
+        missing = set(PARAMS) - set(params)
+        if missing:
+            raise ValueError(f"missing child parameters: {sorted(missing)}")
+        n = len(parent)
+        for name in PARAMS:
+            x = np.broadcast_to(np.asarray(params[name], dtype=float), (n,))
+            setattr(self, name, np.concatenate([getattr(self, name), x]))
+        self.parent = np.concatenate([self.parent, parent.astype(np.int32)])
+        self.slot = np.concatenate([self.slot, np.broadcast_to(np.asarray(slot, dtype=np.int16), (n,))])
+        self.offsets = np.append(self.offsets, self.offsets[-1] + n)
+        return self.generation(self.n_generations - 1)
+
+    def frame(self, **columns):
+        """Per-node table (node, parent, generation, slot, parameters) plus extra per-node `columns`."""
+        import pandas as pd
+
+        return pd.DataFrame({"node": np.arange(self.n_nodes), "parent": self.parent,
+                             "generation": self.generation_of(), "slot": self.slot,
+                             **{k: getattr(self, k) for k in PARAMS}, **columns})
+
+
+def _child_param(rule, inherited, n, rng, jitter=0.0):
+    """A child parameter: a number, "inherit" (the parent's value) or [min, max] (uniform draw), + N(0, jitter)."""
+    if isinstance(rule, str):
+        if rule != "inherit":
+            raise ValueError(f"Unknown child parameter rule: {rule!r}")
+        x = inherited.copy()
+    elif isinstance(rule, (list, tuple)):
+        x = rng.uniform(float(rule[0]), float(rule[1]), n)
+    else:
+        x = np.full(n, float(rule))
+    if jitter:
+        x = np.maximum(x + rng.normal(0.0, float(jitter), n), 0.0)
+    return x
+
+
+def grow(spec):
+    """
+    Build the tree described by a lineage spec: `roots` copies of the `root` universe, then
+    `generations - 1` generations in which every node spawns one child per entry of `children` (each
+    spawned with probability `p`, default 1, so branching may vary). Child kappa/sigma follow the
+    entry's rule (_child_param); regime/rate/cap/floor as in sim_engine.regime.
+    """
+    root = spec.get("root", {}) or {}
+    kw = {k: root[k] for k in ("cap", "floor") if k in root}
+    drift, lo, hi = regime(root.get("regime", "growth"), float(root.get("rate", 0.0005)), **kw)
+    R = int(spec.get("roots", 1))
+    tree = LineageTree(np.full(R, float(root.get("kappa", 0.9))), float(root.get("sigma", 0.2)), drift, lo, hi,
+                       float(root.get("rho0", 0.7)), float(root.get("phi0", 0.6)))
+    slots = spec.get("children", []) or []
+    seed = int(spec.get("seed", 0))
+    for g in range(1, int(spec.get("generations", 1))):
+        prev = tree.generation(g - 1)
+        n_par = prev.stop - prev.start
+        if not slots:
+            break
+        # parameter draws of generation g have their own stream, so they do not depend on the noise
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(0, g)))
+        spawned = np.ones((n_par, len(slots)), dtype=bool)
+        cols = {k: np.empty((n_par, len(slots))) for k in PARAMS}
+        for s, sp in enumerate(slots):
+            if "p" in sp:
+                spawned[:, s] = rng.random(n_par) < float(sp["p"])
+            cols["kappa"][:, s] = _child_param(sp.get("kappa", "inherit"), tree.kappa[prev], n_par, rng,
+                                               sp.get("kappa_jitter", 0.0))
+            cols["sigma"][:, s] = _child_param(sp.get("sigma", "inherit"), tree.sigma[prev], n_par, rng,
+                                               sp.get("sigma_jitter", 0.0))
+            kw = {k: sp[k] for k in ("cap", "floor") if k in sp}
+            cols["drift"][:, s], cols["lo"][:, s], cols["hi"][:, s] = regime(sp.get("regime", "growth"),
+                                                                             float(sp["rate"]), **kw)
+        # row-major nonzero keeps children grouped by parent, in slot order
+        par, slot = np.nonzero(spawned)
+        if not len(par):
+            break  # the lineage died out
+        tree.add_generation(par + prev.start, slot, **{k: v[par, slot] for k, v in cols.items()})
+    return tree
+
+
+def simulate_lineage(tree, t_steps, noise=0.01, epsilon=0.01, seed=0, compression=100, block=1024):
+    """
+    Simulate every node of `tree` for t_steps, one batched simulate() per generation, each child
+    starting from its parent's final (rho, phi). Generation g draws its noise from
+    SeedSequence(seed, spawn_key=(1, g)).
+
+    Returns (nodes, stats): nodes maps M0, M_mean, M_min, M_max, M_final, rho_final, phi_final to
+    (n_nodes,) arrays; stats is an EnsembleStats with one group per generation (M(t) distribution).
+    """
+    G = tree.n_generations
+    stats = EnsembleStats(t_steps, groups=G, compression=compression)
+    nodes = {k: np.full(tree.n_nodes, np.nan) for k in SUMMARY}
+    for g in range(G):
+        gen = tree.generation(g)
+        if gen.stop == gen.start:
+            break
+        if g == 0:
+            rho0, phi0 = tree.rho0, tree.phi0
+        else:
+            rho0, phi0 = spawn(nodes, tree.parent[gen])
+        part = EnsembleStats(t_steps, compression=compression)
+        with trace.span("lineage.generation", generation=g, nodes=gen.stop - gen.start):
+            run = simulate(tree.kappa[gen], tree.sigma[gen], rho0, phi0, t_steps, tree.drift[gen],
+                           tree.lo[gen], tree.hi[gen], noise=noise, epsilon=epsilon,
+                           rng=np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(1, g))),
+                           block=block, record=False, stats=part)
+        for k in SUMMARY:
+            nodes[k][gen] = run[k]
+        stats.merge(part, groups=[g])
+    return nodes, stats
+
+
+def lineage_dir(spec):
+    return Path(spec.get("out_dir", "data/processed/lineages")) / spec.get("name", "lineage")
+
+
+def main(spec_path="configs/lineage.yaml", plot=False):
+    """
+    Grow and simulate the lineage of `spec_path` and write <out_dir>/<name>/: nodes.parquet (one row
+    per universe: tree, parameters and M summaries), generations.parquet (per generation and t: count,
+    mean, std, min, max and quantiles of M) and ensemble.npz (the per-generation accumulators).
+    """
+    from src.model.sweep import load_spec
+
+    spec = load_spec(spec_path)
+    with trace.span("lineage.grow"):
+        tree = grow(spec)
+    T = int(spec.get("t_steps", 200))
+    sizes = np.diff(tree.offsets)
+    print(f"Lineage {spec.get('name', 'lineage')}: {tree.n_nodes} universes in {tree.n_generations} generations "
+          f"({', '.join(map(str, sizes))})")
+    nodes, stats = simulate_lineage(tree, T, noise=float(spec.get("noise", 0.01)),
+                                    epsilon=float(spec.get("epsilon", 0.01)), seed=int(spec.get("seed", 0)),
+                                    compression=int(spec.get("compression", 100)))
+
+    out = lineage_dir(spec)
+    out.mkdir(parents=True, exist_ok=True)
+    with trace.span("lineage.write", nodes=tree.n_nodes):
+        tree.frame(**nodes).to_parquet(out / "nodes.parquet", index=False)
+        quantiles = [float(q) for q in spec.get("quantiles", [0.05, 0.5, 0.95])]
+        (stats.frame(quantiles, group_ids=np.arange(tree.n_generations))
+              .rename(columns={"group": "generation"})
+              .to_parquet(out / "generations.parquet", index=False))
+        stats.save(out / "ensemble.npz")
+    print("Wrote", out)
+    if plot:
+        from src.viz.plots import plot_lineage
+        plot_lineage(str(out))
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--spec", default="configs/lineage.yaml")
+    ap.add_argument("--plot", action="store_true", help="render the per-generation M(t) figure afterwards")
+    trace.add_arguments(ap)
+    args = ap.parse_args()
+    with trace.session(args, "lineage"):
+        main(args.spec, plot=args.plot)
@@ -0,0 +1,202 @@
+# src/model/panel.py
+# Shared (region, year) panel index: regions and years are mapped to dense integer codes once, and
+# stages align tables by array indexing instead of string-keyed merges and sorts.
+#
+#   idx = PanelIndex.from_frame(df)             # sorted regions x the full annual year grid
+#   r, y = idx.codes(df)                        # int codes per row (-1: not in the index)
+#   X, mask = idx.dense(df, ["sigma", "rho"])   # (regions, years, columns) views + validity mask
+#
+# The normalized indicators are kept as an IndicatorPanel, values[region, year, indicator], written
+# by fit_latents next to the interim table (data/interim/indicators_panel/) and memory-mapped by
+# later stages (fit_weights, the validation notebooks) instead of being rebuilt from the long table.
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src import trace
+
+
+class PanelIndex:
+    """Sorted regions x consecutive years; cell (r, y) has the flat code r * n_years + y."""
+
+    __slots__ = ("regions", "years")
+
+    def __init__(self, regions, years):
+        self.regions = pd.Index(regions, dtype=object)
+        self.years = np.asarray(years, dtype=np.int64)
+
+    @classmethod
+    def from_frame(cls, df, region="region", year="year"):
+        regions = np.sort(pd.Index(pd.unique(df[region].dropna())).astype(str).unique().to_numpy(dtype=object))
+        y = pd.to_numeric(df[year], errors="coerce").dropna()
+        years = np.arange(int(y.min()), int(y.max()) + 1) if len(y) else np.empty(0, np.int64)
+        return cls(regions, years)
+
+    @property
+    def shape(self):
+        return len(self.regions), len(self.years)
+
+    def codes(self, df, region="region", year="year"):
+        """(region codes, year codes) of each row; -1 where the region or year is missing or outside the index."""
+        # hash the column once; only its distinct values are matched against the index
+        local, uniq = pd.factorize(df[region])
+        lookup = np.append(self.regions.get_indexer(pd.Index(uniq).astype(str)), -1).astype(np.int64)
+        r = lookup[local]  # local == -1 (missing region) picks the appended -1
+        yv = pd.to_numeric(df[year], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        y = np.full(len(yv), -1, dtype=np.int64)
+        ok = ~np.isnan(yv)
+        if len(self.years):
+            y[ok] = yv[ok].astype(np.int64) - self.years[0]
+        y[(y < 0) | (y >= len(self.years))] = -1
+        return r, y
+
+    def cells(self, df, region="region", year="year"):
+        """Flat cell code of each row (-1 outside the index)."""
+        r, y = self.codes(df, region, year)
+        return np.where((r >= 0) & (y >= 0), r * len(self.years) + y, -1)
+
+    def dense(self, df, cols, region="region", year="year"):
+        """(regions, years, len(cols)) float array of df's columns on the grid (NaN where unobserved) and its mask."""
+        r, y = self.codes(df, region, year)
+        ok = (r >= 0) & (y >= 0)
+        X = np.full((*self.shape, len(cols)), np.nan)
+        for k, c in enumerate(cols):
+            X[r[ok], y[ok], k] = df[c].to_numpy(dtype=float, na_value=np.nan)[ok]
+        return X, ~np.isnan(X)
+
+    def frame(self, cells):
+        """region/year columns of flat cell codes."""
+        cells = np.asarray(cells, dtype=np.int64)
+        T = len(self.years)
+        return pd.DataFrame({"region": self.regions.take(cells // T).to_numpy(), "year": self.years[cells % T]})
+
+    def to_json(self):
+        return {"regions": list(self.regions), "year0": int(self.years[0]) if len(self.years) else 0,
+                "n_years": len(self.years)}
+
+    @classmethod
+    def from_json(cls, d):
+        return cls(d["regions"], np.arange(d["year0"], d["year0"] + d["n_years"]))
+
+
+class IndicatorPanel:
+    """values[region, year, indicator] (NaN where unobserved; duplicate observations averaged)."""
+
+    def __init__(self, index: PanelIndex, ids, values, source=None):
+        self.index, self.ids, self.values, self.source = index, list(ids), values, source
+
+    @classmethod
+    def from_long(cls, df, ids=None, index=None, value="norm"):
+        """Panel of a long (region, year, id, value) table; `ids` fixes the indicator axis (absent ids stay NaN)."""
+        v = df[value].to_numpy(dtype=float, na_value=np.nan)
+        keep = ~np.isnan(v)
+        local, uniq = pd.factorize(df["id"])
+        uniq = pd.Index(uniq).astype(str)
+        if ids is None:
+            ids = sorted(uniq.unique())
+        index = index or PanelIndex.from_frame(df)
+        R, T = index.shape
+        k = np.append(pd.Index(list(ids)).get_indexer(uniq), -1)[local]
+        cell = index.cells(df)
+        keep &= (k >= 0) & (cell >= 0)
+        flat = cell[keep] * len(ids) + k[keep]
+        n = R * T * len(ids)
+        sums = np.bincount(flat, weights=v[keep], minlength=n)
+        cnt = np.bincount(flat, minlength=n)
+        values = np.full(n, np.nan)
+        np.divide(sums, cnt, out=values, where=cnt > 0)
+        return cls(index, ids, values.reshape(R, T, len(ids)))
+
+    @property
+    def mask(self):
+        return ~np.isnan(self.values)
+
+    def view(self, ids):
+        """(regions, years, len(ids)) values of the given indicators (NaN for ids not in the panel)."""
+        k = pd.Index(self.ids).get_indexer(list(ids))
+        if (k >= 0).all():
+            return self.values[:, :, k]
+        out = np.full((*self.index.shape, len(k)), np.nan)
+        out[:, :, k >= 0] = self.values[:, :, k[k >= 0]]
+        return out
+
+    def save(self, path, source=None):
+        """values.npy + index.json under `path` (index.json last, so a partial write is never loaded)."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        (path / "index.json").unlink(missing_ok=True)
+        np.save(path / "values.npy", np.ascontiguousarray(self.values))
+        meta = {**self.index.to_json(), "ids": self.ids, "source": source}
+        (path / "index.json").write_text(json.dumps(meta), encoding="utf-8")
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """The saved panel with values memory-mapped read-only (mmap=False loads it into memory)."""
+        path = Path(path)
+        meta = json.loads((path / "index.json").read_text(encoding="utf-8"))
+        values = np.load(path / "values.npy", mmap_mode="r" if mmap else None)
+        return cls(PanelIndex.from_json(meta), meta["ids"], values, meta.get("source"))
+
+
+def join_on_index(frames):
+    """
+    Outer join of (region, year, columns...) frames on one panel index, sorted by (region, year):
+    what chained merges on ["region", "year"] give, by array indexing. Years keep the first frame's dtype.
+    """
+    index = PanelIndex.from_frame(pd.concat([f[["region", "year"]] for f in frames], ignore_index=True))
+    R, T = index.shape
+    cols = [c for f in frames for c in f.columns if c not in ("region", "year")]
+    X = np.full((R * T, len(cols)), np.nan)
+    seen = np.zeros(R * T, dtype=bool)
+    j = 0
+    for f in frames:
+        cell = index.cells(f)
+        ok = cell >= 0
+        seen[cell[ok]] = True
+        for c in f.columns.drop(["region", "year"]):
+            X[cell[ok], j] = f[c].to_numpy(dtype=float, na_value=np.nan)[ok]
+            j += 1
+    cells = np.flatnonzero(seen)
+    out = index.frame(cells)
+    out["year"] = out["year"].astype(frames[0]["year"].dtype)
+    for j, c in enumerate(cols):
+        out[c] = X[cells, j]
+    return out
+
+
+def panel_path(table_csv):
+    """data/interim/indicators_normalized.csv -> data/interim/indicators_panel"""
+    p = Path(table_csv)
+    return p.with_name(p.stem.replace("_normalized", "") + "_panel")
+
+
+def save_indicator_panel(df_norm, table_csv, index=None):
+    """Build the panel of the normalized table just written to `table_csv` and save it next to it."""
+    from src.storage import table_fingerprint
+
+    with trace.span("panel.build", rows=len(df_norm)) as sp:
+        panel = IndicatorPanel.from_long(df_norm, index=index)
+        fp = panel.save(panel_path(table_csv), source=table_fingerprint(table_csv))
+        sp.add(bytes_written=panel.values.nbytes)
+    return fp
+
+
+def indicator_panel(table_csv):
+    """
+    The memory-mapped panel of the normalized table, rebuilt (and saved) when it is missing or
+    older than the table, e.g. after a normalize run that predates the panel.
+    """
+    from src.storage import read_table, table_fingerprint
+
+    path = panel_path(table_csv)
+    source = table_fingerprint(table_csv)
+    if (path / "index.json").exists():
+        panel = IndicatorPanel.load(path)
+        if panel.source == source:
+            trace.count(bytes_read=panel.values.nbytes)
+            return panel
+    save_indicator_panel(read_table(table_csv, columns=["region", "year", "id", "norm"]), table_csv)
+    return IndicatorPanel.load(path)
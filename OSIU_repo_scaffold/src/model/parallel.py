@@ -0,0 +1,89 @@
+# src/model/parallel.py
+# Shared process-pool executor for embarrassingly parallel model workloads
+# (bootstrap replicates, parameter sweeps).
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Read-only arrays visible to tasks in the current process (set per worker by _init_worker)
+_SHARED = {}
+_SHM_HANDLES = []
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    # Workers share the parent's resource tracker, so attaching does not take
+    # ownership; the parent unlinks the segment once the pool has shut down.
+    shm = shared_memory.SharedMemory(name=name)
+    _SHM_HANDLES.append(shm)
+    arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    arr.flags.writeable = False
+    return arr
+
+
+def _init_worker(specs):
+    _SHARED.clear()
+    for key, spec in specs.items():
+        _SHARED[key] = _attach(spec)
+
+
+def get_shared(key):
+    """Return a read-only input published through run_tasks(shared=...)."""
+    return _SHARED[key]
+
+
+def _call(fn, task, seed):
+    if seed is None:
+        return fn(task)
+    return fn(task, np.random.default_rng(seed))
+
+
+def resolve_workers(workers):
+    if workers is None or workers < 1:
+        return os.cpu_count() or 1
+    return int(workers)
+
+
+def run_tasks(fn, tasks, workers=1, shared=None, seed=None):
+    """
+    Map fn over tasks and return results in task order.
+
+    fn must be a module-level function. If seed is given, task i is called as
+    fn(task, rng) with rng built from the i-th child of SeedSequence(seed).spawn,
+    so results depend only on the task list, never on the worker count.
+    Arrays in `shared` (name -> ndarray) are copied once into shared memory and
+    read inside tasks with get_shared(name) instead of being pickled per task.
+    workers=1 runs inline; workers=0 or None uses every available core.
+    """
+    tasks = list(tasks)
+    shared = shared or {}
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks)) if seed is not None else [None] * len(tasks)
+    workers = min(resolve_workers(workers), max(1, len(tasks)))
+
+    if workers == 1:
+        saved = dict(_SHARED)
+        _SHARED.clear()
+        _SHARED.update({k: np.asarray(v) for k, v in shared.items()})
+        try:
+            return [_call(fn, t, s) for t, s in zip(tasks, seeds)]
+        finally:
+            _SHARED.clear()
+            _SHARED.update(saved)
+
+    blocks, specs = [], {}
+    try:
+        for key, arr in shared.items():
+            arr = np.ascontiguousarray(arr)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+            blocks.append(shm)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            specs[key] = (shm.name, arr.shape, arr.dtype.str)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(specs,)) as ex:
+            futures = [ex.submit(_call, fn, t, s) for t, s in zip(tasks, seeds)]
+            return [f.result() for f in futures]
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,150 @@
+# src/model/sim_engine.py
+# Vectorized multi-universe simulation kernel shared by the sim_* scripts.
+#
+# Every universe follows the same update as the original per-step loops:
+#     rho[t] = clamp(rho[t-1] + drift + N(0, noise))
+#     phi[t] = clamp(phi[t-1] + drift + N(0, noise))
+#     M[t]   = (kappa / (sigma + epsilon)) * rho[t] * phi[t]     (src.model.formula.moral_gradient)
+# but a whole population of U universes advances together as arrays.
+import numpy as np
+
+from src.model.formula import moral_gradient
+
+# Default clamps used by the scripts: growth saturates at a cap, decay stops at a floor
+GROWTH_CAP = 0.95
+DECAY_FLOOR = 0.1
+
+
+def regime(kind, rate, cap=GROWTH_CAP, floor=DECAY_FLOOR):
+    """
+    (drift, lo, hi) for one regime.
+    "growth": balanced child, +rate per step, clamped above at `cap`.
+    "decay":  utopian child, -rate per step (stagnation), clamped below at `floor`.
+    """
+    if kind == "growth":
+        return rate, -np.inf, cap
+    if kind == "decay":
+        return -rate, floor, np.inf
+    raise ValueError(f"Unknown regime: {kind}")
+
+
+def population(specs):
+    """Stack a list of per-universe dicts (kappa, sigma, regime, rate, ...) into parameter arrays."""
+    out = {"kappa": [], "sigma": [], "drift": [], "lo": [], "hi": []}
+    for sp in specs:
+        kw = {k: sp[k] for k in ("cap", "floor") if k in sp}
+        drift, lo, hi = regime(sp.get("regime", "growth"), sp["rate"], **kw)
+        out["kappa"].append(sp["kappa"])
+        out["sigma"].append(sp["sigma"])
+        out["drift"].append(drift)
+        out["lo"].append(lo)
+        out["hi"].append(hi)
+    return {k: np.asarray(v, dtype=float) for k, v in out.items()}
+
+
+def _draw_block(rng, steps, U, noise):
+    # Layout (step, [rho, phi], universe): contiguous per-step rows. For a single
+    # universe this consumes the stream exactly like the scalar loops (rho then phi per step).
+    if isinstance(rng, (list, tuple)):
+        # one generator per universe (reproduces independently seeded legacy runs)
+        scales = np.broadcast_to(noise, (U,))
+        return np.stack([g.normal(0, s, size=(steps, 2)) for g, s in zip(rng, scales)], axis=2)
+    return rng.normal(0, noise, size=(steps, 2, U))
+
+
+def simulate(kappa, sigma, rho0, phi0, t_steps, drift, lo=-np.inf, hi=np.inf,
+             noise=0.01, epsilon=0.01, rng=None, block=1024, record=True, stats=None, groups=None):
+    """
+    Advance U universes for t_steps (step 0 is the seeded state).
+
+    All parameters (noise and epsilon included) broadcast to shape (U,). `rng` is
+    a Generator shared by the population or a list with one Generator per universe.
+    Noise is pre-drawn in blocks of `block` steps; the block size does not change results.
+
+    Returns a dict with "rho_final", "phi_final" (U,) and, if record=True,
+    "rho", "phi", "M" trajectories of shape (U, t_steps). With record=False, M is
+    evaluated block by block instead and only per-universe "M0", "M_final", "M_mean",
+    "M_min", "M_max" are kept, so memory is O(U) rather than O(U x t_steps). `stats` (an
+    src.model.ensemble.EnsembleStats over t_steps, `groups` mapping universes to its
+    groups) receives every step's M.
+    """
+    U = np.broadcast(*(np.atleast_1d(x) for x in (kappa, sigma, rho0, phi0, drift, lo, hi))).shape[0]
+
+    def _vec(x):
+        return np.broadcast_to(np.asarray(x, dtype=float), (U,))
+
+    rho, phi = _vec(rho0).copy(), _vec(phi0).copy()
+    drift, lo, hi = _vec(drift), _vec(lo), _vec(hi)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if record:
+        # time-major buffers keep each step's write contiguous
+        rho_tr = np.empty((t_steps, U))
+        phi_tr = np.empty((t_steps, U))
+        rho_tr[0], phi_tr[0] = rho, phi
+    else:
+        # one block of steps at a time (at most ~2**18 cells, so buffers stay small for large U);
+        # M summaries accumulate as the blocks complete
+        block = max(1, min(block, (1 << 18) // max(U, 1)))
+        rho_tr = np.empty((min(block, max(t_steps - 1, 1)), U))
+        phi_tr = np.empty_like(rho_tr)
+        kap, sig, eps_ = _vec(kappa), _vec(sigma), _vec(epsilon)
+        M = moral_gradient(kap, sig, rho, phi, eps_)
+        summary = {"M0": M.copy(), "M_final": M.copy(), "M_min": M.copy(), "M_max": M.copy(), "M_sum": M.copy()}
+        if stats is not None:
+            stats.update(0, M[None, :], groups)
+
+        def _observe(t0, R, P):
+            M = moral_gradient(kap, sig, R, P, eps_)
+            if stats is not None:
+                stats.update(t0, M, groups)
+            np.minimum(summary["M_min"], M.min(axis=0), out=summary["M_min"])
+            np.maximum(summary["M_max"], M.max(axis=0), out=summary["M_max"])
+            summary["M_sum"] += M.sum(axis=0)
+            summary["M_final"] = M[-1]
+
+    # skip clamps that cannot bind anywhere in the population
+    clamp_lo = bool(np.isfinite(lo).any())
+    clamp_hi = bool(np.isfinite(hi).any())
+
+    t = 1
+    while t < t_steps:
+        steps = min(block, t_steps - t)
+        eps = _draw_block(rng, steps, U, noise)
+        for k in range(steps):
+            for x, e in ((rho, eps[k, 0]), (phi, eps[k, 1])):
+                # in-place form of clamp(x + drift + e), same operation order as the scalar loops
+                x += drift
+                x += e
+                if clamp_lo:
+                    np.maximum(x, lo, out=x)
+                if clamp_hi:
+                    np.minimum(x, hi, out=x)
+            row = t + k if record else k
+            rho_tr[row] = rho
+            phi_tr[row] = phi
+        if not record:
+            _observe(t, rho_tr[:steps], phi_tr[:steps])
+        t += steps
+
+    out = {"rho_final": rho, "phi_final": phi}
+    if record:
+        rho_tr, phi_tr = rho_tr.T, phi_tr.T
+        # out keeps the trajectories' (time-major) layout, so reductions over M sum in the same order
+        M = moral_gradient(_vec(kappa)[:, None], _vec(sigma)[:, None], rho_tr, phi_tr, _vec(epsilon)[:, None],
+                           out=np.empty_like(rho_tr))
+        out.update(rho=rho_tr, phi=phi_tr, M=M)
+        if stats is not None:
+            stats.update(0, M.T, groups)
+    else:
+        summary["M_mean"] = summary.pop("M_sum") / t_steps
+        out.update(summary)
+    return out
+
+
+def spawn(result, parent_idx=None):
+    """Initial (rho0, phi0) for children, gathered from their parents' final states."""
+    if parent_idx is None:
+        return result["rho_final"], result["phi_final"]
+    return result["rho_final"][parent_idx], result["phi_final"][parent_idx]
@@ -1,119 +1,57 @@
 # src/model/sim_multigen_sweep.py
-import numpy as np
-import matplotlib.pyplot as plt
+import argparse
 from pathlib import Path
-import pandas as pd
 import textwrap
 
+from src.model.sweep import load_spec, run, sweep_dir
+
 def _save_caption(img_path: Path, text: str):
     img_path.with_suffix(".txt").write_text(textwrap.fill(text, width=100), encoding="utf-8")
 
-def _run_single(t_steps, epsilon, rho_initial, phi_initial,
-                parent_kappa, parent_sigma,
-                balanced_kappa, balanced_sigma,
-                grandchild_sigma, growth_rate,
-                decay_rate=0.001, noise=0.01, seed=1234):
-    rng = np.random.default_rng(seed)
-
-    # Parent
-    parent_M = (parent_kappa / (parent_sigma + epsilon)) * rho_initial * phi_initial
-
-    # Balanced child
-    M = np.zeros(t_steps)
-    rho = np.zeros(t_steps)
-    phi = np.zeros(t_steps)
-
-    M[0] = (balanced_kappa / (balanced_sigma + epsilon)) * rho_initial * phi_initial
-    rho[0] = rho_initial
-    phi[0] = phi_initial
-
-    for t in range(1, t_steps):
-        rho[t] = min(0.95, rho[t-1] + growth_rate + rng.normal(0, noise))
-        phi[t] = min(0.95, phi[t-1] + growth_rate + rng.normal(0, noise))
-        M[t] = (balanced_kappa / (balanced_sigma + epsilon)) * rho[t] * phi[t]
-
-    # Normalize relative to run itself (so each panel shows shape clearly)
-    M_min, M_max = float(np.min(M)), float(np.max(M))
-    M_norm = (M - M_min) / (M_max - M_min + 1e-12)
-    parent_M_norm = (parent_M - M_min) / (M_max - M_min + 1e-12)
-
-    return M_norm, parent_M_norm
-
-def main():
-    out_figs = Path("results/figures"); out_figs.mkdir(parents=True, exist_ok=True)
-    out_data = Path("data/processed"); out_data.mkdir(parents=True, exist_ok=True)
-
-    # Fixed params (aligned with sim_multigenerational)
-    t_steps = 200
-    epsilon = 0.01
-    rho_initial = 0.7
-    phi_initial = 0.6
-    parent_kappa = 0.9
-    parent_sigma = 0.05
-    balanced_kappa = 0.9
-    grandchild_sigma = 0.15
-
-    # Sweep grids
-    balanced_sigma_grid = [0.12, 0.22]   # slight adversity vs. moderate adversity
-    growth_rate_grid = [0.0003, 0.0008]  # slower vs. faster adaptation
-
-    # Create panel
-    fig, axes = plt.subplots(2, 2, figsize=(12, 9), sharex=True, sharey=True)
-    plt.subplots_adjust(hspace=0.28, wspace=0.15)
-
-    records = []
-    t = np.arange(t_steps)
-
-    for i, bs in enumerate(balanced_sigma_grid):
-        for j, gr in enumerate(growth_rate_grid):
-            ax = axes[i, j]
-            M_norm, parent_M_norm = _run_single(
-                t_steps, epsilon, rho_initial, phi_initial,
-                parent_kappa, parent_sigma,
-                balanced_kappa, bs, grandchild_sigma, gr,
-                decay_rate=0.001, noise=0.01, seed=1234 + i*10 + j
-            )
-            ax.plot(t, M_norm, label="Balanced Child M(t)", color="tab:green")
-            ax.axhline(parent_M_norm, color="k", linestyle="--", label="Parent M(t) (norm)")
-            ax.set_title(f"σ_bal={bs:.2f}, growth={gr:.4f}")
-            ax.grid(True)
-            if i == 1: ax.set_xlabel("Time")
-            if j == 0: ax.set_ylabel("Normalized M(t) [0,1]")
-
-            # Save series to records
-            for k in range(t_steps):
-                records.append({
-                    "t": int(k),
-                    "balanced_sigma": bs,
-                    "growth_rate": gr,
-                    "M_norm": float(M_norm[k]),
-                    "parent_M_norm": float(parent_M_norm),
-                })
-
-    # Common legend
-    handles, labels = axes[0,0].get_legend_handles_labels()
-    fig.legend(handles, labels, loc="lower center", ncol=2, bbox_to_anchor=(0.5, -0.02))
-    fig.suptitle("Parameter Sweep: Balanced σ vs. Growth Rate → M(t) Behavior", y=1.02, fontsize=14)
-
-    fp = out_figs / "sim_multigen_sweep.png"
-    plt.tight_layout()
-    plt.savefig(fp, dpi=300, bbox_inches="tight")
-    plt.close()
-
-    caption = (
-        "Figure: Parameter sweep showing normalized M(t) under two balanced σ values (columns) and two growth rates "
-        "(rows). Even very small adversity (σ_bal ≈ 0.12–0.22) sustains or improves M(t) relative to the parent baseline "
-        "(dashed), provided adaptation growth is non-zero. Extremely low σ_bal or very low growth would flatten trajectories. "
-        "This panel demonstrates robustness of the claim that non-zero σ at seeding preserves a viable moral gradient."
-    )
-    _save_caption(fp, caption)
-    print(f"Wrote {fp} and {fp.with_suffix('.txt')}")
-
-    # Write CSV for audit
-    df = pd.DataFrame.from_records(records)
-    out_csv = out_data / "sim_multigen_sweep.csv"
-    df.to_csv(out_csv, index=False, encoding="utf-8")
+CAPTION = (
+    "Figure: Parameter sweep showing normalized M(t) under two balanced σ values (columns) and two growth rates "
+    "(rows). Even very small adversity (σ_bal ≈ 0.12–0.22) sustains or improves M(t) relative to the parent baseline "
+    "(dashed), provided adaptation growth is non-zero. Extremely low σ_bal or very low growth would flatten trajectories. "
+    "This panel demonstrates robustness of the claim that non-zero σ at seeding preserves a viable moral gradient."
+)
+
+def plot(spec_path: str = "configs/sweep.yaml"):
+    """Render the sweep panel from the stored sweep output (separate from running it)."""
+    from src.viz.plots import plot_sweep
+    spec = load_spec(spec_path)
+    fp = plot_sweep(str(sweep_dir(spec)), out_png="results/figures/sim_multigen_sweep.png")
+    _save_caption(fp, CAPTION)
+
+def main(spec_path: str = "configs/sweep.yaml", workers: int = 1, fresh: bool = False):
+    """
+    Run the sweep described by `spec_path` (default: the balanced σ × growth grid)
+    through src.model.sweep, then export the stored trajectories to the flat
+    data/processed/sim_multigen_sweep.csv audit table when they were kept.
+    """
+    import pandas as pd
+
+    spec = load_spec(spec_path)
+    out = run(spec, workers=workers, fresh=fresh)
+    if not (out / "trajectories").exists():
+        return
+    traj = pd.read_parquet(out / "trajectories", columns=["point", "replicate", "t", "M_norm", "parent_M_norm"])
+    pts = pd.read_parquet(out / "summary", columns=["point", "replicate", "sigma", "growth"])
+    df = (traj.merge(pts, on=["point", "replicate"])
+              .rename(columns={"sigma": "balanced_sigma", "growth": "growth_rate"})
+              .sort_values(["point", "replicate", "t"]))
+    out_csv = Path("data/processed") / "sim_multigen_sweep.csv"
+    df[["t", "balanced_sigma", "growth_rate", "M_norm", "parent_M_norm"]].to_csv(out_csv, index=False, encoding="utf-8")
     print(f"Wrote {out_csv}")
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--spec", default="configs/sweep.yaml")
+    ap.add_argument("--workers", type=int, default=1, help="process-pool size for sweep chunks (0 = all cores)")
+    ap.add_argument("--fresh", action="store_true", help="discard stored sweep parts instead of resuming")
+    ap.add_argument("--plot", action="store_true", help="render the panel figure after the sweep")
+    ap.add_argument("--plot-only", action="store_true", help="only render the panel from the stored sweep output")
+    args = ap.parse_args()
+    if not args.plot_only:
+        main(args.spec, workers=args.workers, fresh=args.fresh)
+    if args.plot or args.plot_only:
+        plot(args.spec)
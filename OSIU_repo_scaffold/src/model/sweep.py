@@ -0,0 +1,340 @@
+# src/model/sweep.py
+# Large-grid parameter sweeps over the simulation engine, streamed to partitioned Parquet.
+#
+#   python -m src.model.sweep run  --spec configs/sweep.yaml [--workers N] [--fresh]
+#   python -m src.model.sweep plot --spec configs/sweep.yaml
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from src import trace
+from src.model.ensemble import EnsembleStats
+from src.model.formula import moral_gradient
+from src.model.parallel import run_tasks
+from src.model.sim_engine import DECAY_FLOOR, GROWTH_CAP, simulate
+
+# Parameters a spec may vary (continuous) and their defaults (aligned with sim_multigenerational)
+CONTINUOUS = ("epsilon", "kappa", "sigma", "growth", "decay", "noise", "rho0", "phi0")
+# ... and those only a grid may vary (seed: base seed of the points' noise streams, replacing `seed`)
+DISCRETE = ("regime", "seed")
+DEFAULTS = {
+    "t_steps": 200, "epsilon": 0.01, "kappa": 0.9, "sigma": 0.2, "growth": 0.0005, "decay": 0.001,
+    "noise": 0.01, "rho0": 0.7, "phi0": 0.6, "regime": "growth", "cap": GROWTH_CAP, "floor": DECAY_FLOOR,
+    "parent_kappa": 0.9, "parent_sigma": 0.05,
+}
+
+# Joe & Kuo (new-joe-kuo-6.21201) primitive polynomials for Sobol dimensions 2..8: (s, a, m_1..m_s)
+_SOBOL_DIRS = [
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+]
+_SOBOL_BITS = 32
+
+
+def _sobol_directions(d):
+    V = np.zeros((d, _SOBOL_BITS), dtype=np.uint64)
+    V[0] = [1 << (_SOBOL_BITS - 1 - b) for b in range(_SOBOL_BITS)]
+    for j in range(1, d):
+        s, a, m = _SOBOL_DIRS[j - 1]
+        v = [0] * (_SOBOL_BITS + 1)
+        for i in range(1, s + 1):
+            v[i] = m[i - 1] << (_SOBOL_BITS - i)
+        for i in range(s + 1, _SOBOL_BITS + 1):
+            v[i] = v[i - s] ^ (v[i - s] >> s)
+            for k in range(1, s):
+                v[i] ^= ((a >> (s - 1 - k)) & 1) * v[i - k]
+        V[j] = v[1:]
+    return V
+
+
+def sobol(n, d):
+    """First n points of the (unscrambled) Sobol sequence in [0, 1)^d, computed by index."""
+    if d > len(_SOBOL_DIRS) + 1:
+        raise ValueError(f"sobol design supports at most {len(_SOBOL_DIRS) + 1} varied parameters")
+    V = _sobol_directions(d)
+    idx = np.arange(n, dtype=np.uint64)
+    gray = idx ^ (idx >> np.uint64(1))
+    X = np.zeros((n, d), dtype=np.uint64)
+    for b in range(_SOBOL_BITS):
+        bit = ((gray >> np.uint64(b)) & np.uint64(1)).astype(bool)
+        X[bit] ^= V[:, b]
+    return X.astype(float) / float(1 << _SOBOL_BITS)
+
+
+def latin_hypercube(n, d, rng):
+    """One stratum per point along every dimension, jittered within the stratum."""
+    U = np.empty((n, d))
+    for j in range(d):
+        U[:, j] = (rng.permutation(n) + rng.random(n)) / n
+    return U
+
+
+def _scale(u, rng_spec):
+    lo, hi = float(rng_spec["min"]), float(rng_spec["max"])
+    if rng_spec.get("log", False):
+        return np.exp(np.log(lo) + u * (np.log(hi) - np.log(lo)))
+    return lo + u * (hi - lo)
+
+
+def build_design(spec):
+    """
+    Dict of per-point parameter arrays. "grid" takes the Cartesian product of the
+    listed values (`regime` and the noise `seed` may be varied too); "lhs" and "sobol"
+    draw `n_points` from {min, max[, log]} ranges. Every point is repeated `replicates` times.
+    With `seeding: legacy` (grid only, one replicate) every point gets the seed the original
+    sim_multigen_sweep loops used, seed + i*10 + j for grid indices (i, j) (one digit per axis).
+    """
+    vary = spec.get("vary", {}) or {}
+    kind = spec.get("design", "grid")
+    names = list(vary)
+    if "seeds" in names:
+        raise ValueError("vary the noise seed as `seed: [...]` (or use `replicates` for independent draws)")
+    seeding = spec.get("seeding", "spawn")
+    if seeding not in ("spawn", "legacy"):
+        raise ValueError(f"seeding must be spawn or legacy, got {seeding!r}")
+    if seeding == "legacy" and (kind != "grid" or "seed" in names or int(spec.get("replicates", 1)) != 1):
+        raise ValueError("seeding: legacy needs a grid design with one replicate and no seed axis")
+    if kind == "grid":
+        bad = [k for k in names if k not in CONTINUOUS + DISCRETE]
+        if bad:
+            raise ValueError(f"grid design can only vary {CONTINUOUS + DISCRETE}; got {bad}")
+        axes = []
+        for k in names:
+            v = vary[k]
+            if isinstance(v, dict):
+                v = np.linspace(float(v["min"]), float(v["max"]), int(v["num"]))
+            axes.append(np.asarray(v))
+        mesh = np.meshgrid(*axes, indexing="ij") if axes else []
+        cols = {k: m.ravel() for k, m in zip(names, mesh)}
+        n = mesh[0].size if axes else 1
+        if seeding == "legacy":
+            if any(len(a) > 10 for a in axes):
+                raise ValueError("seeding: legacy gives each grid axis one decimal digit (at most 10 values)")
+            index = np.meshgrid(*(np.arange(len(a)) for a in axes), indexing="ij") if axes else []
+            cols["seed"] = int(spec.get("seed", 0)) + sum(
+                (m.ravel() * 10 ** (len(index) - 1 - a) for a, m in enumerate(index)), np.zeros(n, dtype=np.int64))
+    elif kind in ("lhs", "sobol"):
+        bad = [k for k in names if k not in CONTINUOUS]
+        if bad:
+            raise ValueError(f"{kind} design can only vary {CONTINUOUS}; got {bad}")
+        n = int(spec["n_points"])
+        if kind == "lhs":
+            U = latin_hypercube(n, len(names), np.random.default_rng(spec.get("seed", 0)))
+        else:
+            U = sobol(n, len(names))
+        cols = {k: _scale(U[:, j], vary[k]) for j, k in enumerate(names)}
+    else:
+        raise ValueError(f"Unknown design: {kind}")
+
+    reps = int(spec.get("replicates", 1))
+    fixed = {**DEFAULTS, **(spec.get("fixed", {}) or {})}
+    design = {"point": np.repeat(np.arange(n), reps), "replicate": np.tile(np.arange(reps), n)}
+    for k in CONTINUOUS + ("regime",):
+        design[k] = np.repeat(cols[k], reps) if k in cols else np.full(n * reps, fixed[k])
+    if "seed" in cols:
+        design["seed"] = np.repeat(np.asarray(cols["seed"], dtype=np.int64), reps)
+    return design
+
+
+def ensemble_spec(spec):
+    """The spec's `ensemble` options ({quantiles, compression}) or None when it is off."""
+    ens = spec.get("ensemble", False)
+    if not ens:
+        return None
+    ens = ens if isinstance(ens, dict) else {}
+    return {"quantiles": [float(q) for q in ens.get("quantiles", [0.05, 0.5, 0.95])],
+            "compression": int(ens.get("compression", 100))}
+
+
+def spec_hash(spec):
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _run_chunk(task):
+    """Simulate one chunk of sweep points as a single population and write its Parquet parts."""
+    with trace.span("sweep.chunk", chunk=task[0], points=len(task[1]["point"])):
+        return _simulate_chunk(task)
+
+
+def _simulate_chunk(task):
+    import pandas as pd
+
+    chunk_id, rows, spec, out_dir = task
+    fixed = {**DEFAULTS, **(spec.get("fixed", {}) or {})}
+    idx = np.arange(len(rows["point"])) + rows["_offset"]
+    seeds = rows.get("seed", np.full(len(idx), int(spec.get("seed", 0))))
+    if spec.get("seeding", "spawn") == "legacy":
+        # the original per-panel generators (build_design assigned each point its legacy seed)
+        rngs = [np.random.default_rng(int(s)) for s in seeds]
+    else:
+        # One generator per point keyed by its global index: results do not depend on chunking
+        rngs = [np.random.default_rng(np.random.SeedSequence(int(s), spawn_key=(int(i),))) for s, i in zip(seeds, idx)]
+
+    growth = rows["regime"] == "growth"
+    drift = np.where(growth, rows["growth"], -rows["decay"])
+    lo = np.where(growth, -np.inf, float(fixed["floor"]))
+    hi = np.where(growth, float(fixed["cap"]), np.inf)
+    T = int(fixed["t_steps"])
+    # per-point online statistics of M(t); without stored trajectories M is never held as (U, T)
+    ens = ensemble_spec(spec)
+    stats = groups = None
+    if ens:
+        points, groups = np.unique(rows["point"], return_inverse=True)
+        stats = EnsembleStats(T, len(points), ens["compression"])
+    record = bool(spec.get("trajectories", False))
+    run = simulate(rows["kappa"], rows["sigma"], rows["rho0"], rows["phi0"], T,
+                   drift, lo, hi, noise=rows["noise"], epsilon=rows["epsilon"], rng=rngs, record=record,
+                   stats=stats, groups=groups)
+    if record:
+        M = run["M"]
+        run.update(M0=M[:, 0], M_final=M[:, -1], M_mean=M.mean(axis=1), M_min=M.min(axis=1), M_max=M.max(axis=1))
+
+    parent_M = moral_gradient(fixed["parent_kappa"], fixed["parent_sigma"], rows["rho0"], rows["phi0"], rows["epsilon"])
+    M_min, M_max = run["M_min"], run["M_max"]
+    span = M_max - M_min + 1e-12
+    summary = pd.DataFrame({k: v for k, v in rows.items() if not k.startswith("_")})
+    for k in ("M0", "M_final", "M_mean", "M_min", "M_max"):
+        summary[k] = run[k]
+    summary["M_final_norm"] = (run["M_final"] - M_min) / span
+    summary["parent_M"] = parent_M
+    summary["parent_M_norm"] = (parent_M - M_min) / span
+    summary["rho_final"] = run["rho_final"]
+    summary["phi_final"] = run["phi_final"]
+
+    # summary is written last: its presence marks the chunk as complete for resume
+    parts = {}
+    if stats is not None:
+        parts["ensemble"] = {"point": points, **stats.state()}
+    if record:
+        U, T = M.shape
+        parts["trajectories"] = pd.DataFrame({
+            "point": np.repeat(rows["point"], T),
+            "replicate": np.repeat(rows["replicate"], T),
+            "t": np.tile(np.arange(T), U),
+            "M_norm": ((M - M_min[:, None]) / span[:, None]).ravel(),
+            "parent_M_norm": np.repeat((parent_M - M_min) / span, T),
+        })
+    parts["summary"] = summary
+    for name, df in parts.items():
+        fp = Path(out_dir) / name / f"part-{chunk_id:06d}.parquet"
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        tmp = fp.with_suffix(".parquet.tmp")
+        if isinstance(df, dict):
+            fp = fp.with_suffix(".npz")
+            with open(tmp, "wb") as fh:
+                np.savez(fh, **df)
+        else:
+            df.to_parquet(tmp, index=False)
+        os.replace(tmp, fp)  # atomic: a part either exists completely or not at all
+    return len(summary)
+
+
+def ensemble_table(out, spec):
+    """
+    Merge the chunks' ensemble parts per design point (a point's replicates may span two chunks) and
+    write <out>/ensemble.parquet: per point and t the count, mean, std, min, max and quantiles of M, the
+    same normalized by the point's merged extrema (*_norm) and the normalized parent baseline.
+    """
+    import pandas as pd
+
+    ens = ensemble_spec(spec)
+    parts = sorted((Path(out) / "ensemble").glob("part-*.npz"))
+    if not ens or not parts:
+        # a table from an earlier spec must not outlive it (plot_sweep would draw it)
+        (Path(out) / "ensemble.parquet").unlink(missing_ok=True)
+        return None
+    with trace.span("sweep.ensemble", parts=len(parts)):
+        summary = pd.read_parquet(Path(out) / "summary", columns=["point", "parent_M"])
+        parent = summary.groupby("point")["parent_M"].first()
+        total = None
+        for fp in parts:
+            with np.load(fp) as z:
+                part = EnsembleStats.from_state(z)
+                if total is None:
+                    total = EnsembleStats(part.shape[1], len(parent), part.compression)
+                total.merge(part, parent.index.get_indexer(z["point"]))
+        df = total.frame(ens["quantiles"], group_ids=parent.index.to_numpy()).rename(columns={"group": "point"})
+        norm = total.frame(ens["quantiles"], normalize=True)
+        stat_cols = [c for c in norm.columns if c not in ("group", "t", "n")]
+        for c in stat_cols:
+            df[f"{c}_norm"] = norm[c].to_numpy()
+        lo, hi = total.extrema()
+        df["parent_M_norm"] = np.repeat((parent.to_numpy() - lo) / (hi - lo + 1e-12), total.shape[1])
+        fp = Path(out) / "ensemble.parquet"
+        df.to_parquet(fp, index=False)
+    return fp
+
+
+def sweep_dir(spec):
+    return Path(spec.get("out_dir", "data/processed/sweeps")) / spec.get("name", "sweep")
+
+
+def run(spec, workers=1, fresh=False):
+    """
+    Evaluate the design in chunks of `chunk_size` points and stream each chunk to
+    <out_dir>/<name>/{summary,trajectories}/part-NNNNNN.parquet (and ensemble/part-NNNNNN.npz
+    accumulators, merged into ensemble.parquet at the end, when `ensemble` is set). Chunks whose part
+    already exists are skipped, so an interrupted sweep resumes where it stopped.
+    """
+    out = sweep_dir(spec)
+    manifest = out / "_spec.json"
+    h = spec_hash(spec)
+    if manifest.exists() and not fresh:
+        prev = json.loads(manifest.read_text(encoding="utf-8"))
+        if prev.get("hash") != h:
+            raise SystemExit(f"{out} holds a different sweep spec; rerun with --fresh to overwrite.")
+    elif fresh and out.exists():
+        for fp in [*out.glob("*/part-*.parquet"), *out.glob("*/part-*.npz"), out / "ensemble.parquet"]:
+            fp.unlink(missing_ok=True)
+    out.mkdir(parents=True, exist_ok=True)
+    manifest.write_text(json.dumps({"hash": h, "spec": spec}, indent=2, default=str), encoding="utf-8")
+
+    design = build_design(spec)
+    n = len(design["point"])
+    chunk = int(spec.get("chunk_size", 4096))
+    tasks = []
+    for cid, start in enumerate(range(0, n, chunk)):
+        if (out / "summary" / f"part-{cid:06d}.parquet").exists():
+            continue
+        rows = {k: v[start:start + chunk] for k, v in design.items()}
+        rows["_offset"] = start
+        tasks.append((cid, rows, spec, str(out)))
+    n_chunks = -(-n // chunk)
+    print(f"Sweep {spec.get('name', 'sweep')}: {n} points in {n_chunks} chunks ({n_chunks - len(tasks)} already done)")
+    done = run_tasks(_run_chunk, tasks, workers=workers)
+    print("Wrote", sum(done), "points to", out)
+    fp = ensemble_table(out, spec)
+    if fp:
+        print("Wrote", fp)
+    return out
+
+
+def load_spec(path):
+    return yaml.safe_load(Path(path).read_text())
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("command", choices=["run", "plot"])
+    ap.add_argument("--spec", default="configs/sweep.yaml")
+    ap.add_argument("--workers", type=int, default=1, help="process-pool size for chunks (0 = all cores)")
+    ap.add_argument("--fresh", action="store_true", help="discard existing parts instead of resuming")
+    trace.add_arguments(ap)
+    args = ap.parse_args()
+    spec = load_spec(args.spec)
+    with trace.session(args, f"sweep.{args.command}"):
+        if args.command == "run":
+            run(spec, workers=args.workers, fresh=args.fresh)
+        else:
+            from src.viz.plots import plot_sweep
+            plot_sweep(str(sweep_dir(spec)))
@@ -0,0 +1,330 @@
+# src/pipeline.py
+# Incremental, content-addressed runner for the Makefile stages.
+#
+#   python -m src.pipeline run   [--config configs/indicators.yaml] [--stages ...] [--force STAGE ...]
+#   python -m src.pipeline clean
+#
+# Every stage hashes its inputs (raw file contents, the config slice it reads and the
+# source of the modules that implement it) and is skipped when nothing changed.
+# Partitions are recomputed selectively:
+#   validate    per raw file
+#   normalize   per indicator id (min-max is per id, so a changed file re-normalizes its ids)
+#   fit_latents per latent, and per region inside a latent when only some regions' rows moved
+#   plots       per figure (one per latent column, plus the M heatmap)
+# State lives under .cache/pipeline/.
+import argparse
+import hashlib
+import json
+import shutil
+import time
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from src import trace
+from src.storage import read_table, storage_options, table_exists, write_table
+
+CACHE = Path(".cache/pipeline")
+STAGES = ["fetch", "validate", "normalize", "fit_latents", "compute_M", "plots"]
+# fetch hits the network, so it only runs when requested with --stages
+DEFAULT_STAGES = STAGES[1:]
+LATENT_VARS = ["kappa", "sigma", "rho", "phi"]
+
+
+def _sha(*parts):
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p if isinstance(p, bytes) else json.dumps(p, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:16]
+
+
+def code_version(*modules):
+    """Hash of the source files implementing a stage."""
+    return _sha(*[Path(m.replace(".", "/") + ".py").read_bytes() for m in modules])
+
+
+def frame_hash(df):
+    return _sha(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes(), list(df.columns))
+
+
+def file_sha(fp, prev=None):
+    """Content hash of a file, reusing the cached one while size and mtime are unchanged."""
+    st = fp.stat()
+    stat = [st.st_size, st.st_mtime_ns]
+    if prev and prev.get("stat") == stat:
+        return prev["sha"], stat
+    return _sha(fp.read_bytes()), stat
+
+
+class Run:
+    """Per-invocation context: config, persisted state and per-stage stats."""
+
+    def __init__(self, config_path, datasources_path, raw_dir="data/raw", force=()):
+        self.config_path = config_path
+        self.datasources_path = datasources_path
+        self.cfg = yaml.safe_load(Path(config_path).read_text())
+        self.raw_dir = Path(raw_dir)
+        self.interim = Path(self.cfg["output"]["interim_dir"])
+        self.processed = Path(self.cfg["output"]["processed_dir"])
+        self.force = set(force)
+        self.fmt, self.csv_export = storage_options(self.cfg)
+        self.state_fp = CACHE / "state.json"
+        self.state = json.loads(self.state_fp.read_text(encoding="utf-8")) if self.state_fp.exists() else {}
+        # regions whose normalized rows changed, per id (None = every region)
+        self.changed_regions = {}
+
+    def section(self, stage):
+        return self.state.setdefault(stage, {})
+
+    def save(self):
+        CACHE.mkdir(parents=True, exist_ok=True)
+        self.state_fp.write_text(json.dumps(self.state, indent=1), encoding="utf-8")
+
+
+# === Stages ===
+def stage_fetch(run):
+    from src.etl.fetch_all import main as fetch_main
+
+    ds = yaml.safe_load(Path(run.datasources_path).read_text())
+    key = _sha({k: ds.get(k) for k in ("worldbank", "owid")},
+               code_version("src.etl.fetch_all", "src.etl.fetch_worldbank", "src.etl.fetch_owid",
+                            "src.etl.http_cache"))
+    st = run.section("fetch")
+    if st.get("key") == key and "fetch" not in run.force:
+        return 0, 1
+    fetch_main(run.datasources_path)
+    st["key"] = key
+    return 1, 1
+
+
+def stage_validate(run):
+    from src.etl.validate_schema import SCHEMA, validate_files
+
+    # validate_files caches per file content hash itself (.cache/validate/)
+    files = sorted(fp for fp in run.raw_dir.glob("*.csv") if "README" not in fp.name.upper())
+    results, recomputed = validate_files(files, SCHEMA, force="validate" in run.force)
+    bad = [fp for fp, r in results.items() if not r["ok"]]
+    for fp in bad:
+        print("Schema invalid:", fp, "; ".join(results[fp]["errors"]))
+    if bad:
+        print("validate: bad files:", len(bad))
+    return recomputed, len(files)
+
+
+def _read_raw(fp):
+    """A raw file's rows read as fit_latents reads them (None, with a warning, when unreadable)."""
+    from src.model.fit_latents import _iter_raw
+
+    return next(_iter_raw(fp))[1]
+
+
+def stage_normalize(run):
+    from src.model.fit_latents import minmax
+    from src.model.panel import save_indicator_panel
+
+    code = code_version("src.model.fit_latents", "src.pipeline")
+    st = run.section("normalize")
+    parts_dir = CACHE / "normalize"
+    parts = st.get("parts", {}) if st.get("code") == code and "normalize" not in run.force else {}
+    old_raw = run.state.get("raw", {})
+    files = sorted(run.raw_dir.glob("*.csv"))
+
+    new_raw, frames, affected = {}, {}, set()
+    for fp in files:
+        prev = old_raw.get(str(fp))
+        sha, stat = file_sha(fp, prev)
+        if prev and prev["sha"] == sha and parts:
+            new_raw[str(fp)] = prev
+            continue
+        df = _read_raw(fp)
+        frames[str(fp)] = df
+        ids = sorted(df["id"].astype(str).unique()) if df is not None else []
+        new_raw[str(fp)] = {"sha": sha, "stat": stat, "ids": ids}
+        affected.update(ids)
+        affected.update(prev.get("ids", []) if prev else [])
+    for path, prev in old_raw.items():
+        if path not in new_raw:
+            affected.update(prev.get("ids", []))
+    if not parts:
+        affected.update(i for rec in new_raw.values() for i in rec["ids"])
+    run.state["raw"] = new_raw
+
+    # every file holding an affected id is needed to re-derive that id's min/max
+    need = [p for p, rec in new_raw.items() if affected.intersection(rec["ids"])]
+    for p in need:
+        if p not in frames:
+            frames[p] = _read_raw(Path(p))
+    got = [frames[p] for p in need if frames[p] is not None]
+    df = pd.concat(got, ignore_index=True) if got else pd.DataFrame(columns=["region", "year", "value", "id"])
+    df = df[df["id"].isin(affected)]
+
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    for id_ in sorted(affected):
+        sub = df[df["id"] == id_].copy()
+        fp = parts_dir / f"{id_}.parquet"
+        old = pd.read_parquet(fp) if fp.exists() and id_ in parts else None
+        if sub.empty:
+            parts.pop(id_, None)
+            fp.unlink(missing_ok=True)
+            run.changed_regions[id_] = None
+            continue
+        sub["norm"] = minmax(sub["value"])
+        sub = sub.reset_index(drop=True)
+        h = frame_hash(sub)
+        if parts.get(id_) == h:
+            continue
+        if old is None:
+            run.changed_regions[id_] = None
+        else:
+            key = ["region", "year", "value", "norm"]
+            diff = pd.concat([old[key], sub[key]]).drop_duplicates(keep=False)
+            run.changed_regions[id_] = set(diff["region"])
+        sub.to_parquet(fp, index=False)
+        parts[id_] = h
+
+    out = run.interim / "indicators_normalized.csv"
+    if run.changed_regions or not table_exists(out) or st.get("out") != _sha(parts):
+        all_parts = pd.concat([pd.read_parquet(parts_dir / f"{i}.parquet") for i in sorted(parts)], ignore_index=True)
+        write_table(all_parts, out, run.fmt, run.csv_export)
+        save_indicator_panel(all_parts, out)
+    run.state["normalize"] = {"code": code, "parts": parts, "out": _sha(parts)}
+    return len(run.changed_regions), len(parts)
+
+
+def stage_fit_latents(run):
+    from src.model.fit_latents import build_latents
+    from src.model.panel import join_on_index
+
+    code = code_version("src.model.fit_latents")
+    st = run.section("fit_latents")
+    parts = run.state.get("normalize", {}).get("parts", {})
+    lat_dir = CACHE / "latents"
+    lat_dir.mkdir(parents=True, exist_ok=True)
+    recomputed = 0
+    frames = []
+    for latent, spec in run.cfg["latents"].items():
+        ids = [i["id"] for i in spec["indicators"]]
+        key = _sha(spec, code)
+        inputs = {i: parts.get(i) for i in ids}
+        prev = st.get(latent, {})
+        fp = lat_dir / f"{latent}.parquet"
+        cfg_one = {"latents": {latent: spec}}
+        if prev.get("key") == key and prev.get("inputs") == inputs and fp.exists() and "fit_latents" not in run.force:
+            frames.append(pd.read_parquet(fp))
+            continue
+        recomputed += 1
+        rows = [pd.read_parquet(CACHE / "normalize" / f"{i}.parquet") for i in ids if parts.get(i)]
+        df_norm = pd.concat(rows, ignore_index=True) if rows else None
+        changed = [i for i in ids if prev.get("inputs", {}).get(i) != inputs[i]]
+        regions = set()
+        for i in changed:
+            r = run.changed_regions.get(i, None)
+            if r is None:
+                regions = None
+                break
+            regions |= r
+        partial = (prev.get("key") == key and fp.exists() and regions is not None
+                   and "fit_latents" not in run.force)
+        if df_norm is None:
+            frame = pd.DataFrame(columns=["region", "year", latent])
+        elif partial:
+            # only some regions' rows moved: rebuild those regions and patch the cached column
+            frame = pd.read_parquet(fp)
+            sub = df_norm[df_norm["region"].isin(regions)]
+            patch = build_latents(sub, cfg_one) if not sub.empty else frame.iloc[:0]
+            frame = pd.concat([frame[~frame["region"].isin(regions)], patch], ignore_index=True)
+            frame = frame.sort_values(["region", "year"]).reset_index(drop=True)
+        else:
+            frame = build_latents(df_norm, cfg_one)
+        frame.to_parquet(fp, index=False)
+        st[latent] = {"key": key, "inputs": inputs}
+        frames.append(frame)
+
+    out = run.processed / "latents.csv"
+    if recomputed or not table_exists(out):
+        write_table(join_on_index(frames), out, run.fmt, run.csv_export)
+    return recomputed, len(run.cfg["latents"])
+
+
+def stage_compute_M(run):
+    from src.model.compute_M import main as compute_main
+
+    latents = read_table(run.processed / "latents.csv")
+    directions = {k: (v or {}).get("direction") for k, v in run.cfg["latents"].items()}
+    key = _sha(frame_hash(latents), run.cfg["output"], run.cfg.get("formulas"), directions,
+               code_version("src.model.compute_M", "src.model.formula", "src.storage"))
+    st = run.section("compute_M")
+    outs = [run.processed / "M_timeseries.csv", run.processed / "coverage_latents_by_region.csv"]
+    if st.get("key") == key and all(table_exists(o) for o in outs) and "compute_M" not in run.force:
+        return 0, 1
+    # patches only the rows whose interpolation window moved; --force compute_M recomputes everything
+    compute_main(run.config_path, incremental="compute_M" not in run.force)
+    st["key"] = key
+    return 1, 1
+
+
+def stage_plots(run):
+    from src.viz.plots import render_all
+
+    # render_all keeps its own per-figure input hashes (.cache/plots/) and skips unchanged figures
+    opts = run.cfg.get("plots") or {}
+    return render_all(str(run.processed / "latents.csv"), str(run.processed / "M_timeseries.csv"),
+                      workers=opts.get("workers", 0), draft=opts.get("draft", False),
+                      fmt=opts.get("format", "png"), force="plots" in run.force, variables=LATENT_VARS)
+
+
+STAGE_FUNCS = {
+    "fetch": stage_fetch,
+    "validate": stage_validate,
+    "normalize": stage_normalize,
+    "fit_latents": stage_fit_latents,
+    "compute_M": stage_compute_M,
+    "plots": stage_plots,
+}
+
+
+def run_pipeline(config_path, datasources_path="configs/datasources.yaml", stages=None, force=()):
+    from tabulate import tabulate
+
+    run = Run(config_path, datasources_path, force=force)
+    rows = []
+    for stage in stages or DEFAULT_STAGES:
+        t0 = time.perf_counter()
+        with trace.span(f"pipeline.{stage}") as sp:
+            recomputed, total = STAGE_FUNCS[stage](run)
+            sp.add(recomputed=recomputed, partitions=total)
+        dt = time.perf_counter() - t0
+        status = "hit" if recomputed == 0 else ("miss" if recomputed >= total else "partial")
+        rows.append([stage, status, f"{recomputed}/{total}", total - recomputed, f"{dt:.3f}"])
+        run.save()
+    print(tabulate(rows, headers=["stage", "cache", "recomputed", "hits", "seconds"]))
+    hits = sum(r[3] for r in rows)
+    misses = sum(int(r[2].split("/")[0]) for r in rows)
+    print(f"partitions: {hits} cached, {misses} recomputed")
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("run")
+    r.add_argument("--config", default="configs/indicators.yaml")
+    r.add_argument("--datasources", default="configs/datasources.yaml")
+    r.add_argument("--stages", nargs="+", choices=STAGES, default=None,
+                   help="stages to run, in pipeline order (default: all but fetch)")
+    r.add_argument("--force", nargs="+", choices=STAGES, default=[], help="ignore the cache for these stages")
+    trace.add_arguments(r)
+    sub.add_parser("clean")
+    args = ap.parse_args()
+    if args.command == "clean":
+        from src.etl.validate_schema import CACHE as VALIDATE_CACHE
+        from src.viz.plots import HASHES
+
+        for d in (CACHE, HASHES.parent, VALIDATE_CACHE.parent):
+            shutil.rmtree(d, ignore_errors=True)
+            print("Removed", d)
+    else:
+        stages = [s for s in STAGES if s in (args.stages or DEFAULT_STAGES)]
+        with trace.session(args, "pipeline", stages=stages):
+            run_pipeline(args.config, args.datasources, stages=stages, force=args.force)
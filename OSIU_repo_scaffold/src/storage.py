@@ -0,0 +1,327 @@
+# src/storage.py
+# Columnar storage for the interim/processed tables (Parquet by default, Arrow IPC/Feather optional).
+#
+# Tables are addressed by their legacy CSV path (e.g. data/processed/latents.csv) so CLI
+# arguments stay the same; the store lives next to it:
+#   parquet: latents.parquet, or a hive-partitioned directory (indicators_normalized/id=.../,
+#            M_timeseries/region=.../) whose partitions can be replaced one at a time
+#   feather: latents.feather (memory-mapped on read)
+# Reads fall back to the CSV when no store exists yet.
+from pathlib import Path
+
+import pandas as pd
+
+from src import trace
+
+# Fixed schemas. Columns not listed (latent names, M_raw, ...) are stored as float64.
+KEY_TYPES = {"region": "category", "id": "category", "year": "int32"}
+SCHEMAS = {
+    "indicators_normalized": {"region": "category", "year": "int32", "value": "float64",
+                              "id": "category", "norm": "float64"},
+    "latents": {"region": "category", "year": "int32"},
+    "M_timeseries": {"region": "category", "year": "int32", "M_raw": "float64", "M": "float64"},
+    "coverage_latents_by_region": {"region": "category"},
+    "dynamics_coefficients": {"region": "category", "model": "category", "target": "category", "term": "category"},
+    "dynamics_diagnostics": {"region": "category", "model": "category", "target": "category", "n": "int32",
+                             "k": "int32", "iterations": "int32", "converged": "bool"},
+}
+PARTITIONS = {"indicators_normalized": "id", "M_timeseries": "region"}
+FORMATS = ("parquet", "feather", "csv")
+
+
+def storage_options(cfg):
+    """(format, csv_export) from the config's output section."""
+    out = (cfg or {}).get("output", {})
+    fmt = out.get("format", "parquet")
+    if fmt not in FORMATS:
+        raise ValueError(f"output.format must be one of {FORMATS}, got {fmt!r}")
+    return fmt, bool(out.get("csv_export", False))
+
+
+def apply_schema(df, name, categories=None):
+    """Cast `df` to the table's schema; `categories` ({col: values}) pins categorical dictionaries."""
+    schema = SCHEMAS.get(name, KEY_TYPES)
+    df = df.copy()
+    for col in df.columns:
+        dt = schema.get(col, KEY_TYPES.get(col, "float64"))
+        if dt == "category":
+            cats = (categories or {}).get(col)
+            df[col] = df[col].astype(str).astype("category" if cats is None else pd.CategoricalDtype(cats))
+        elif dt.startswith("int"):
+            df[col] = pd.to_numeric(df[col]).round().astype(dt)
+        elif dt == "bool":
+            # CSV round trips give "True"/"False" strings
+            if not pd.api.types.is_bool_dtype(df[col]):
+                df[col] = df[col].astype(str).str.lower().isin(["true", "1", "1.0"])
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dt)
+    return df
+
+
+def _paths(csv_path):
+    p = Path(csv_path)
+    stem = p.with_suffix("")
+    return {"csv": p, "parquet": stem.with_suffix(".parquet"), "dataset": stem, "feather": stem.with_suffix(".feather")}
+
+
+def _schema_order(name, cols, part):
+    """Columns with the partition column (which readers append last) moved back to its schema position."""
+    cols = [c for c in cols if c != part]
+    keys = list(SCHEMAS.get(name, {}))
+    after = keys[keys.index(part) + 1:] if part in keys else []
+    nxt = next((c for c in after if c in cols), None)
+    cols.insert(cols.index(nxt) if nxt else len(cols), part)
+    return cols
+
+
+def write_table(df, csv_path, fmt="parquet", csv_export=False):
+    """Write `df` under its schema in `fmt`; also write the CSV when csv_export (or fmt == "csv")."""
+    with trace.span("storage.write", table=Path(csv_path).stem, format=fmt) as sp:
+        written = _write_table(df, csv_path, fmt, csv_export)
+        sp.add(rows=len(df), bytes_written=trace.file_bytes(written) if trace.enabled() else None)
+        if csv_export and fmt != "csv" and trace.enabled():
+            sp.add(bytes_written=trace.file_bytes(csv_path))
+    return written
+
+
+def _write_table(df, csv_path, fmt, csv_export):
+    import shutil
+
+    paths = _paths(csv_path)
+    name = paths["csv"].stem
+    paths["csv"].parent.mkdir(parents=True, exist_ok=True)
+    typed = apply_schema(df, name)
+    if fmt == "parquet":
+        part = PARTITIONS.get(name)
+        if part and part in typed.columns:
+            if paths["dataset"].exists():
+                shutil.rmtree(paths["dataset"])
+            typed.to_parquet(paths["dataset"], index=False, partition_cols=[part])
+            paths["parquet"].unlink(missing_ok=True)
+        else:
+            typed.to_parquet(paths["parquet"], index=False)
+        written = paths["dataset"] if part and part in typed.columns else paths["parquet"]
+    elif fmt == "feather":
+        typed.reset_index(drop=True).to_feather(paths["feather"])
+        written = paths["feather"]
+    else:
+        written = paths["csv"]
+    if fmt == "csv" or csv_export:
+        df.to_csv(paths["csv"], index=False)
+    # stores left over from another format would shadow this one on read (dataset > parquet > feather > csv)
+    for key in ("dataset", "parquet", "feather"):
+        if paths[key] != written:
+            if paths[key].is_dir():
+                shutil.rmtree(paths[key])
+            else:
+                paths[key].unlink(missing_ok=True)
+    return written
+
+
+class TableWriter:
+    """
+    Append chunks to a table in the same layout as write_table, without holding it in memory.
+    Pass `categories` (all values of each categorical column) so every chunk shares one dictionary;
+    otherwise Arrow IPC cannot append them and Parquet readers would re-order the categories.
+    """
+
+    def __init__(self, csv_path, fmt="parquet", csv_export=False, categories=None):
+        import shutil
+
+        self.paths = _paths(csv_path)
+        self.name = self.paths["csv"].stem
+        self.fmt, self.csv_export, self.categories = fmt, csv_export or fmt == "csv", categories
+        self.part = PARTITIONS.get(self.name) if fmt == "parquet" else None
+        self.writer = self.schema = None
+        self.n = 0
+        self._counted = False
+        self.paths["csv"].parent.mkdir(parents=True, exist_ok=True)
+        if self.paths["dataset"].is_dir():
+            shutil.rmtree(self.paths["dataset"])
+        for key in ("parquet", "feather") + (("csv",) if self.csv_export else ()):
+            self.paths[key].unlink(missing_ok=True)
+
+    def write(self, df):
+        import pyarrow as pa
+
+        if df.empty:
+            return
+        typed = apply_schema(df, self.name, self.categories)
+        if self.part:
+            typed.to_parquet(self.paths["dataset"], index=False, partition_cols=[self.part],
+                             basename_template=f"part-{self.n:06d}-{{i}}.parquet")
+        elif self.fmt in ("parquet", "feather"):
+            table = pa.Table.from_pandas(typed, schema=self.schema, preserve_index=False)
+            if self.writer is None:
+                import pyarrow.ipc as ipc
+                import pyarrow.parquet as pq
+
+                self.schema = table.schema
+                self.writer = (pq.ParquetWriter(self.paths["parquet"], self.schema) if self.fmt == "parquet"
+                               else ipc.new_file(self.paths["feather"], self.schema))
+            self.writer.write_table(table)
+        if self.csv_export:
+            df.to_csv(self.paths["csv"], index=False, mode="a", header=self.n == 0)
+        self.n += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if trace.enabled() and not self._counted:
+            self._counted = True
+            trace.count(bytes_written=sum(trace.file_bytes(self.paths[k]) for k in ("dataset", "parquet", "feather"))
+                        + (trace.file_bytes(self.paths["csv"]) if self.csv_export else 0))
+        if self.part:
+            return self.paths["dataset"]
+        return self.paths["parquet"] if self.fmt == "parquet" else self.paths[self.fmt]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_table(csv_path, columns=None, filters=None):
+    """
+    Load a table by its legacy CSV path, reading only `columns` when given.
+    `filters` is a {column: [allowed values]} dict; on a partitioned Parquet
+    dataset filters on the partition column prune whole directories.
+    """
+    with trace.span("storage.read", table=Path(csv_path).stem) as sp:
+        df, src = _read_table(csv_path, columns, filters)
+        if trace.enabled():
+            part = PARTITIONS.get(src.stem) if src.is_dir() else None
+            if part and part in (filters or {}):
+                # partition pruning: only the selected directories were read
+                from urllib.parse import quote
+                nbytes = sum(trace.file_bytes(src / f"{part}={quote(str(v), safe='')}") for v in filters[part])
+            else:
+                nbytes = trace.file_bytes(src)
+            sp.add(rows=len(df), bytes_read=nbytes)
+    return df
+
+
+def _read_table(csv_path, columns, filters):
+    paths = _paths(csv_path)
+    name = paths["csv"].stem
+    pa_filters = [(c, "in", list(v)) for c, v in (filters or {}).items()] or None
+    if paths["dataset"].is_dir() or paths["parquet"].exists():
+        src = paths["dataset"] if paths["dataset"].is_dir() else paths["parquet"]
+        df = pd.read_parquet(src, columns=columns, filters=pa_filters)
+        part = PARTITIONS.get(name)
+        if part in df.columns and str(df[part].dtype) == "category":
+            # partition values come back as an unordered dictionary; keep only observed ones
+            df[part] = df[part].cat.remove_unused_categories()
+        if columns is None and part in df.columns:
+            df = df[_schema_order(name, list(df.columns), part)]
+        return (df if columns is None else df[columns]), src
+    if paths["feather"].exists():
+        import pyarrow.feather as feather
+
+        src = paths["feather"]
+        df = feather.read_table(src, columns=columns, memory_map=True).to_pandas()
+    elif paths["csv"].exists():
+        src = paths["csv"]
+        df = apply_schema(pd.read_csv(src, usecols=columns, float_precision="round_trip"), name)
+    else:
+        raise FileNotFoundError(csv_path)
+    for col, allowed in (filters or {}).items():
+        df = df[df[col].isin(list(allowed))]
+    return df.reset_index(drop=True), src
+
+
+def patch_partitions(df, csv_path, values, fmt="parquet", csv_export=False):
+    """
+    Replace every row whose partition value is in `values` with the rows of `df` (which must
+    only hold those values). On a partitioned Parquet dataset only the touched partition
+    directories are rewritten and a CSV export is patched line by line (_patch_csv); other formats
+    fall back to a read-modify-write of the table.
+    """
+    with trace.span("storage.patch", table=Path(csv_path).stem, partitions=len(values)) as sp:
+        sp.add(rows=len(df))
+        return _patch_partitions(df, csv_path, values, fmt, csv_export)
+
+
+def _patch_partitions(df, csv_path, values, fmt, csv_export):
+    import shutil
+    from urllib.parse import quote
+
+    paths = _paths(csv_path)
+    name = paths["csv"].stem
+    part = PARTITIONS[name]
+    values = [str(v) for v in values]
+    if fmt == "parquet" and paths["dataset"].is_dir():
+        for v in values:
+            shutil.rmtree(paths["dataset"] / f"{part}={quote(v, safe='')}", ignore_errors=True)
+        if not df.empty:
+            apply_schema(df, name).to_parquet(paths["dataset"], index=False, partition_cols=[part],
+                                              basename_template="patch-{i}.parquet")
+        if csv_export and not _patch_csv(df, paths["csv"], part, values):
+            read_table(csv_path).to_csv(paths["csv"], index=False)
+        return paths["dataset"]
+    old = read_table(csv_path)
+    keep = old[~old[part].astype(str).isin(values)]
+    full = pd.concat([keep.astype({part: str}), df.astype({part: str})], ignore_index=True)
+    full = full.sort_values([c for c in (part, "year") if c in full.columns], kind="stable")
+    return write_table(full.reset_index(drop=True), csv_path, fmt, csv_export)
+
+
+def _patch_csv(df, csv_path, part, values):
+    """
+    Replace the rows of partitions `values` in a CSV export whose first column is `part`: untouched
+    lines are copied as bytes (never parsed or re-formatted) and each partition's new rows go where its
+    old block started (at the end when it is new). False when the file cannot be patched that way
+    (missing, another header, quoted keys); the caller then rewrites it from the table.
+    """
+    import os
+
+    p = Path(csv_path)
+    cols = list(df.columns)
+    if not p.exists() or not cols or cols[0] != part:
+        return False
+    blocks = {str(v): g.to_csv(index=False, header=False).encode()
+              for v, g in df.groupby(df[part].astype(str), sort=False)}
+    values = set(values)
+    tmp = p.with_suffix(".csv.tmp")
+    ok = True
+    with open(p, "rb") as src, open(tmp, "wb") as dst:
+        head = src.readline()
+        if head.rstrip(b"\r\n").decode() != ",".join(cols):
+            ok = False
+        else:
+            dst.write(head)
+            for line in src:
+                if line.startswith(b'"'):
+                    ok = False
+                    break
+                key = line.split(b",", 1)[0].decode()
+                if key in values:
+                    dst.write(blocks.pop(key, b""))
+                else:
+                    dst.write(line)
+            for block in blocks.values():
+                dst.write(block)
+    if not ok:
+        tmp.unlink()
+        return False
+    os.replace(tmp, p)
+    return True
+
+
+def table_exists(csv_path):
+    return any(p.exists() for p in _paths(csv_path).values())
+
+
+def table_fingerprint(csv_path):
+    """Size/mtime digest of every file of the table's stores (changes whenever the table is rewritten)."""
+    import hashlib
+
+    h = hashlib.sha256()
+    for p in _paths(csv_path).values():
+        for f in sorted(p.rglob("*")) if p.is_dir() else [p]:
+            if f.is_file():
+                st = f.stat()
+                h.update(f"{f}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()[:16]
@@ -0,0 +1,323 @@
+# src/trace.py
+# Instrumentation for the ETL, model and viz stages: nested timing spans written as JSONL.
+#
+#   from src import trace
+#   with trace.span("compute_M.impute", cols=4):
+#       ...
+#       trace.count(rows=len(df))          # counters on the innermost open span
+#
+# Tracing is off (spans cost one attribute check) until enabled with `--trace [PATH]` on a
+# stage CLI, trace.enable(path) or OSIU_TRACE=<path>. Each finished span is one line:
+#   {"run", "pid", "id", "parent", "name", "start", "seconds", "peak_rss_mb", <attrs>, <counters>}
+# Counters are rows, bytes_read and bytes_written; attrs are whatever the call site passes.
+# peak_rss_mb is the process high-water mark when the span ends (py_peak_mb, the Python heap
+# peak inside the span, is added under --profile mem). Child processes inherit the trace
+# through the environment and append to the same file.
+#
+#   python -m src.trace report [.cache/trace/trace.jsonl] [--run all] [--depth 3]
+# prints the last run as a flame-style table (inclusive/self time per span path).
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+DEFAULT_PATH = ".cache/trace/trace.jsonl"
+COUNTERS = ("rows", "bytes_read", "bytes_written")
+
+_state = {"fh": None, "run": None, "main": None}
+_lock = threading.Lock()
+_local = threading.local()
+_ids = itertools.count(1)
+
+
+def peak_rss_mb():
+    """Process peak resident set size in MiB (None where `resource` is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 2**10, 1)
+
+
+def file_bytes(path):
+    """Size of a file, or of every file under a directory (0 if missing)."""
+    p = Path(path)
+    if p.is_dir():
+        return sum(f.stat().st_size for f in p.rglob("*") if f.is_file())
+    return p.stat().st_size if p.exists() else 0
+
+
+def enable(path=DEFAULT_PATH, run=None):
+    """Start appending spans to `path`; child processes inherit it via OSIU_TRACE / OSIU_TRACE_RUN."""
+    disable()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _state["run"] = run or os.environ.get("OSIU_TRACE_RUN") or time.strftime("%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:6]
+    _state["fh"] = open(path, "a", encoding="utf-8")
+    _state["main"] = _stack()
+    os.environ["OSIU_TRACE"] = str(path)
+    os.environ["OSIU_TRACE_RUN"] = _state["run"]
+    return _state["run"]
+
+
+def disable():
+    if _state["fh"] is not None:
+        _state["fh"].close()
+    _state["fh"] = None
+
+
+def enabled():
+    return _state["fh"] is not None
+
+
+def _stack():
+    st = getattr(_local, "stack", None)
+    if st is None:
+        st = _local.stack = []
+    return st
+
+
+class Span:
+    __slots__ = ("name", "id", "parent", "start", "t0", "fields", "peak")
+
+    def __init__(self, name, parent, fields):
+        self.name, self.parent, self.fields = name, parent, fields
+        self.id = f"{os.getpid()}-{next(_ids)}"
+        self.start, self.t0 = time.time(), time.perf_counter()
+        self.peak = 0
+
+    def add(self, **counters):
+        for k, v in counters.items():
+            if v is not None:
+                self.fields[k] = self.fields.get(k, 0) + v
+
+
+class _Null:
+    def add(self, **counters):
+        pass
+
+
+_NULL = _Null()
+
+
+def _traced_peak():
+    import tracemalloc
+    return tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Time a block as `name`; attrs are recorded as-is. Yields the span (use .add(rows=...))."""
+    if _state["fh"] is None:
+        yield _NULL
+        return
+    import tracemalloc
+
+    stack = _stack()
+    # spans opened on worker threads hang off whatever the main thread has open
+    parent = stack[-1] if stack else (_state["main"][-1] if _state["main"] else None)
+    sp = Span(name, parent.id if parent else None, dict(attrs))
+    tracing = tracemalloc.is_tracing() and stack is _state["main"]
+    if tracing:
+        if parent is not None:
+            parent.peak = max(parent.peak, _traced_peak())
+        tracemalloc.reset_peak()
+    stack.append(sp)
+    try:
+        yield sp
+    finally:
+        stack.pop()
+        event = {"run": _state["run"], "pid": os.getpid(), "id": sp.id, "parent": sp.parent, "name": name,
+                 "start": round(sp.start, 6), "seconds": round(time.perf_counter() - sp.t0, 6),
+                 "peak_rss_mb": peak_rss_mb(), **sp.fields}
+        if tracing:
+            sp.peak = max(sp.peak, _traced_peak())
+            event["py_peak_mb"] = round(sp.peak / 2**20, 1)
+            if parent is not None:
+                parent.peak = max(parent.peak, sp.peak)
+            tracemalloc.reset_peak()
+        line = json.dumps(event, default=str) + "\n"
+        with _lock:
+            if _state["fh"] is not None:
+                _state["fh"].write(line)
+                _state["fh"].flush()
+
+
+def count(**counters):
+    """Add counters (rows, bytes_read, bytes_written, ...) to the innermost open span on this thread."""
+    if _state["fh"] is None:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].add(**counters)
+
+
+if os.environ.get("OSIU_TRACE"):
+    enable(os.environ["OSIU_TRACE"])
+
+
+# --- CLI integration -------------------------------------------------------------------------
+
+def add_arguments(ap):
+    """--trace [PATH] and --profile {cpu,mem,all} for a stage CLI (use with session())."""
+    ap.add_argument("--trace", nargs="?", const=DEFAULT_PATH, default=None, metavar="PATH",
+                    help=f"append timing spans as JSONL (default {DEFAULT_PATH}); summarize with "
+                         "`python -m src.trace report`")
+    ap.add_argument("--profile", choices=["cpu", "mem", "all"], default=None,
+                    help="also capture cProfile (cpu) and/or tracemalloc (mem) output next to the trace")
+
+
+@contextlib.contextmanager
+def profile(kind, out_dir, name):
+    """cProfile and/or tracemalloc around a block; writes <name>-<time>.prof / .mem.txt to out_dir."""
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = str(out_dir / f"{name}-{time.strftime('%Y%m%dT%H%M%S')}")
+    prof = cProfile.Profile() if kind in ("cpu", "all") else None
+    mem = kind in ("mem", "all")
+    if mem:
+        tracemalloc.start(10)
+    if prof:
+        prof.enable()
+    try:
+        yield
+    finally:
+        if prof:
+            prof.disable()
+            prof.dump_stats(stem + ".prof")
+            pstats.Stats(prof).sort_stats("cumulative").print_stats(20)
+            print("Wrote", stem + ".prof")
+        if mem:
+            snap = tracemalloc.take_snapshot()
+            cur, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            lines = [f"traced current {cur / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB (since last span)"]
+            lines += [str(s) for s in snap.statistics("lineno")[:30]]
+            fp = Path(stem + ".mem.txt")
+            fp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            print("Wrote", fp)
+
+
+@contextlib.contextmanager
+def session(args, name, **attrs):
+    """Enable tracing/profiling from add_arguments() flags and wrap the command in a root span."""
+    path = getattr(args, "trace", None) or (DEFAULT_PATH if getattr(args, "profile", None) else None)
+    if path and not enabled():
+        enable(path)
+    with contextlib.ExitStack() as stack:
+        if getattr(args, "profile", None):
+            stack.enter_context(profile(args.profile, Path(path).parent, name))
+        stack.enter_context(span(name, **attrs))
+        yield
+    if path:
+        print(f"Trace: {path} (run {_state['run']}); summarize with `python -m src.trace report {path}`")
+
+
+# --- report ----------------------------------------------------------------------------------
+
+def load(path, run="last"):
+    """Events of one run ("last", a run id, or "all")."""
+    events = [json.loads(line) for line in Path(path).read_text(encoding="utf-8").splitlines() if line.strip()]
+    if run == "all" or not events:
+        return events
+    if run == "last":
+        run = max(events, key=lambda e: e["start"])["run"]
+    return [e for e in events if e["run"] == run]
+
+
+def summarize(events):
+    """
+    Aggregate spans by path (names from the root down): rows of
+    (path, calls, total_s, self_s, counters, peak_rss_mb, py_peak_mb) in flame order
+    (children under their parent, largest first).
+    """
+    by_id = {e["id"]: e for e in events}
+
+    def path(e):
+        out = []
+        while e is not None:
+            out.append(e["name"])
+            e = by_id.get(e["parent"])
+        return tuple(reversed(out))
+
+    nodes = {}
+    child_time = {}
+    for e in events:
+        p = path(e)
+        n = nodes.setdefault(p, {"calls": 0, "total": 0.0, "peak": None, "py_peak": None,
+                                 **{c: 0 for c in COUNTERS}})
+        n["calls"] += 1
+        n["total"] += e["seconds"]
+        for c in COUNTERS:
+            n[c] += e.get(c, 0) or 0
+        for k, f in (("peak", "peak_rss_mb"), ("py_peak", "py_peak_mb")):
+            if e.get(f) is not None:
+                n[k] = max(n[k] or 0, e[f])
+        if e["parent"] in by_id:
+            pp = path(by_id[e["parent"]])
+            child_time[pp] = child_time.get(pp, 0.0) + e["seconds"]
+    for p, n in nodes.items():
+        n["self"] = max(0.0, n["total"] - child_time.get(p, 0.0))
+
+    ordered = []
+
+    def walk(prefix):
+        kids = [p for p in nodes if len(p) == len(prefix) + 1 and p[:len(prefix)] == prefix]
+        for p in sorted(kids, key=lambda p: -nodes[p]["total"]):
+            ordered.append((p, nodes[p]))
+            walk(p)
+
+    walk(())
+    return ordered
+
+
+def _mb(nbytes):
+    return f"{nbytes / 2**20:.1f}" if nbytes else ""
+
+
+def report(path=DEFAULT_PATH, run="last", depth=None, min_pct=0.0):
+    from tabulate import tabulate
+
+    events = load(path, run)
+    if not events:
+        print(f"No spans in {path}")
+        return []
+    ordered = summarize(events)
+    total = sum(n["total"] for p, n in ordered if len(p) == 1) or 1.0
+    rows = []
+    for p, n in ordered:
+        pct = 100.0 * n["total"] / total
+        if (depth and len(p) > depth) or pct < min_pct:
+            continue
+        rows.append(["│ " * (len(p) - 1) + p[-1], n["calls"], f"{n['total']:.3f}", f"{n['self']:.3f}",
+                     f"{pct:5.1f}", "█" * int(round(pct / 4)), n["rows"] or "", _mb(n["bytes_read"]),
+                     _mb(n["bytes_written"]), n["peak"] if n["peak"] is not None else "",
+                     n["py_peak"] if n["py_peak"] is not None else ""])
+    runs = sorted({e["run"] for e in events})
+    print(f"{path}: {len(events)} spans, run {runs[0] if len(runs) == 1 else f'{len(runs)} runs'}")
+    print(tabulate(rows, headers=["span", "calls", "total s", "self s", "%", "", "rows", "MB read",
+                                  "MB written", "peak RSS MB", "py peak MB"], disable_numparse=True))
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(prog="python -m src.trace")
+    sub = ap.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("report", help="summarize a trace as a flame-style table")
+    r.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    r.add_argument("--run", default="last", help='run id, "last" (default) or "all"')
+    r.add_argument("--depth", type=int, default=None, help="hide spans nested deeper than this")
+    r.add_argument("--min-pct", type=float, default=0.0, help="hide spans below this share of the total")
+    args = ap.parse_args()
+    report(args.path, args.run, args.depth, args.min_pct)
@@ -0,0 +1,225 @@
+# src/validation/proxy_diagnostics.py
+# Proxy agreement and variance-share diagnostics per latent (promoted from validation/bias_detection.ipynb):
+#   Spearman correlation between a latent's indicators and each indicator's share of their summed variance
+# over the (region, year) cells where all of them are observed, for three groupings:
+#   pooled  - every region-year (the notebook's test)
+#   region  - each region over all its years
+#   window  - each region over rolling `window`-year spans of the annual grid
+# Every grouping is one (groups, rows, indicators) tensor cut from the memory-mapped indicator panel
+# (region and window groups are strided views of it). Ranks are taken once per grouping with one batched
+# sort, and all groups' correlation matrices and variances come from a few einsums over the tensor, in
+# chunks of groups bounded by `max_mb`.
+#
+#   proxy_diagnostics:
+#     window: 10            # years per rolling window
+#     min_obs: 5            # complete rows a group needs
+#     corr_threshold: 0.5   # flag a pair with |Spearman| below this
+#     share_threshold: 0.6  # flag an indicator with more than this share of the variance
+#
+# Writes results/proxy_flags.csv (one row per group: n, min/mean |corr|, dominant indicator and its
+# share, flags), results/proxy_corr.csv (per group and indicator pair) and results/proxy_shares.csv
+# (per group and indicator), and, as before, the pooled sigma results to validation/proxy_corr.csv,
+# validation/proxy_entropy_share.csv and validation/proxy_flags.txt.
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from src import trace
+from src.model.panel import indicator_panel
+from src.storage import table_exists
+
+RESULTS = Path("results")
+DEFAULTS = {"latents": None, "window": 10, "step": 1, "min_obs": 5, "corr_threshold": 0.5,
+            "share_threshold": 0.6, "max_mb": 64}
+KEYS = ["latent", "scope", "region", "start", "end"]
+COLUMNS = (KEYS + ["n", "min_abs_corr", "mean_abs_corr", "top_id", "top_share", "low_agreement", "dominant_variance",
+                   "flags"],
+           KEYS + ["id_a", "id_b", "corr"],
+           KEYS + ["id", "var", "share"])
+
+
+def rank(X, valid):
+    """
+    Ranks (1..n, ties averaged) of each column of X (groups, rows, columns) among the group's valid
+    rows, as scipy.stats.rankdata would give per group; invalid rows get ranks above n.
+    """
+    a = np.where(valid[..., None], X, np.inf)
+    order = np.argsort(a, axis=1, kind="stable")
+    s = np.take_along_axis(a, order, axis=1)
+    pos = np.broadcast_to(np.arange(a.shape[1])[None, :, None], a.shape)
+    first = np.ones(a.shape, dtype=bool)
+    first[:, 1:] = s[:, 1:] != s[:, :-1]
+    last = np.ones(a.shape, dtype=bool)
+    last[:, :-1] = first[:, 1:]
+    # each run of tied values spans [start, end]; every member gets the mean rank
+    start = np.maximum.accumulate(np.where(first, pos, 0), axis=1)
+    end = np.minimum.accumulate(np.where(last, pos, a.shape[1])[:, ::-1], axis=1)[:, ::-1]
+    out = np.empty(a.shape)
+    np.put_along_axis(out, order, (start + end) / 2 + 1, axis=1)
+    return out
+
+
+def _moments(X, valid, n):
+    """Per group: centered cross-products (groups, k, k) over the valid rows."""
+    w = valid[..., None]
+    mean = np.where(w, X, 0).sum(axis=1) / np.maximum(n, 1)[:, None]
+    d = np.where(w, X - mean[:, None, :], 0)
+    return np.einsum("gnk,gnl->gkl", d, d)
+
+
+def group_stats(X, min_obs=5):
+    """
+    Spearman matrices (groups, k, k), variances (groups, k, ddof=1) and variance shares of each group
+    of X (groups, rows, k) over its complete rows; groups with fewer than min_obs of them are NaN.
+    """
+    valid = ~np.isnan(X).any(axis=-1)
+    n = valid.sum(axis=1)
+    C = _moments(rank(X, valid), valid, n)
+    sd = np.sqrt(np.einsum("gkk->gk", C))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = C / (sd[:, :, None] * sd[:, None, :])
+        var = np.einsum("gkk->gk", _moments(X, valid, n)) / (n - 1)[:, None]
+        share = var / var.sum(axis=1, keepdims=True)
+    few = n < max(min_obs, 2)
+    corr[few], var[few], share[few] = np.nan, np.nan, np.nan
+    return n, corr, var, share
+
+
+def groupings(V, years, window=10, step=1):
+    """(scope, (groups, rows, k) tensor, region index per group, first year index per group, span) per grouping."""
+    R, T, K = V.shape
+    yield "pooled", V.reshape(1, R * T, K), np.array([-1]), np.array([0]), T
+    yield "region", V, np.arange(R), np.zeros(R, dtype=np.int64), T
+    if 0 < window <= T:
+        # (R, windows, K, window) strided view -> (R * windows, window, K)
+        W = np.lib.stride_tricks.sliding_window_view(V, window, axis=1)[:, ::step]
+        nW = W.shape[1]
+        yield ("window", np.moveaxis(W, -1, 2).reshape(R * nW, window, K),
+               np.repeat(np.arange(R), nW), np.tile(np.arange(nW) * step, R), window)
+
+
+def diagnose(V, ids, regions, years, window=10, step=1, min_obs=5, corr_threshold=0.5, share_threshold=0.6,
+             max_mb=64):
+    """
+    Diagnostics of one latent's indicators V (regions, years, k >= 2): (flags, corr, shares) frames keyed
+    by scope, region, start and end year; groups with fewer than min_obs complete rows are left out.
+    """
+    K = len(ids)
+    ids = np.asarray(ids, dtype=object)
+    regions = np.append(np.asarray(regions, dtype=object), "ALL")  # region -1 (pooled) picks "ALL"
+    a, b = np.triu_indices(K, 1)
+    flags, corrs, shares = [], [], []
+    for scope, X, reg, start, span in groupings(V, years, window, step):
+        G, n_rows = X.shape[:2]
+        # ranks, sort order and centered copies: about six float64 copies of a chunk
+        chunk = int(max(1, max_mb * 2**20 // (6 * 8 * n_rows * K)))
+        with trace.span("proxy_diagnostics.scope", scope=scope, groups=G, rows=n_rows, indicators=K):
+            parts = [group_stats(np.asarray(X[g:g + chunk], dtype=float), min_obs) for g in range(0, G, chunk)]
+        n, corr, var, share = (np.concatenate(p) for p in zip(*parts))
+        ok = np.flatnonzero(n >= max(min_obs, 2))
+        m = len(ok)
+        keys = pd.DataFrame({"scope": scope, "region": regions[reg[ok]], "start": years[start[ok]],
+                             "end": years[start[ok]] + span - 1})
+
+        pair = np.abs(corr[ok][:, a, b])  # (groups, pairs); NaN for a constant indicator
+        share = share[ok]
+        top = np.argmax(np.nan_to_num(share, nan=-1.0), axis=1)
+        top_share = share[np.arange(m), top]
+        with np.errstate(invalid="ignore"):
+            low = (pair < corr_threshold).any(axis=1)
+            dominant = top_share > share_threshold
+        seen = (~np.isnan(pair)).sum(axis=1)
+        f = keys.assign(n=n[ok], min_abs_corr=np.fmin.reduce(pair, axis=1),
+                        mean_abs_corr=np.where(seen > 0, np.nansum(pair, axis=1) / np.maximum(seen, 1), np.nan),
+                        top_id=ids[top], top_share=top_share, low_agreement=low, dominant_variance=dominant)
+        f["flags"] = np.where(low & dominant, "low_agreement;dominant_variance",
+                              np.where(low, "low_agreement", np.where(dominant, "dominant_variance", "")))
+        flags.append(f)
+        corrs.append(keys.loc[keys.index.repeat(len(a))].reset_index(drop=True).assign(
+            id_a=np.tile(ids[a], m), id_b=np.tile(ids[b], m), corr=corr[ok][:, a, b].ravel()))
+        shares.append(keys.loc[keys.index.repeat(K)].reset_index(drop=True).assign(
+            id=np.tile(ids, m), var=var[ok].ravel(), share=share.ravel()))
+    return (pd.concat(flags, ignore_index=True), pd.concat(corrs, ignore_index=True),
+            pd.concat(shares, ignore_index=True))
+
+
+def proxy_diagnostics(panel, latents, **spec):
+    """diagnose() for every latent {name: indicator ids} with at least two ids; frames gain a latent column."""
+    regions, years = list(panel.index.regions), panel.index.years
+    out = [[], [], []]
+    for latent, ids in latents.items():
+        if len(ids) < 2:
+            continue
+        missing = [i for i in ids if i not in panel.ids]
+        if missing:
+            print(f"WARN: {latent}: indicators not in the normalized table: {', '.join(missing)}")
+        with trace.span("proxy_diagnostics.latent", latent=latent, indicators=len(ids)):
+            for acc, frame in zip(out, diagnose(panel.view(ids), ids, regions, years, **spec)):
+                acc.append(frame.assign(latent=latent))
+    return tuple(pd.concat(acc, ignore_index=True)[cols] if acc else pd.DataFrame(columns=cols)
+                 for acc, cols in zip(out, COLUMNS))
+
+
+def _pooled_sigma(frame):
+    return frame[(frame["latent"] == "sigma") & (frame["scope"] == "pooled")]
+
+
+def _write_legacy(flags, corr, shares, ids, spec):
+    """validation/proxy_corr.csv, proxy_entropy_share.csv and proxy_flags.txt of the pooled sigma group."""
+    out = Path("validation")
+    out.mkdir(exist_ok=True)
+    c = _pooled_sigma(corr)
+    M = pd.DataFrame(np.eye(len(ids)), index=ids, columns=ids)
+    for a, b, v in zip(c["id_a"], c["id_b"], c["corr"]):
+        M.loc[a, b] = M.loc[b, a] = v
+    M.to_csv(out / "proxy_corr.csv", index=False)
+    s = _pooled_sigma(shares).set_index("id")["share"]
+    s.rename(None).rename_axis(None).sort_values(ascending=False).to_csv(out / "proxy_entropy_share.csv")
+    lines = []
+    f = _pooled_sigma(flags)
+    if len(f) and f["low_agreement"].iloc[0]:
+        lines.append(f"Low inter-proxy agreement (<{spec['corr_threshold']}).")
+    if len(f) and f["dominant_variance"].iloc[0]:
+        lines.append(f"Dominant proxy variance (>{spec['share_threshold']:.0%}).")
+    (out / "proxy_flags.txt").write_text("\n".join(lines or ["No flags."]), encoding="utf-8")
+    return [out / "proxy_corr.csv", out / "proxy_entropy_share.csv", out / "proxy_flags.txt"]
+
+
+def main(config_path: str, window: int | None = None, latents=None):
+    cfg = yaml.safe_load(Path(config_path).read_text())
+    spec = {**DEFAULTS, **(cfg.get("proxy_diagnostics") or {})}
+    spec.update({k: v for k, v in {"window": window, "latents": latents}.items() if v is not None})
+    table = Path(cfg["output"]["interim_dir"]) / "indicators_normalized.csv"
+    if not table_exists(table):
+        raise SystemExit(f"Missing {table}. Run fit_latents first.")
+    ids = {lat: [i["id"] for i in cfg["latents"][lat]["indicators"]]
+           for lat in (spec["latents"] or cfg["latents"])}
+
+    panel = indicator_panel(table)
+    flags, corr, shares = proxy_diagnostics(panel, ids, **{k: v for k, v in spec.items() if k != "latents"})
+    RESULTS.mkdir(exist_ok=True)
+    flags.to_csv(RESULTS / "proxy_flags.csv", index=False)
+    corr.to_csv(RESULTS / "proxy_corr.csv", index=False)
+    shares.to_csv(RESULTS / "proxy_shares.csv", index=False)
+    written = [RESULTS / "proxy_flags.csv", RESULTS / "proxy_corr.csv", RESULTS / "proxy_shares.csv"]
+    if len(ids.get("sigma", [])) > 1:
+        written += _write_legacy(flags, corr, shares, ids["sigma"], spec)
+    for fp in written:
+        print("Wrote", fp)
+    for (latent, scope), g in flags.groupby(["latent", "scope"], sort=False):
+        print(f"{latent} {scope}: {len(g)} groups, low agreement {int(g['low_agreement'].sum())}, "
+              f"dominant variance {int(g['dominant_variance'].sum())}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", required=True)
+    ap.add_argument("--window", type=int, default=None, help="years per rolling window (default: proxy_diagnostics.window)")
+    ap.add_argument("--latents", nargs="+", default=None, help="latents to diagnose (default: all with 2+ indicators)")
+    trace.add_arguments(ap)
+    args = ap.parse_args()
+    with trace.session(args, "proxy_diagnostics"):
+        main(args.config, args.window, args.latents)
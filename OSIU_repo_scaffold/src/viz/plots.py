@@ -1,9 +1,11 @@
-import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 from pathlib import Path
 import textwrap
 
+from src import trace
+from src.storage import read_table
+
 # === Utility ===
 def _save_caption(path: str, text: str):
     """Save a plain-text caption file next to a figure."""
@@ -65,94 +67,361 @@ Notes
 These expectations follow the v0.8 FEP-constrained moral-informational model. They are descriptive
 guides, not pass/fail tests; use them to triage data issues and refine proxy mappings.
 """
-    (outdir / "theory_expectations.txt").write_text(msg, encoding="utf-8")
+    fp = outdir / "theory_expectations.txt"
+    # static text: only (re)written when missing or different
+    if not fp.exists() or fp.read_text(encoding="utf-8") != msg:
+        fp.write_text(msg, encoding="utf-8")
 
 # === Latent Variable Time Series ===
-def plot_timeseries(latents_csv: str):
-    df = pd.read_csv(latents_csv)
-    outdir = Path("results/figures")
-    outdir.mkdir(parents=True, exist_ok=True)
-    _write_theory_expectations()
+FIGURES = Path("results/figures")
+DPI = 300
+DRAFT_DPI = 72
+MAX_LEGEND = 20  # regions listed in a time-series legend; larger panels skip it
+# Input hash of every rendered figure (render_all skips figures whose hash is unchanged)
+HASHES = Path(".cache/plots/hashes.json")
 
-    captions = {
-        "kappa": (
-            "Figure: κ (Kappa) – Governance/cooperative coherence. Higher values indicate stronger "
-            "coordination, stability, and ethical alignment; an approximation to informational order."
-        ),
-        "sigma": (
-            "Figure: σ (Sigma) – Systemic suffering load (moral entropy). Higher values indicate greater "
-            "disorder/instability. Inverse of coherence."
-        ),
-        "rho": (
-            "Figure: ρ (Rho) – Structural resilience and lawful regularity. Higher values indicate durable, "
-            "consistent normative and institutional structure."
-        ),
-        "phi": (
-            "Figure: φ (Phi) – Pluralism/adaptive diversity capacity. Higher values indicate moral "
-            "responsiveness and inclusion across perspectives."
-        ),
-    }
+CAPTIONS = {
+    "kappa": (
+        "Figure: κ (Kappa) – Governance/cooperative coherence. Higher values indicate stronger "
+        "coordination, stability, and ethical alignment; an approximation to informational order."
+    ),
+    "sigma": (
+        "Figure: σ (Sigma) – Systemic suffering load (moral entropy). Higher values indicate greater "
+        "disorder/instability. Inverse of coherence."
+    ),
+    "rho": (
+        "Figure: ρ (Rho) – Structural resilience and lawful regularity. Higher values indicate durable, "
+        "consistent normative and institutional structure."
+    ),
+    "phi": (
+        "Figure: φ (Phi) – Pluralism/adaptive diversity capacity. Higher values indicate moral "
+        "responsiveness and inclusion across perspectives."
+    ),
+}
+HEATMAP_CAPTION = (
+    "Figure: M(t) – Composite moral–informational gradient from {κ, σ, ρ, φ}. "
+    "Lighter tones indicate higher ethical stability and informational coherence; "
+    "darker tones indicate entropy/stress. Computed on normalized, weighted latents."
+)
 
-    for var in ["kappa", "sigma", "rho", "phi"]:
-        if var not in df.columns:
-            continue
+def _region_segments(df, var):
+    """
+    Polylines of `var` over year, one per run of consecutive non-NaN rows of a region
+    (plt.plot breaks lines at NaN the same way). Returns (segments, region code per
+    segment, region labels) with regions in groupby order.
+    """
+    d = df[["region", "year", var]].copy()
+    d["region"] = d["region"].astype(str)
+    d = d.sort_values("region", kind="stable")
+    codes, regions = pd.factorize(d["region"], sort=True)
+    x = d["year"].to_numpy(dtype=float)
+    y = d[var].to_numpy(dtype=float)
+    idx = np.flatnonzero(~np.isnan(y))
+    if not len(idx):
+        return [], np.array([], dtype=int), list(regions)
+    brk = np.flatnonzero((np.diff(idx) != 1) | (np.diff(codes[idx]) != 0)) + 1
+    pts = np.column_stack([x[idx], y[idx]])
+    return np.split(pts, brk), codes[idx[np.r_[0, brk]]], list(regions)
 
-        plt.figure(figsize=(8, 4))
-        for region, g in df.groupby("region"):
-            plt.plot(g["year"], g[var], label=region, linewidth=1.8)
-        plt.legend(loc="upper left", fontsize=8)
-        plt.title(f"Temporal Evolution of {var.upper()}")
-        plt.xlabel("Year")
-        plt.ylabel("Normalized Value")
-
-        # caption footer
-        plt.figtext(
-            0.5, -0.08, captions[var], wrap=True, ha="center", va="top",
-            fontsize=8.5, style="italic",
-        )
-
-        plt.tight_layout()
-        fname = outdir / f"latents_timeseries_{var}.png"
-        plt.savefig(fname, dpi=300, bbox_inches="tight")
-        plt.close()
-        _save_caption(fname, captions[var])
-        _append_interpretation(fname, var)
+def _draw_timeseries(df, var, fname, dpi=DPI):
+    """One latent for every region as a single LineCollection (one draw call instead of one per region)."""
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    from matplotlib.lines import Line2D
 
-# === Moral Gradient Heatmap ===
-def plot_M_heatmap(M_csv: str):
-    df = pd.read_csv(M_csv)
-    if df["M"].isna().all():
-        print("All M values are NaN (nothing to plot). Check inputs.")
-        return
+    segs, seg_region, regions = _region_segments(df, var)
+    cycle = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+    fig, ax = plt.subplots(figsize=(8, 4))
+    ax.add_collection(LineCollection(segs, colors=[cycle[c % len(cycle)] for c in seg_region], linewidths=1.8))
+    ax.autoscale_view()
+    if len(regions) <= MAX_LEGEND:
+        handles = [Line2D([], [], color=cycle[i % len(cycle)], linewidth=1.8, label=r) for i, r in enumerate(regions)]
+        ax.legend(handles=handles, loc="upper left", fontsize=8)
+    ax.set_title(f"Temporal Evolution of {var.upper()}")
+    ax.set_xlabel("Year")
+    ax.set_ylabel("Normalized Value")
 
-    outdir = Path("results/figures")
-    outdir.mkdir(parents=True, exist_ok=True)
+    # caption footer
+    fig.text(
+        0.5, -0.08, CAPTIONS[var], wrap=True, ha="center", va="top",
+        fontsize=8.5, style="italic",
+    )
+
+    fig.tight_layout()
+    fig.savefig(fname, dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    _save_caption(fname, CAPTIONS[var])
+    _append_interpretation(fname, var)
+    return fname
+
+def plot_timeseries(latents_csv: str, variables=None, dpi=DPI, fmt="png"):
+    df = read_table(latents_csv)
+    FIGURES.mkdir(parents=True, exist_ok=True)
     _write_theory_expectations()
+    written = []
+    for var in variables or ["kappa", "sigma", "rho", "phi"]:
+        if var not in df.columns:
+            continue
+        fname = FIGURES / f"latents_timeseries_{var}.{fmt}"
+        with trace.span("plots.timeseries", var=var, rows=len(df)) as sp:
+            written.append(_draw_timeseries(df, var, fname, dpi))
+            sp.add(bytes_written=trace.file_bytes(fname))
+    return written
+
+# === Moral Gradient Heatmap ===
+def _draw_heatmap(df, fname, dpi=DPI):
+    import matplotlib.pyplot as plt
 
     pivot = df.pivot(index="region", columns="year", values="M")
-    plt.figure(figsize=(8, 4))
+    fig = plt.figure(figsize=(8, 4))
     im = plt.imshow(pivot, aspect="auto", cmap="magma", origin="lower")
     plt.colorbar(im, label="Moral Gradient M(t)")
     plt.xticks(range(len(pivot.columns)), pivot.columns, rotation=45)
     plt.yticks(range(len(pivot.index)), pivot.index)
     plt.title("Moral Gradient Heatmap (M(t))")
 
-    caption_text = (
-        "Figure: M(t) – Composite moral–informational gradient from {κ, σ, ρ, φ}. "
-        "Lighter tones indicate higher ethical stability and informational coherence; "
-        "darker tones indicate entropy/stress. Computed on normalized, weighted latents."
-    )
-
     plt.figtext(
-        0.5, -0.10, caption_text, wrap=True, ha="center", va="top",
+        0.5, -0.10, HEATMAP_CAPTION, wrap=True, ha="center", va="top",
         fontsize=8.5, style="italic",
     )
 
     plt.tight_layout()
-    fname = outdir / "M_heatmap.png"
-    plt.savefig(fname, dpi=300, bbox_inches="tight")
-    plt.close()
-    _save_caption(fname, caption_text)
+    plt.savefig(fname, dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    _save_caption(fname, HEATMAP_CAPTION)
     _append_interpretation(fname, "M")
+    return fname
+
+def plot_M_heatmap(M_csv: str, dpi=DPI, fmt="png"):
+    df = read_table(M_csv, columns=["region", "year", "M"])
+    if df["M"].isna().all():
+        print("All M values are NaN (nothing to plot). Check inputs.")
+        return
 
+    FIGURES.mkdir(parents=True, exist_ok=True)
+    _write_theory_expectations()
+    fname = FIGURES / f"M_heatmap.{fmt}"
+    with trace.span("plots.M_heatmap") as sp:
+        _draw_heatmap(df, fname, dpi)
+        sp.add(bytes_written=trace.file_bytes(fname))
     print(f"Wrote heatmap with caption to {fname}")
+    return fname
+
+# === Batch rendering ===
+def _render(task):
+    """Worker entry: draw one figure (worker processes switch to the non-interactive Agg backend)."""
+    import multiprocessing
+
+    if multiprocessing.parent_process() is not None:
+        import matplotlib
+        matplotlib.use("Agg")
+    kind, name, df, fname, dpi = task
+    with trace.span(f"plots.{kind}", figure=name, rows=len(df)) as sp:
+        if kind == "timeseries":
+            _draw_timeseries(df, name.rsplit("_", 1)[1], fname, dpi)
+        else:
+            _draw_heatmap(df, fname, dpi)
+        sp.add(bytes_written=trace.file_bytes(fname))
+    return str(fname)
+
+def _input_hash(df, options):
+    import hashlib
+
+    h = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    h.update(repr((list(df.columns), options)).encode())
+    h.update(Path(__file__).read_bytes())
+    return h.hexdigest()[:16]
+
+def render_all(latents_csv: str, M_csv: str, workers=1, draft=False, fmt="png", force=False, variables=None):
+    """
+    Render the latent time series and the M heatmap, skipping every figure whose input data
+    (and render options) hash is unchanged and whose file still exists. Figures are independent,
+    so the rest are drawn in parallel worker processes (workers=0: all cores). draft=True renders
+    at DRAFT_DPI; fmt="svg" writes vector files. Returns (rendered, total).
+    """
+    from src.model.parallel import run_tasks
+    import json
+
+    dpi = DRAFT_DPI if draft else DPI
+    FIGURES.mkdir(parents=True, exist_ok=True)
+    _write_theory_expectations()
+    lat = read_table(latents_csv)
+    figures = {}
+    for var in variables or ["kappa", "sigma", "rho", "phi"]:
+        if var in lat.columns:
+            figures[f"latents_timeseries_{var}"] = ("timeseries", lat[["region", "year", var]])
+    M = read_table(M_csv, columns=["region", "year", "M"])
+    if not M["M"].isna().all():
+        figures["M_heatmap"] = ("heatmap", M)
+
+    hashes = json.loads(HASHES.read_text(encoding="utf-8")) if HASHES.exists() else {}
+    tasks, keys = [], {}
+    for name, (kind, df) in figures.items():
+        fname = FIGURES / f"{name}.{fmt}"
+        keys[fname.name] = _input_hash(df, dpi)
+        if not force and hashes.get(fname.name) == keys[fname.name] and fname.exists():
+            continue
+        tasks.append((kind, name, df, fname, dpi))
+    for fp in run_tasks(_render, tasks, workers=workers):
+        print("Wrote", fp)
+    hashes.update({t[3].name: keys[t[3].name] for t in tasks})
+    HASHES.parent.mkdir(parents=True, exist_ok=True)
+    HASHES.write_text(json.dumps(hashes, indent=2), encoding="utf-8")
+    return len(tasks), len(figures)
+
+# === Parameter Sweep Summaries ===
+def plot_sweep(sweep_dir: str, out_png: str | None = None, caption: str | None = None, max_panels: int = 16):
+    """
+    Plot a finished src.model.sweep run from its Parquet output (no simulation here).
+    Small sweeps with stored trajectories get one panel per design point (with ensemble
+    statistics instead: the mean and outer quantile band over replicates); otherwise
+    the per-point summary (final normalized M, averaged over replicates) is drawn
+    against the first one or two varied parameters.
+    """
+    import json
+    import matplotlib.pyplot as plt
+
+    sweep_dir = Path(sweep_dir)
+    meta = json.loads((sweep_dir / "_spec.json").read_text(encoding="utf-8"))
+    spec = meta["spec"]
+    names = list(spec.get("vary", {}) or {})
+    outdir = Path("results/figures")
+    outdir.mkdir(parents=True, exist_ok=True)
+    fp = Path(out_png) if out_png else outdir / f"sweep_{spec.get('name', 'sweep')}.png"
+
+    summary = pd.read_parquet(sweep_dir / "summary", columns=["point", "replicate", "M_final_norm"] + names)
+    points = summary[summary["replicate"] == 0].sort_values("point").reset_index(drop=True)
+    traj_dir = sweep_dir / "trajectories"
+    ens_fp = sweep_dir / "ensemble.parquet"
+    # only a table written for this spec (ensemble on) counts
+    has_ens = bool(spec.get("ensemble")) and ens_fp.exists()
+
+    if (traj_dir.exists() or has_ens) and len(points) <= max_panels:
+        if traj_dir.exists():
+            traj = pd.read_parquet(traj_dir, columns=["point", "replicate", "t", "M_norm", "parent_M_norm"])
+            traj = traj[traj["replicate"] == 0]
+        else:
+            traj = pd.read_parquet(ens_fp).rename(columns={"mean_norm": "M_norm"})
+            band = sorted(c for c in traj.columns if c.startswith("q") and c.endswith("_norm"))
+        nrows = points[names[0]].nunique() if names else 1
+        ncols = -(-len(points) // nrows)
+        fig, axes = plt.subplots(nrows, ncols, figsize=(6 * ncols, 4.5 * nrows), sharex=True, sharey=True,
+                                 squeeze=False)
+        plt.subplots_adjust(hspace=0.28, wspace=0.15)
+        for k, row in points.iterrows():
+            i, j = divmod(k, ncols)
+            ax = axes[i, j]
+            g = traj[traj["point"] == row["point"]].sort_values("t")
+            if traj_dir.exists():
+                ax.plot(g["t"], g["M_norm"], label="Balanced Child M(t)", color="tab:green")
+            else:
+                ax.plot(g["t"], g["M_norm"], label="Balanced Child M(t) (ensemble mean)", color="tab:green")
+                if len(band) >= 2:
+                    ax.fill_between(g["t"], g[band[0]], g[band[-1]], color="tab:green", alpha=0.2,
+                                    label=f"{int(band[0][1:3])}–{int(band[-1][1:3])}% of replicates")
+            ax.axhline(g["parent_M_norm"].iloc[0], color="k", linestyle="--", label="Parent M(t) (norm)")
+            ax.set_title(", ".join(f"{n}={row[n]:g}" if not isinstance(row[n], str) else f"{n}={row[n]}"
+                                   for n in names))
+            ax.grid(True)
+            if i == nrows - 1: ax.set_xlabel("Time")
+            if j == 0: ax.set_ylabel("Normalized M(t) [0,1]")
+        handles, labels = axes[0, 0].get_legend_handles_labels()
+        fig.legend(handles, labels, loc="lower center", ncol=2, bbox_to_anchor=(0.5, -0.02))
+        fig.suptitle("Parameter Sweep → M(t) Behavior", y=1.02, fontsize=14)
+    else:
+        agg = summary.groupby("point", as_index=False).agg({"M_final_norm": "mean", **{n: "first" for n in names}})
+        plt.figure(figsize=(8, 6))
+        if len(names) >= 2:
+            sc = plt.scatter(agg[names[0]], agg[names[1]], c=agg["M_final_norm"], cmap="magma", s=8)
+            plt.colorbar(sc, label="Final normalized M(t)")
+            plt.xlabel(names[0])
+            plt.ylabel(names[1])
+        elif names:
+            agg = agg.sort_values(names[0])
+            plt.plot(agg[names[0]], agg["M_final_norm"], color="tab:green")
+            plt.xlabel(names[0])
+            plt.ylabel("Final normalized M(t)")
+        plt.title(f"Parameter Sweep ({spec.get('design', 'grid')}, {len(agg)} points)")
+        plt.grid(True)
+
+    plt.tight_layout()
+    plt.savefig(fp, dpi=300, bbox_inches="tight")
+    plt.close()
+    _save_caption(fp, caption or (
+        f"Figure: Parameter sweep '{spec.get('name', 'sweep')}' over {', '.join(names) or 'fixed parameters'} "
+        "showing normalized M(t) relative to the parent baseline."
+    ))
+    print(f"Wrote {fp} and {fp.with_suffix('.txt')}")
+    return fp
+
+def plot_lineage(lineage_dir: str, out_png: str | None = None):
+    """
+    Plot a src.model.lineage run: per-generation mean M(t) with its outer quantile band, generations
+    laid end to end (each starts where its parents stopped), and the mean final M of each generation by
+    child slot. Everything is normalized by the lineage's overall M extrema.
+    """
+    import matplotlib.pyplot as plt
+
+    lineage_dir = Path(lineage_dir)
+    gens = pd.read_parquet(lineage_dir / "generations.parquet")
+    nodes = pd.read_parquet(lineage_dir / "nodes.parquet", columns=["generation", "slot", "M_final"])
+    lo, hi = gens["min"].min(), gens["max"].max()
+
+    def norm(v):
+        return (v - lo) / (hi - lo + 1e-12)
+
+    band = sorted(c for c in gens.columns if c.startswith("q"))
+    T = int(gens["t"].max()) + 1
+    G = int(gens["generation"].max()) + 1
+
+    fig, (ax, ax_slot) = plt.subplots(2, 1, figsize=(12, 9), gridspec_kw={"height_ratios": [2, 1]})
+    x = gens["generation"] * T + gens["t"]
+    ax.plot(x, norm(gens["mean"]), color="tab:green", label="Mean M(t) over the generation")
+    if len(band) >= 2:
+        ax.fill_between(x, norm(gens[band[0]]), norm(gens[band[-1]]), color="tab:green", alpha=0.2,
+                        label=f"{int(band[0][1:3])}–{int(band[-1][1:3])}% of universes")
+    for g in range(1, G):
+        ax.axvline(g * T - 0.5, color="gray", linestyle=":", linewidth=0.8)
+    ax.set_xlabel(f"Time steps (generations of {T} laid end to end)")
+    ax.set_ylabel("Normalized M(t) [0,1]")
+    ax.set_title(f"Lineage: {G} generations, {len(nodes)} universes")
+    ax.legend(loc="best")
+    ax.grid(True)
+
+    by_slot = nodes[nodes["slot"] >= 0].groupby(["slot", "generation"])["M_final"].mean()
+    for slot, s in by_slot.groupby(level="slot"):
+        ax_slot.plot(s.index.get_level_values("generation"), norm(s.to_numpy()), marker="o", label=f"Child slot {slot}")
+    ax_slot.set_xlabel("Generation")
+    ax_slot.set_ylabel("Mean final M (norm)")
+    ax_slot.legend(loc="best")
+    ax_slot.grid(True)
+
+    plt.tight_layout()
+    fp = Path(out_png) if out_png else FIGURES / f"lineage_{lineage_dir.name}.png"
+    fp.parent.mkdir(parents=True, exist_ok=True)
+    plt.savefig(fp, dpi=300, bbox_inches="tight")
+    plt.close()
+    _save_caption(fp, (
+        f"Figure: Lineage '{lineage_dir.name}' over {G} generations. Top: mean normalized M(t) of each "
+        "generation with its quantile band; dotted lines mark spawn points, where children start from their "
+        "parents' final state. Bottom: mean final M of each generation by child slot (the spec's `children` order)."
+    ))
+    print(f"Wrote {fp} and {fp.with_suffix('.txt')}")
+    return fp
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latents", default="data/processed/latents.csv")
+    ap.add_argument("--M", default="data/processed/M_timeseries.csv")
+    ap.add_argument("--workers", type=int, default=0, help="render processes (0 = all cores, 1 = in-process)")
+    ap.add_argument("--draft", action="store_true", help=f"low-resolution ({DRAFT_DPI} dpi) renders for iteration")
+    ap.add_argument("--format", choices=["png", "svg"], default="png")
+    ap.add_argument("--force", action="store_true", help="re-render figures whose inputs are unchanged")
+    trace.add_arguments(ap)
+    args = ap.parse_args()
+    with trace.session(args, "plots"):
+        n, total = render_all(args.latents, args.M, workers=args.workers, draft=args.draft, fmt=args.format,
+                              force=args.force)
+    print(f"Rendered {n} of {total} figures ({total - n} unchanged)")